@@ -81,6 +81,8 @@ class Teacher(cfg.ConfigUtils, QstatusDefs):
             self.m_timeout_handle = None
         self.q_status = self.QSTATUS_NO
         soundcard.synth.stop()
+        if self.m_statistics:
+            solfege.db.flush()
     
     def exit_test_mode(self):
         """
@@ -146,6 +148,42 @@ class MelodicIntervalTeacher(Teacher):
         Teacher.__init__(self, exname)
         self.m_tonika = None
         self.m_question = []
+        self.m_question_space = None
+        self.m_question_space_range = None
+        for name in ('number_of_intervals', 'lock-to-key',
+                     'lock-to-key-note', 'lock-to-key-scaletype'):
+            self.add_watch(name, self.forget_question_space)
+        for x in range(self.get_int('maximum_number_of_intervals')):
+            self.add_watch('ask_for_intervals_%i' % x,
+                           self.forget_question_space)
+    
+    def forget_question_space(self, *v):
+        self.m_question_space = None
+    
+    def get_question_space(self, L, H):
+        """
+        Return the utils.IntervalQuestionSpace for the current
+        configuration of the exercise and the range L to H. It is
+        created again when the configuration changes.
+        """
+        if self.m_question_space is None \
+                or self.m_question_space_range != (L, H):
+            interval_lists = [self.get_list('ask_for_intervals_%i' % x)
+                for x in range(max(self.get_int('number_of_intervals=1'), 1))]
+            if self.get_bool("lock-to-key"):
+                # We don't have to check the validity of these two
+                # variables because get_int will check that a int value
+                # is stored in the database (and make it an int if it is
+                # not), and nComboBox will make sure the int value is
+                # within the correct limits.
+                key = (mpd.MusicalPitch.new_from_int(self.get_int("lock-to-key-note")),
+                       utils.key_data.keys()[:][self.get_int("lock-to-key-scaletype")])
+            else:
+                key = None
+            self.m_question_space = utils.IntervalQuestionSpace(L, H,
+                interval_lists, key)
+            self.m_question_space_range = (L, H)
+        return self.m_question_space
     
     def new_question(self, L, H):
         assert isinstance(L, basestring)
@@ -184,69 +222,24 @@ class MelodicIntervalTeacher(Teacher):
         self.q_status = self.QSTATUS_NO
         last_tonika = self.m_tonika
         last_question = self.m_question
-        if self.get_bool("lock-to-key"):
-            
-            # We don't have to check the validity of these two variables
-            # because get_int will check that a int value is stored in the
-            # database (and make it an int if it is not), and nComboBox
-            # will make sure the int value is within the correct limits.
-            lock_tonic = mpd.MusicalPitch.new_from_int(self.get_int("lock-to-key-note"))
-            lock_scaletype = utils.key_data.keys()[:][self.get_int("lock-to-key-scaletype")]
-
-        def try_make_question():
-            try:
-                if self.get_bool("lock-to-key"):
-                    self.m_tonika, i = \
-                        utils.random_tonic_and_interval_in_key(L, H,
-                            self.get_list('ask_for_intervals_0'),
-                            lock_tonic, lock_scaletype)
-                
-                else:
-                    self.m_tonika, i = utils.random_tonika_and_interval(L, H,
-                            self.get_list('ask_for_intervals_0'))
-            except utils.NoPossibleIntervals, e:
-                raise self.ConfigureException(self.no_intervals_str % 1)
-            self.m_question = [i]
-            t = self.m_tonika + i
-            for x in range(1, self.get_int('number_of_intervals=1')):
-                interval_list = self.get_list('ask_for_intervals_%i' % x)
-                
-                if not interval_list:
-                    raise self.ConfigureException(self.no_intervals_str % (x + 1))
-                
-                if self.get_bool('lock-to-key'):
-                    i = utils.random_interval_in_key(t, L, H,
-                            interval_list,
-                            lock_tonic, lock_scaletype)
-                    
-                    if not i:
-                        raise self.ConfigureException(_(u"Failed to select random interval number %i because of the configuration of the exercise. Either you have enabled intervals only if one direction, or none of the intervals belong to the key selected when you enabled «Lock to key».") % x)
-                
-                else:
-                    i = utils.random_interval(t, L, H,
-                            self.get_list('ask_for_intervals_%i' % x))
-                    
-                    if not i:
-                        raise self.ConfigureException(_("Failed to select random interval number %i because of the configuration of the exercise. You should select some intervals going in both directions.") % x)
-                self.m_question.append(i)
-                t = t + i
-        max_try = 1000
-        for counter in range(max_try):
-            try:
-                try_make_question()
-            except self.ConfigureException, e:
-                
-                if counter == max_try -1:
-                    raise
-                
-                else:
-                    continue
-            if last_tonika is not None \
-                    and last_tonika == self.m_tonika \
-                    and last_question == self.m_question:
-                continue
-            self.q_status = self.QSTATUS_NEW
-            return self.OK
+        space = self.get_question_space(L, H)
+        x = space.first_impossible_interval()
+        if x is not None:
+            if not self.get_list('ask_for_intervals_%i' % x) or x == 0:
+                raise self.ConfigureException(self.no_intervals_str % (x + 1))
+            if self.get_bool('lock-to-key'):
+                raise self.ConfigureException(_(u"Failed to select random interval number %i because of the configuration of the exercise. Either you have enabled intervals only if one direction, or none of the intervals belong to the key selected when you enabled «Lock to key».") % x)
+            raise self.ConfigureException(_("Failed to select random interval number %i because of the configuration of the exercise. You should select some intervals going in both directions.") % x)
+        while True:
+            self.m_tonika, self.m_question = space.random_question()
+            # Don't ask the same question twice in a row, unless it is
+            # the only possible question.
+            if len(space) == 1 or last_tonika is None \
+                    or last_tonika != self.m_tonika \
+                    or last_question != self.m_question:
+                break
+        self.q_status = self.QSTATUS_NEW
+        return self.OK
 
     def play_question(self):
         if self.q_status == self.QSTATUS_NO:
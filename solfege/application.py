@@ -288,6 +288,17 @@ class SolfegeApp(cfg.ConfigUtils):
                     verbose_init=self.m_options.verbose_sound_init)
             soundcard.synth.error_report_cb = solfege.win.display_error_message
         
+        elif cfg.get_string("sound/type") == "softsynth":
+            try:
+                soundcard.initialise_softsynth(
+                    verbose_init=self.m_options.verbose_sound_init)
+            except ImportError, e:
+                self.display_sound_init_error_message(e)
+                cfg.set_string("sound/type", "fake-synth")
+                soundcard.initialise_using_fake_synth(True)
+                return
+            soundcard.synth.error_report_cb = solfege.win.display_error_message
+        
         elif cfg.get_string("sound/type") == '':
             solfege.win.display_error_message(
                 _("You should configure sound from the 'Sound' page "
@@ -509,17 +520,16 @@ class SolfegeApp(cfg.ConfigUtils):
             cfg.sync()
         except IOError, e:
             gu.display_exception_message(e)
+        lessonfile.infocache.save()
         try:
-            solfege.db.conn.commit()
-        except sqlite3.ProgrammingError, e:
-            gu.display_exception_message(e)
-        try:
-            solfege.db.conn.close()
+            solfege.db.close()
         except sqlite3.ProgrammingError, e:
             gu.display_exception_message(e)
         
         if soundcard.synth:
             soundcard.synth.close()
+        logging.debug("score cache: %i hits, %i misses, %i objects cached",
+                      *mpd.score_cache.get_stats())
         shutil.rmtree(lessonfile.MusicBaseClass.temp_dir, True)
     
     def export_training_set(self, export_data, export_dir, output_format,
@@ -555,6 +565,7 @@ class SolfegeApp(cfg.ConfigUtils):
             p.parse_file(lessonfile.uri_expand(filename))
             for c in range(lesson_info['count']):
                 trackname = "track-%i"
+                streams = None
                 
                 if module == 'idbyname':
                     p.select_random_question()
@@ -579,7 +590,7 @@ class SolfegeApp(cfg.ConfigUtils):
                             
                             if 'delay' in lesson_info:
                                 delay(lesson_info['delay'], p.get_tempo())
-                    soundcard.end_export()
+                    streams = soundcard.end_export()
                 
                 elif module in ('melodicinterval', 'harmonicinterval'):
                     t = self.m_teachers[module]
@@ -607,7 +618,7 @@ class SolfegeApp(cfg.ConfigUtils):
                             if 'delay' in lesson_info:
                                 delay(lesson_info['delay'],
                                     (self.get_int('config/default_bpm'), 4))
-                    soundcard.end_export()
+                    streams = soundcard.end_export()
                 
                 else:
                     logging.warning("export_training_set:ignoring exercise with module='%s'", module)
@@ -663,7 +674,17 @@ class SolfegeApp(cfg.ConfigUtils):
 #####
                 
                 if output_format in ('mp3', 'wav', 'ogg'):
-                    do_convert('midi', 'wav')
+                    
+                    if streams and cfg.get_string("sound/type") == "softsynth":
+                        # Render the music ourselves instead of running
+                        # the external midi to wav converter.
+                        from solfege.soundcard import softsynth
+                        fn = os.path.join(export_dir, trackname % track_idx)
+                        softsynth.render_to_wav(streams, "%s.wav" % fn)
+                        os.remove("%s.mid" % fn)
+                    
+                    else:
+                        do_convert('midi', 'wav')
                 
                 if output_format in ('mp3', 'ogg'):
                     
@@ -44,6 +44,11 @@ try:
 except ImportError:
     solfege.soundcard.alsa_sequencer = None
 
+try:
+    import solfege.soundcard.softsynth
+except ImportError:
+    solfege.soundcard.softsynth = None
+
 if sys.platform == 'win32':
     try:
         from solfege.soundcard import winmidi
@@ -683,9 +688,22 @@ class ConfigWindow(Gtk.Dialog, cfg.ConfigUtils):
              _("Use _external MIDI player"), None)
         hbox.pack_start(self.g_midiplayer_radio, False, False, 0)
 
+        hbox = gu.bHBox(page_vbox, False)
+        self.g_softsynth_radio = gu.RadioButton(self.g_fakesynth_radio,
+             _("Use the built-in _software synth"), None)
+        hbox.pack_start(self.g_softsynth_radio, False, False, 0)
+        if not solfege.soundcard.softsynth:
+            self.g_softsynth_radio.set_sensitive(False)
+            label = Gtk.Label(label="Disabled because the numpy Python module was not found.")
+            label.show()
+            hbox.pack_start(label, False, False, 0)
+
         if self.get_string("sound/type") == "external-midiplayer":
             self.g_midiplayer_radio.set_active(True)
         
+        elif self.get_string("sound/type") == "softsynth":
+            self.g_softsynth_radio.set_active(True)
+        
         elif self.get_string("sound/type") == "sequencer-device":
             self.g_device_radio.set_active(True)
         
@@ -736,9 +754,22 @@ class ConfigWindow(Gtk.Dialog, cfg.ConfigUtils):
              _("Use _external MIDI player"), None)
         hbox.pack_start(self.g_midiplayer_radio, False, False, 0)
 
+        hbox = gu.bHBox(page_vbox, False)
+        self.g_softsynth_radio = gu.RadioButton(self.g_fakesynth_radio,
+             _("Use the built-in _software synth"), None)
+        hbox.pack_start(self.g_softsynth_radio, False, False, 0)
+        if not solfege.soundcard.softsynth:
+            self.g_softsynth_radio.set_sensitive(False)
+            label = Gtk.Label(label="Disabled because the numpy Python module was not found.")
+            label.show()
+            hbox.pack_start(label, False, False, 0)
+
         if self.get_string("sound/type") == "external-midiplayer":
             self.g_midiplayer_radio.set_active(True)
         
+        elif self.get_string("sound/type") == "softsynth":
+            self.g_softsynth_radio.set_active(True)
+        
         elif self.get_string("sound/type") == "winsynth":
             self.g_device_radio.set_active(True)
         
@@ -754,6 +785,9 @@ class ConfigWindow(Gtk.Dialog, cfg.ConfigUtils):
         elif self.get_string("sound/type") == "external-midiplayer":
             self.g_midiplayer_radio.set_active(True)
         
+        elif self.get_string("sound/type") == "softsynth":
+            self.g_softsynth_radio.set_active(True)
+        
         elif self.get_string("sound/type") == "alsa-sequencer":
             
             if solfege.soundcard.alsa_sequencer:
@@ -817,6 +851,14 @@ class ConfigWindow(Gtk.Dialog, cfg.ConfigUtils):
             soundcard.initialise_external_midiplayer()
             soundcard.synth.error_report_cb = solfege.win.display_error_message
         
+        elif self.g_softsynth_radio.get_active():
+            try:
+                soundcard.initialise_softsynth()
+            except ImportError, e:
+                solfege.app.display_sound_init_error_message(e)
+                return -1
+            soundcard.synth.error_report_cb = solfege.win.display_error_message
+        
         elif self.g_device_radio.get_active():
             try:
                 
@@ -851,6 +893,9 @@ class ConfigWindow(Gtk.Dialog, cfg.ConfigUtils):
         if self.g_midiplayer_radio.get_active():
             self.set_string("sound/type", "external-midiplayer")
         
+        elif self.g_softsynth_radio.get_active():
+            self.set_string("sound/type", "softsynth")
+        
         elif self.g_device_radio.get_active():
             
             if sys.platform == "win32":
@@ -40,7 +40,9 @@ prog             The test done before calling
 # På singchord-1 sparer jeg ikke noe på å ha en peek2_type(t1, t2)
 # som tester de to neste token.
 
+import bisect
 import codecs
+import hashlib
 import os
 import re
 import sys
@@ -57,37 +59,30 @@ FLOAT = 'FLOAT'
 CHAR = 'CHAR'
 EOF = 'EOF'
 
-NEW_re = re.compile("""(?:
-                        (\s+)|  #space
-                        (\#.*?$)| #comment
+# Whitespace and comments are skipped by the first part of TOKEN_re,
+# so that every match of TOKEN_re is exactly one token. The number of
+# the group matched, m.lastindex, tells what kind of token we have.
+# The lookahead stops the regex engine from backtracking into a comment
+# to find a token in it.
+SKIP_re = re.compile(ur"[\s\u202f\xa0]*(?:\#[^\n]*(?=\n|$)[\s\u202f\xa0]*)*", re.UNICODE)
+TOKEN_re = re.compile(SKIP_re.pattern + u"""(?:
+                        ([^\W\d][\[\]\w-]*)| #name
+                        ([{}=%+,/().])| #single char operators
+                        \"\"\"(.*?)\"\"\"| #multiline string
+                        "([^"]*)"| #string
                         (-?\d+\.\d+) | #float
-                        (-?\d+)| #integer
-                        (\"\"\"(.*?)\"\"\")| #multiline string
-                        ("(.*?)")| #string
-                        (\w[\[\]\w-]*) #name
+                        (-?\d+) #integer
                 )""",
-                      re.VERBOSE|re.MULTILINE|re.DOTALL|re.UNICODE)
-
-LI_INTEGER = NEW_re.match("-3").lastindex
-LI_FLOAT = NEW_re.match("3.3").lastindex
-LI_MSTRING = NEW_re.match('"""string"""').lastindex
-LI_STRING = NEW_re.match('"string"').lastindex
-LI_NAME = NEW_re.match("name").lastindex
-LI_COMMENT = NEW_re.match("# comment").lastindex
-
-lastindex_to_ID = {LI_INTEGER: INTEGER,
-                     LI_FLOAT: FLOAT,
-                    LI_STRING: STRING,
-                     LI_MSTRING: STRING,
-                     LI_NAME: NAME,
-                    }
-
-lastindex_to_group = {LI_INTEGER: 4,
-                     LI_STRING: 8,
-                     LI_MSTRING: 6,
-                     LI_NAME: 9,
-                     LI_FLOAT: 3,
-                    }
+                      re.VERBOSE|re.DOTALL|re.UNICODE)
+
+LI_CHAR = 2
+
+# Token type of the other groups. The type of the single char operators
+# is the char itself.
+lastindex_to_ID = (None, NAME, None, STRING, STRING, FLOAT, INTEGER)
+# The string groups does not include the quotes, but the token position
+# is the position of the first quote.
+lastindex_to_quote_len = (0, 0, 0, 3, 1, 0, 0)
 
 # Used to find elements in the token tuple
 TOKEN_TYPE = 0
@@ -101,6 +96,15 @@ class istr(unicode):
         self.cval = s
         self.m_added_language = None
     
+    def __reduce_ex__(self, protocol):
+        # Most istr objects are untranslated strings from the lexer. They
+        # are pickled without the instance dict, since that makes
+        # ParseTreeCache files load faster.
+        if (self.m_added_language is None and len(self.__dict__) == 2
+                and self.cval == self):
+            return (istr, (unicode(self),))
+        return unicode.__reduce_ex__(self, protocol)
+
     def __mod__(self, other):
         """
         Handle format strings in translated strings:
@@ -176,7 +180,7 @@ class DataparserSyntaxError(DataparserException):
     def __init__(self, parser, bad_pos, expect):
         DataparserException.__init__(self, _('Syntax error in file "%(filename)s". %(expected)s') % {'filename': parser.m_filename, 'expected': expect})
         # This variable is only used by the module test code.
-        self.m_token = parser._lexer.m_tokens[bad_pos]
+        self.m_token = parser._lexer.get_token(bad_pos)
         self.m_nonwrapped_text = parser._lexer.get_err_context(bad_pos)
 
 class AssignmentToReservedWordException(DataparserException):
@@ -184,7 +188,7 @@ class AssignmentToReservedWordException(DataparserException):
     def __init__(self, parser, bad_pos, word):
         DataparserException.__init__(self, _("Assignment to the reserved word \"%(word)s\"") % {'word': word})
         # This variable is only used by the module test code.
-        self.m_token = parser._lexer.m_tokens[bad_pos]
+        self.m_token = parser._lexer.get_token(bad_pos)
         self.m_nonwrapped_text = parser._lexer.get_err_context(bad_pos)
 
 class CanOnlyTranslateStringsException(DataparserException):
@@ -192,7 +196,7 @@ class CanOnlyTranslateStringsException(DataparserException):
     def __init__(self, parser, bad_pos, variable):
         DataparserException.__init__(self, _("We can only translate strings using in-file translations (ex var[no]=...). See the variable \"%(variable)s\" in the file \"%(filename)s\"") % {'filename': parser.m_filename, 'variable': variable})
         # This variable is only used by the module test code.
-        self.m_token = parser._lexer.m_tokens[bad_pos]
+        self.m_token = parser._lexer.get_token(bad_pos)
         self.m_nonwrapped_text = parser._lexer.get_err_context(bad_pos)
 
 class UnableToTokenizeException(DataparserException):
@@ -203,37 +207,43 @@ class UnableToTokenizeException(DataparserException):
         token is the char that we cannot tokenize
         pos is the position in the string we are tokenizing.
         """
-        # This line will add a fake token tuple, so that get_err_context
+        # This line will add a fake token, so that get_err_context
         # can produce useful output.
-        lexer.m_tokens.append(('FIXME', token, pos, lineno))
+        lexer.add_token('FIXME', token, pos)
         # This variable is only used by the module test code.
-        self.m_token = lexer.m_tokens[-1]
+        self.m_token = lexer.get_token(-1)
         DataparserException.__init__(self,
             _('Unable to tokenize line %(lineno)i of the file "%(filename)s"') % {
                 'lineno': lineno + 1,
                 'filename': lexer.m_parser().m_filename})
         self.m_nonwrapped_text = lexer.get_tokenize_err_context()
 
-class Lexer:
-   
+class Lexer(object):
+    """
+    The tokens are stored in the parallel lists m_types, m_strings
+    and m_idxs (the position of the token in m_src).
+    """
     def __init__(self, src, parser):
-        assert isinstance(src, str)
-       
+        """
+        src is the content of the lesson file. It can also be unicode
+        if it has already been decoded.
+        """
         if parser:
             self.m_parser = weakref.ref(parser)
        
         else:
             self.m_parser = parser
-        r = re.compile("#.*?coding\s*[:=]\s*([\w_.-]+)")
-        # according to http://www.python.org/dev/peps/pep-0263/
-        # the encoding marker must be in the first two lines
-        m = r.match("\n".join(src.split("\n")[0:2]))
-       
-        if m:
-            src = unicode(src, m.groups()[0], errors="replace")
-       
-        else:
-            src = unicode(src, "UTF-8", errors="replace")
+        if isinstance(src, str):
+            r = re.compile("#.*?coding\s*[:=]\s*([\w_.-]+)")
+            # according to http://www.python.org/dev/peps/pep-0263/
+            # the encoding marker must be in the first two lines
+            m = r.match("\n".join(src.split("\n")[0:2]))
+           
+            if m:
+                src = unicode(src, m.groups()[0], errors="replace")
+           
+            else:
+                src = unicode(src, "UTF-8", errors="replace")
         assert isinstance(src, unicode)
         src = src.replace("\r", "\n")
         # Some editors (notepad on win32?) insert the BOM, so we have
@@ -241,52 +251,88 @@ class Lexer:
         src = src.lstrip(unicode(codecs.BOM_UTF8, "utf8"))
         self.m_src = src
         self.pos = 0
-        pos = 0
-        lineno = 0
-        self.m_tokens = []
-        while 1:
-            try:
-               
-                if src[pos] in u"\u202f\xa0 \n\t{}=%+,/().":
-                 
-                    if src[pos] in u'\u202f\xa0 \t':
-                        pos += 1
-                        continue
-                 
-                    if src[pos] == '\n':
-                        pos += 1
-                        lineno += 1
-                        continue
-                    self.m_tokens.append(('%s' % src[pos], src[pos], pos, lineno))
-                    pos += 1
-                    continue
-            except IndexError:
-                break
-            m = NEW_re.match(src, pos)
-            
-            if not m:
-                raise UnableToTokenizeException(self, lineno, src[pos], pos)
-            
-            if m.lastindex == LI_COMMENT:
-                pass
-            
-            else:
-                self.m_tokens.append((lastindex_to_ID[m.lastindex],
-                         m.group(lastindex_to_group[m.lastindex]), pos, lineno))
-            pos = m.end()
-        self.m_tokens.append(("EOF", None, pos, lineno))
-        self.m_tokens.append(("EOF", None, pos, lineno))
-        self.m_tokens.append(("EOF", None, pos, lineno))
-        self.m_tokens.append(("EOF", None, pos, lineno))
+        self.m_types = types = []
+        self.m_strings = strings = []
+        types_append = types.append
+        strings_append = strings.append
+        m = None
+        # scanner().match continues where the previous match ended, and
+        # returns None when it cannot find a token at that position.
+        for m in iter(TOKEN_re.scanner(src).match, None):
+            li = m.lastindex
+            s = m.group(li)
+            types_append(s if li == LI_CHAR else lastindex_to_ID[li])
+            strings_append(s)
+        pos = SKIP_re.match(src, m.end() if m else 0).end()
+        # The token positions are only needed when we report errors,
+        # so they are not calculated before they are asked for.
+        self._idxs = None
+        self._extra_idxs = []
+        self._line_starts = None
+        if pos != len(src):
+            raise UnableToTokenizeException(self, self.get_lineno(pos), src[pos], pos)
+        for i in range(4):
+            self.add_token("EOF", None, pos)
+
+    def __reduce__(self):
+        return (LazyLexer, (self.m_src,))
+
+    def add_token(self, token_type, string, idx):
+        self.m_types.append(token_type)
+        self.m_strings.append(string)
+        if self._idxs is None:
+            self._extra_idxs.append(idx)
+        else:
+            self._idxs.append(idx)
+
+    @property
+    def m_idxs(self):
+        """
+        List of the position in m_src of all the tokens.
+        """
+        if self._idxs is None:
+            self._idxs = [m.start(m.lastindex) - lastindex_to_quote_len[m.lastindex]
+                for m in iter(TOKEN_re.scanner(self.m_src).match, None)]
+            self._idxs.extend(self._extra_idxs)
+        return self._idxs
+
+    @property
+    def m_line_starts(self):
+        """
+        Sorted list of the position in m_src of the first char of
+        every line. It is created the first time it is needed, so that
+        we can find lines and line numbers using bisect.
+        """
+        if self._line_starts is None:
+            self._line_starts = [0]
+            self._line_starts.extend(m.end() for m in re.finditer("\n", self.m_src))
+        return self._line_starts
+
+    def get_lineno(self, idx):
+        """
+        Return the zero indexed line number of position idx in m_src.
+        """
+        return bisect.bisect_right(self.m_line_starts, idx) - 1
+
+    def get_token(self, i):
+        """
+        Return the token tuple (type, string, idx, lineno) for token i.
+        """
+        return (self.m_types[i], self.m_strings[i], self.m_idxs[i],
+                self.get_lineno(self.m_idxs[i]))
+
+    @property
+    def m_tokens(self):
+        """
+        List of all the token tuples. This is slow, and only here for
+        the test suite and for debugging.
+        """
+        return [self.get_token(i) for i in range(len(self.m_types))]
     
     def _err_context_worker(self, lexer_pos):
         ret = ""
-        lineno = self.m_tokens[lexer_pos][TOKEN_LINENO]
-        x = self.m_tokens[lexer_pos][TOKEN_IDX]
-        while x > 0 and self.m_src[x-1] != "\n":
-            x -= 1
-        linestart_idx = x
-        erridx_in_line = self.m_tokens[lexer_pos][TOKEN_IDX] - linestart_idx
+        lineno = self.get_lineno(self.m_idxs[lexer_pos])
+        erridx_in_line = self.m_idxs[lexer_pos] - self.m_line_starts[lineno]
        
         if lineno > 1:
             ret += "\n(line %i): %s" % (lineno-1, self.get_line(lineno-2))
@@ -302,7 +348,7 @@ class Lexer:
         return a string with the last part of the file that we were able
         to tokenize. Used by UnableToTokenizeException
         """
-        return self._err_context_worker(len(self.m_tokens)-1)
+        return self._err_context_worker(len(self.m_types)-1)
     
     def get_err_context(self, pos):
         return self._err_context_worker(pos)
@@ -311,13 +357,16 @@ class Lexer:
         # Line number of the last part of the error. We will display
         # two lines, the last line containing (part of) the error, and
         # the line before it.
-        l2 = self.m_src[:pos2].count("\n")
+        l2 = self.get_lineno(pos2)
         # i1 and i2 is the start and end of the text that should be
         # marked as erroneous. If the error is stretched over several
         # lines, then we will only mark the last line.
-        i = pos2
-        while i > 0 and self.m_src[i] != "\n":
-            i -= 1
+        # i is the position of the newline before the line, or 0 if
+        # this is the first line.
+        if pos2 < len(self.m_src) and self.m_src[pos2] == "\n":
+            i = pos2
+        else:
+            i = max(self.m_line_starts[l2] - 1, 0)
         i2 = pos2 - i - 1
         if pos1 > i:
             i1 = pos1 - i - 1
@@ -330,47 +379,144 @@ class Lexer:
               + " " * (i1 + len(linestr) + 1) + "^" * (i2 - i1))
     
     def peek(self, forward=0):
-        return self.m_tokens[self.pos+forward]
+        return self.get_token(self.pos+forward)
     
     def peek_type(self, forward=0):
-        return self.m_tokens[self.pos+forward][TOKEN_TYPE]
+        return self.m_types[self.pos+forward]
     
     def peek_string(self, forward=0):
-        return self.m_tokens[self.pos+forward][TOKEN_STRING]
+        return self.m_strings[self.pos+forward]
     
     def scan_any(self):
         """scan the next token"""
         self.pos += 1
-        return self.m_tokens[self.pos-1][TOKEN_STRING]
+        return self.m_strings[self.pos-1]
     
     def scan(self, t=None):
         """t is the type of token we expect"""
-        if self.m_tokens[self.pos][TOKEN_TYPE] == t:
+        if self.m_types[self.pos] == t:
             self.pos += 1
-            return self.m_tokens[self.pos-1][TOKEN_STRING]
+            return self.m_strings[self.pos-1]
        
         else:
             # Tested in TestLexer.test_scan
             raise DataparserSyntaxError(self.m_parser(), self.pos,
                 _("Token \"%(nottoken)s\" not found, found \"%(foundtoken)s\" of type %(type)s.") % {
                     'nottoken': t,
-                    'foundtoken': self.m_tokens[self.pos][TOKEN_STRING],
-                    'type': self.m_tokens[self.pos][TOKEN_TYPE]})
+                    'foundtoken': self.m_strings[self.pos],
+                    'type': self.m_types[self.pos]})
     
     def get_line(self, lineno):
         """line 0 is the first line
         Return an empty string if lineno is out of range.
         """
-        idx = 0
-        c = 0
-        while c < lineno and idx < len(self.m_src):
-            if self.m_src[idx] == '\n':
-                c += 1
-            idx += 1
-        x = idx
-        while x < len(self.m_src) and self.m_src[x] != '\n':
-            x += 1
-        return self.m_src[idx:x]
+        starts = self.m_line_starts
+        lineno = max(lineno, 0)
+        if lineno >= len(starts):
+            return u""
+        if lineno + 1 < len(starts):
+            return self.m_src[starts[lineno]:starts[lineno + 1] - 1]
+        return self.m_src[starts[lineno]:]
+
+# Parse trees of the library files loaded by 'import' and 'rimport',
+# keyed by absolute filename. The values are (stamps, tree), where stamps
+# is a list of (filename, hash) for the library file and every
+# library file it imports itself.
+_library_cache = {}
+
+# The sha1 of the files _file_stamp has read, keyed by filename. The
+# values are ((mtime, size), hash), so that we only read a file again
+# if it has changed since we last hashed it.
+_file_hashes = {}
+
+def _file_stamp(filename):
+    """
+    Return (filename, hash), where hash is the sha1 of the content of
+    the file. Installing files does not keep the mtimes, so we cannot
+    use them to check if the files imported by precompiled parse trees
+    have changed. Files below the current directory are given relative
+    to it, since the trees are precompiled in the source directory and
+    the program runs with the installed data directory as the current
+    directory.
+    """
+    st = os.stat(filename)
+    if not isinstance(filename, unicode):
+        filename = filename.decode(sys.getfilesystemencoding())
+    cwd = os.path.join(os.getcwdu(), u"")
+    abs_filename = os.path.abspath(filename)
+    if abs_filename.startswith(cwd):
+        filename = abs_filename[len(cwd):]
+    try:
+        stat_key, digest = _file_hashes[filename]
+    except KeyError:
+        stat_key = None
+    if stat_key != (st.st_mtime, st.st_size):
+        f = open(filename, 'rb')
+        try:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        finally:
+            f.close()
+        _file_hashes[filename] = ((st.st_mtime, st.st_size), digest)
+    return (filename, digest)
+
+def parse_library_file(filename):
+    """
+    Return (stamps, tree) for the library file, where tree is the parse
+    tree and stamps is the list of (filename, hash) of the file
+    and the files it imports. The tree is shared by all lesson files
+    importing the library, so it must not be modified. The file is only
+    parsed again if it, or any file it imports, has changed.
+    """
+    filename = os.path.abspath(filename)
+    if filename in _library_cache:
+        stamps, tree = _library_cache[filename]
+        if not stamps_changed(stamps):
+            return stamps, tree
+        del _library_cache[filename]
+    # Stat the file before we read it, so that we don't miss changes
+    # done while we parse. If stat fails, parse_file will raise the
+    # same IOError as it did before we had the cache.
+    try:
+        stamp = _file_stamp(filename)
+    except (OSError, IOError):
+        stamp = None
+    p = Dataparser()
+    p.parse_file(filename)
+    if not stamp:
+        return [], p.tree
+    stamps = [stamp] + p.m_import_stamps
+    _library_cache[filename] = (stamps, p.tree)
+    return stamps, p.tree
+
+class LazyLexer(object):
+    """
+    Used in place of the Lexer of parse trees that are loaded from
+    a pickle file. The Lexer is only needed to report errors, so
+    we don't tokenize the source before it is needed.
+    """
+    def __init__(self, src):
+        self.m_src = src
+        self._lexer = None
+
+    def __getstate__(self):
+        return {'m_src': self.m_src, '_lexer': None}
+
+    def __getattr__(self, name):
+        if name.startswith("__") or '_lexer' not in self.__dict__:
+            raise AttributeError(name)
+        if self._lexer is None:
+            self._lexer = Lexer(self.m_src, None)
+        return getattr(self._lexer, name)
+
+def stamps_changed(stamps):
+    """
+    Return True if any of the files in stamps, a list of
+    (filename, hash), has changed or been deleted.
+    """
+    try:
+        return [_file_stamp(s[0]) for s in stamps] != stamps
+    except (OSError, IOError):
+        return True
 
 class Dataparser:
     """
@@ -379,7 +525,16 @@ class Dataparser:
     
     def __init__(self):
         self.m_filename = None
+        # (filename, hash) of the files imported or included.
+        self.m_import_stamps = []
         self.m_translation_re = re.compile("(?P<varname>\w+)\[(?P<lang>[\w_+]+)\]")
+
+    def __getstate__(self):
+        # FunctionCall nodes keep a reference to the parser, so it
+        # is pickled with the parse tree. The functions called only
+        # need to know where the lesson file is.
+        return {'m_filename': self.m_filename,
+                'm_location': self.__dict__.get('m_location')}
     
     def parse_file(self, filename):
         """We always construct a new parser if we want to parse another
@@ -474,9 +629,11 @@ class Dataparser:
         if not os.path.exists(fn):
             fn = os.path.join(os.getcwdu(), u'exercises/standard/lesson-files', filename)
         s = open(fn, 'rU').read()
+        self.m_import_stamps.append(_file_stamp(fn))
         p = Dataparser()
         p.m_location = self.m_location
         p.parse_string(s)
+        self.m_import_stamps.extend(p.m_import_stamps)
         self._lexer.scan(')')
         return pt.IncludeStatement(p.tree)
     
@@ -490,16 +647,17 @@ class Dataparser:
        
         else:
             mod_name = mod_filename
-        p = Dataparser()
         fn1 = os.path.join(fn1, mod_filename)
         fn2 = os.path.join(fn2, mod_filename)
        
         if os.path.exists(fn1) or not os.path.exists(fn2):
-            p.parse_file(fn1)
+            fn = fn1
        
         else:
-            p.parse_file(fn2)
-        return pt.Assignment(pt.Identifier(mod_name), p.tree)
+            fn = fn2
+        stamps, tree = parse_library_file(fn)
+        self.m_import_stamps.extend(stamps)
+        return pt.Assignment(pt.Identifier(mod_name), tree)
     
     def do_import(self):
         return self._import_worker(
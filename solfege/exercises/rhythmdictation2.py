@@ -22,7 +22,6 @@ from solfege import lessonfile
 from solfege import mpd
 from solfege import soundcard
 
-from solfege.mpd import Duration
 from solfege.mpd import elems
 from solfege.mpd import RhythmWidget, RhythmWidgetController
 
@@ -99,9 +98,6 @@ class Gui(abstract.LessonbasedGui):
                 self.g_w.grab_focus()
                 self.g_w.set_score(self.m_t.m_score)
                 self.g_c.set_editable(True)
-        except Duration.BadStringException, e:
-            gu.dialog_ok("Lesson file error", secondary_text=u"Bad rhythm string in the elements variable of the lessonfile. Only digits and dots expected: %s" % unicode(e))
-            exception_cleanup()
         except Exception, e:
             if not self.standard_exception_handler(e, exception_cleanup):
                 raise
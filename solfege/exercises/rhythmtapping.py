@@ -17,14 +17,15 @@
 from __future__ import absolute_import
 
 import logging
-import time
 
+from gi.repository import Gdk
 from gi.repository import Gtk
 
 from solfege import abstract
 from solfege import gu
 from solfege import lessonfile
 from solfege import mpd
+from solfege import tapping
 
 from solfege.mpd.requests import MusicRequest
 
@@ -37,9 +38,20 @@ class Teacher(abstract.Teacher):
         self.lessonfileclass = lessonfile.QuestionsLessonfile
         for s in 'show', 'play':
             self.m_lessonfile_defs[s] = s
+        self.m_event_clock = tapping.EventClock()
+        self.m_timedeltas = None
     def new_question(self):
         self.m_P.select_random_question()
+        self.m_timedeltas = None
         return self.OK
+    def get_question_timedeltas(self):
+        """
+        Return get_timedelta_list() for the current question. The music
+        is only parsed once for each question.
+        """
+        if self.m_timedeltas is None:
+            self.m_timedeltas = self.get_timedelta_list()
+        return self.m_timedeltas
     def get_timedelta_list(self):
         """
         Return a list of the number of seconds between it should be between
@@ -71,17 +83,27 @@ class Teacher(abstract.Teacher):
             e.m_mpd_badcode = self.m_P.get_question()[qvar].get_err_context(e, self.m_P)
             raise
         return retval
+    def get_tap_along_start(self):
+        """
+        Return the time.time() the user should tap the first tone if
+        tapping along with the music played, or None if the user is
+        not supposed to do that.
+        """
+        return None
     def start_tapping(self):
-        self.m_taps = []
-    def tap(self):
-        self.m_taps.append(time.time())
+        self.m_tap_session = tapping.TapSession(
+            self.get_question_timedeltas(), self.m_event_clock)
+    def tap(self, event_time):
+        """
+        event_time is the timestamp of the key or button press event.
+        """
+        self.m_tap_session.tap(self.m_event_clock.observe(event_time))
     def is_tap_complete(self):
         """
         Return True if the user has tapped as many times as the
         question requires.
         """
-        # A little abuse of get_timedelta_list, but this makes it simple.
-        return len(self.m_taps) == len(self.get_timedelta_list())
+        return self.m_tap_session.is_complete()
     def get_score(self):
         """
         Return a list of floats telling us how close the users answer was.
@@ -92,25 +114,10 @@ class Teacher(abstract.Teacher):
         and the second tap will set the tempo, and all the timedeltas will
         be compared
         """
-        retval = []
-        question = self.get_timedelta_list()
-        if self.m_P.header.at_question_start == 'show':
-            # The user can tap in any tempo since he will only se the music.
-            # First we change the lists so that the time between the
-            # first two taps are 1.0, and the other proportionally to this.
-            question = [q/question[0] for q in question]
-            answer = []
-            for x, i in enumerate(self.m_taps[1:]):
-                answer.append(self.m_taps[x+1] - self.m_taps[x])
-            answer = [a/answer[0] for a in answer]
-            for idx in range(len(answer)):
-                retval.append(question[idx] / answer[idx])
-        else:
-            # Has to tap in the same tempo as the music played.
-            for x, i in enumerate(self.m_taps[1:]):
-                a = self.m_taps[x+1] - self.m_taps[x]
-                retval.append(a / question[x])
-        return retval
+        # The user can tap in any tempo if he will only se the music.
+        # Else he has to tap in the same tempo as the music played.
+        return self.m_tap_session.get_score(
+            self.m_P.header.at_question_start == 'show')
     def get_answer_status(self):
         """
         Will return a tuple (bool, string) where the bool is True if the
@@ -124,6 +131,15 @@ class Teacher(abstract.Teacher):
             s = "OK: %.2f < %.2f" % (max_diff, limit)
         else:
             s = "Not good enough: %.2f > %.2f" % (max_diff, limit)
+        start = self.get_tap_along_start()
+        if start is not None:
+            errors = self.m_tap_session.get_onset_errors(start,
+                self.get_float("sound/output_latency") / 1000)
+            # Only say something if the user did tap along with the music
+            # and not after it was played.
+            if abs(errors[0]) < sum(self.m_tap_session.m_timedeltas):
+                s += ", %+i ms from the beat" % (
+                    1000 * sum(errors) / len(errors))
         return (max_diff < limit, s)
 
 class Gui(abstract.LessonbasedGui):
@@ -134,7 +150,16 @@ class Gui(abstract.LessonbasedGui):
         self.g_music_displayer = mpd.MusicDisplayer()
         self.practise_box.pack_start(self.g_music_displayer, False, False, 0)
         #
-        self.g_tap = gu.bButton(self.practise_box, _("Tap here"), self.on_tap)
+        self.g_tap = gu.bButton(self.practise_box, _("Tap here"))
+        # We tap on press instead of 'clicked', that is emitted when
+        # the button or key is released.
+        self.g_tap.connect('button-press-event', self.on_tap_event)
+        self.g_tap.connect('key-press-event', self.on_tap_event)
+        self.g_tap.connect('key-release-event', self.on_tap_key_release)
+        self.g_tap.connect('focus-out-event', self.on_tap_focus_out)
+        # The keyvals that are pressed down. Holding a key down gives
+        # repeated key-press-events that we must not count as taps.
+        self.m_keys_down = set()
         self.std_buttons_add(
             ('new', self.on_new_question),
             ('play_music', lambda w: self.run_exception_handled(self.m_t.m_P.play_question)),
@@ -159,6 +184,19 @@ class Gui(abstract.LessonbasedGui):
         hbox.pack_start(spin, False, False, 0)
         self.config_box.pack_start(hbox, False, False, 0)
         hbox.show_all()
+        #
+        label = Gtk.Label(label=_("Sound output latency (ms):"))
+        self.config_box_sizegroup.add_widget(label)
+        label.set_alignment(1.0, 0.5)
+        spin = gu.nSpinButton(self.m_exname, 'sound/output_latency',
+                              Gtk.Adjustment(0, 0, 1000, 1, 10))
+        spin.set_tooltip_text(_("The time from the music is played until you can hear it. It is subtracted when we measure how close to the beat you tap."))
+        hbox = Gtk.HBox()
+        hbox.set_spacing(gu.hig.SPACE_SMALL)
+        hbox.pack_start(label, False, False, 0)
+        hbox.pack_start(spin, False, False, 0)
+        self.config_box.pack_start(hbox, False, False, 0)
+        hbox.show_all()
     def on_new_question(self, widget=None):
         def exception_cleanup():
             self.m_t.end_practise()
@@ -175,13 +213,12 @@ class Gui(abstract.LessonbasedGui):
                 self.g_music_displayer.clear()
             try:
                 self.do_at_question_start_show_play()
+                self.m_t.start_tapping()
             except Exception, e:
                 if not self.standard_exception_handler(e, exception_cleanup):
                     raise
             else:
-                self.m_start_time = time.time()
                 self.g_flashbar.push(self.please_tap_str)
-                self.m_t.start_tapping()
                 self.std_buttons_new_question()
                 self.g_tap.set_sensitive(True)
                 self.g_tap.grab_focus()
@@ -199,9 +236,31 @@ class Gui(abstract.LessonbasedGui):
     def on_repeat(self, widget):
         self.m_t.m_P.play_question()
         self.g_tap.grab_focus()
-    def on_tap(self, widget=None):
+    def on_tap_event(self, widget, event):
+        if event.type == Gdk.EventType.KEY_PRESS:
+            if event.keyval not in (Gdk.KEY_space, Gdk.KEY_Return,
+                                    Gdk.KEY_KP_Enter):
+                return False
+            if event.keyval in self.m_keys_down:
+                return True
+            self.m_keys_down.add(event.keyval)
+        elif event.type != Gdk.EventType.BUTTON_PRESS or event.button != 1:
+            # Double clicks give a 2BUTTON_PRESS event after the second
+            # BUTTON_PRESS event. We don't want to count them twice.
+            return event.type != Gdk.EventType.BUTTON_PRESS
+        self.on_tap(event.get_time())
+        return True
+    def on_tap_key_release(self, widget, event):
+        self.m_keys_down.discard(event.keyval)
+        return False
+    def on_tap_focus_out(self, widget, event):
+        # We will not get the key-release-event if the key is released
+        # when the button does not have focus.
+        self.m_keys_down.clear()
+        return False
+    def on_tap(self, event_time):
         self.g_flashbar.set(_("Tapping in progress..."))
-        self.m_t.tap()
+        self.m_t.tap(event_time)
         try:
             if self.m_t.is_tap_complete():
                 solved, msg = self.m_t.get_answer_status()
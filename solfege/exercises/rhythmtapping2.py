@@ -16,6 +16,8 @@
 
 from __future__ import absolute_import
 
+import time
+
 from solfege import abstract
 from solfege import lessonfile
 from solfege import mpd
@@ -27,8 +29,29 @@ class Teacher(abstract.RhythmAddOnClass, rhythmtapping.Teacher):
     def __init__(self, exname):
         rhythmtapping.Teacher.__init__(self, exname)
         self.lessonfileclass = lessonfile.HeaderLessonfile
+        self.m_playback_start = None
+    def new_question(self):
+        self.m_timedeltas = None
+        self.m_playback_start = None
+        return abstract.RhythmAddOnClass.new_question(self)
     def play_question(self):
         self.play_rhythm(self.get_music_string())
+        self.m_playback_start = time.time()
+    def get_tap_along_start(self):
+        """
+        The user can tap along with the music after the count in.
+        """
+        if self.m_playback_start is None:
+            return None
+        count_in = 0.0
+        if self.get_int("count_in"):
+            lexer = mpd.parser.Lexer(self.get_music_notenames(True))
+            for toc, toc_data in lexer:
+                if (not isinstance(toc_data, MusicRequest)
+                        or toc_data.m_pitch.get_octave_notename() != 'd'):
+                    break
+                count_in += float(toc_data.m_duration.get_rat_value()) * 4 / self.m_P.header.bpm * 60
+        return self.m_playback_start + count_in
     def get_timedelta_list(self):
         """
         Return a list of the number of seconds between it should be between
@@ -17,19 +17,23 @@
 from __future__ import absolute_import
 
 """
-This code does not work. Also notice that is is not imported by
+A tuner showing the pitch of the tone sung or played into the
+microphone. The pitch is detected by soundcard.pitchdetect, recording
+from the OSS audio device, or arecord or parec if /dev/dsp is missing.
+Notice that this module is not imported by
     from exercises import *
-since it will try to import solfege_c_midi even if it is not available.
+since it will try to import numpy even if it is not available.
 """
 
+import threading
+
 from gi.repository import GObject
 
+import solfege
 from solfege import abstract
 from solfege import gu
-from solfege import utils
 from solfege import lessonfile
-import solfege.soundcard.solfege_c_midi
-from solfege import soundcard
+from solfege.soundcard import pitchdetect
 
 class Teacher(abstract.Teacher):
     def __init__(self, exname):
@@ -42,19 +46,58 @@ class Gui(abstract.Gui):
         self.g_hz = gu.bLabel(self.practise_box, "")
         self.g_notename = gu.bLabel(self.practise_box, "")
         self.g_cent = gu.bLabel(self.practise_box, "")
+        self.m_source = None
+        self.m_thread = None
+        self.__idle_tag = None
+        self.m_freq = None
     def on_start_practise(self):
-        soundcard.solfege_c_midi.dsp_open_record()
-        #self.__idle_tag = GObject.idle_add(self.update_view)
+        try:
+            self.m_source = pitchdetect.open_audio_source()
+        except pitchdetect.AudioSourceException, e:
+            solfege.win.display_error_message2(
+                _("Could not record from the microphone"), unicode(e))
+            return
+        self.m_thread = threading.Thread(target=self.detect_loop,
+                                         args=(self.m_source,))
+        self.m_thread.setDaemon(True)
+        self.m_thread.start()
         self.__idle_tag = GObject.timeout_add(300, self.update_view)
+    def detect_loop(self, source):
+        detector = pitchdetect.PitchDetector()
+        try:
+            for t, freq in detector.track(source.blocks(detector.m_hop)):
+                self.m_freq = freq
+                if self.m_source is not source:
+                    break
+        except pitchdetect.AudioSourceException, e:
+            if self.m_source is source:
+                # We are not in the main thread, so let the main loop
+                # display the error.
+                GObject.idle_add(self.display_source_error, unicode(e))
+    def display_source_error(self, msg):
+        solfege.win.display_error_message2(
+            _("Could not record from the microphone"), msg)
+        return False
     def update_view(self):
-        freq = soundcard.solfege_c_midi.idle_loop()
-        print freq
-        notename, cent = utils.freq_to_notename_cent(freq)
-        self.g_hz.set_text(str(freq))
-        self.g_notename.set_text(notename)
-        self.g_cent.set_text(str(cent))
+        freq = self.m_freq
+        notename, cent = pitchdetect.freq_to_notename_cent(freq)
+        if freq is None:
+            self.g_hz.set_text("")
+            self.g_notename.set_text("")
+            self.g_cent.set_text("")
+        else:
+            self.g_hz.set_text("%.1f" % freq)
+            self.g_notename.set_text(notename)
+            self.g_cent.set_text("%+i" % cent)
         return True
     def on_end_practise(self):
-        #Gtk.idle_remove(self.__idle_tag)
-        GObject.source_remove(self.__idle_tag)
-        soundcard.solfege_c_midi.dsp_close()
+        if self.__idle_tag is not None:
+            GObject.source_remove(self.__idle_tag)
+            self.__idle_tag = None
+        source = self.m_source
+        self.m_source = None
+        if self.m_thread:
+            self.m_thread.join()
+            self.m_thread = None
+        if source:
+            source.close()
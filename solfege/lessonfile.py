@@ -17,22 +17,30 @@
 
 from __future__ import absolute_import
 
+import cPickle
 import glob
+import hashlib
 import locale
 import logging
+import multiprocessing
 import os
+import pickle
 import random
 import re
 import stat
 import subprocess
 import sys
 import textwrap
+import time
+import zlib
 
 from gi.repository import GObject
 
+from solfege import buildinfo
 from solfege import cfg
 from solfege import dataparser
 from solfege import filesystem
+from solfege import i18n
 from solfege import lfmod
 from solfege import mpd
 from solfege import osutils
@@ -45,6 +53,7 @@ from solfege.dataparser import istr
 from solfege.mpd import elems
 from solfege.mpd import Duration
 from solfege.mpd import Rat
+from solfege.mpd.rat import lcm
 
 _test_mode = False
 
@@ -439,7 +448,7 @@ class MpdParsable(MusicBaseClass):
         bug if a MpdException is raised.
         """
         try:
-            return mpd.parser.parse_to_score_object(self.get_mpd_music_string(lessonfile_ref))
+            return mpd.score_cache.get_score(self.get_mpd_music_string(lessonfile_ref))
         except mpd.MpdException, e:
             if as_name:
                 e.m_mpd_varname = as_name
@@ -867,11 +876,10 @@ class PercBaseClass(MpdParsable):
 
     def _gen_track(self, lessonfile_ref, question):
         try:
-            score = mpd.parser.parse_to_score_object(self.get_mpd_music_string(lessonfile_ref))
+            track = mpd.score_cache.get_tracks(self.get_mpd_music_string(lessonfile_ref))[0]
         except mpd.MpdException, e:
             self.complete_to_musicdata_coords(lessonfile_ref, e)
             raise
-        track = mpd.score_to_tracks(score)[0]
         track.set_volume(cfg.get_int('config/preferred_instrument_volume'))
         track.prepend_bpm(lessonfile_ref.get_tempo()[0],
                           lessonfile_ref.get_tempo()[1])
@@ -1083,6 +1091,22 @@ def parse_test_def(s):
     return (count, 'x')
 
 
+def parse_lessonfile_string(s, location, really_filename):
+    """
+    Parse the lesson file content s and return the Dataparser.
+    location is the directory the lesson file is in.
+    """
+    dp = dataparser.Dataparser()
+    dp.m_location = location
+    try:
+        dp.parse_string(s, really_filename)
+    except LessonfileParseException, e:
+        e.m_nonwrapped_text = dp._lexer.get_err_context(dp._lexer.pos - 2)
+        e.m_token = dp._lexer.get_token(dp._lexer.pos - 2)
+        raise
+    return dp
+
+
 class LessonfileCommon(object):
 
     def __init__(self, module_predefs=None, header_defaults=None):
@@ -1158,21 +1182,19 @@ class LessonfileCommon(object):
         if self.header.at_question_start:
             self.header.have_music_displayer = True
 
-    def get_lessonfile(self, s, really_filename):
+    def get_lessonfile(self, s, really_filename, use_cache=True):
         """
-        This is the parsetree interpreter.
+        This is the parsetree interpreter. The parse tree is taken from
+        parsetreecache if it is set and use_cache is True.
         """
-        dp = dataparser.Dataparser()
-        dp.m_location = self.m_location
-        try:
-            dp.parse_string(s, really_filename)
-        except LessonfileParseException, e:
-            e.m_nonwrapped_text = dp._lexer.get_err_context(dp._lexer.pos - 2)
-            e.m_token = dp._lexer.m_tokens[dp._lexer.pos - 2]
-            raise
+        if parsetreecache and use_cache:
+            tree = parsetreecache.get_tree(s, self.m_location, really_filename)
+        else:
+            tree = parse_lessonfile_string(s, self.m_location,
+                                           really_filename).tree
         d = lessonfile_builtins.copy()
         d.update(self.m_module_predefs)
-        mod = lfmod.parse_tree_interpreter(dp.tree, d)
+        mod = lfmod.parse_tree_interpreter(tree, d)
         self.m_globals = mod.m_globals
         self.blocklists = mod.m_blocklists
         if 'header' in self.blocklists:
@@ -1662,6 +1684,51 @@ class SingChordLessonfile(QuestionsLessonfile):
     pass
 
 
+class BarFiller(object):
+    """
+    Draw random sequences of rhythm elements that fill a bar exactly.
+
+    ways[r] is the number of different sequences of elements with the
+    total length of r units, where a unit is the greatest common
+    fraction of the lengths of all the elements and the bar. It is
+    computed once, so each bar can be drawn uniformly from all the
+    possible sequences without trial and error.
+    """
+    def __init__(self, lengths, bar_length):
+        """
+        lengths is a list of Rat, one for each element.
+        bar_length is a Rat.
+        """
+        unit = bar_length.m_den
+        for length in lengths:
+            unit = lcm(unit, length.m_den)
+        self.m_lengths = [length.m_num * unit / length.m_den for length in lengths]
+        self.m_bar_length = bar_length.m_num * unit / bar_length.m_den
+        self.m_ways = [1] + [0] * self.m_bar_length
+        for r in range(1, self.m_bar_length + 1):
+            self.m_ways[r] = sum([self.m_ways[r - length]
+                                  for length in self.m_lengths
+                                  if 0 < length <= r])
+    def is_fillable(self):
+        return self.m_ways[self.m_bar_length] > 0
+    def random_fill(self):
+        """
+        Return a list of the indexes of the elements of a random bar.
+        """
+        retval = []
+        r = self.m_bar_length
+        while r > 0:
+            x = random.randrange(self.m_ways[r])
+            for idx, length in enumerate(self.m_lengths):
+                if 0 < length <= r:
+                    x -= self.m_ways[r - length]
+                    if x < 0:
+                        break
+            retval.append(idx)
+            r -= length
+        return retval
+
+
 class RhythmDictation2Lessonfile(QuestionsLessonfile):
     """
     We inherit from QuestionsLessonfile just to get the .get_tempo()
@@ -1675,60 +1742,67 @@ class RhythmDictation2Lessonfile(QuestionsLessonfile):
             raise NoQuestionsInFileException(self.m_filename)
         # Make sure the variables are lists. If there is only one elemt
         # in the lesson file then we must make a list of them.
-        for question in self.m_questions:
+        for idx, question in enumerate(self.m_questions):
 
             if not isinstance(question['bars'], list):
                 question['bars'] = [question['bars']]
 
             if not isinstance(question['elements'], list):
                 question['elements'] = [question['elements']]
+            question['element_notes'] = [elem.split() for elem in question['elements']]
+            lengths = []
+            for elem in question['element_notes']:
+                try:
+                    lengths.append(self.rat_len_of_digits(elem))
+                except Duration.BadStringException:
+                    raise LessonfileParseException(_('Question number %(index)i in the lesson file "%(filename)s": bad rhythm string "%(elem)s" in the elements variable. Only digits and dots expected.') % {
+                        'index': idx + 1,
+                        'filename': self.m_filename,
+                        'elem': " ".join(elem)})
+            # One BarFiller for each time signature used in the question.
+            question['fillers'] = {}
+            for num, den in question['bars']:
+                if (num, den) in question['fillers']:
+                    continue
+                filler = BarFiller(lengths, Rat(num, den))
+                if not filler.is_fillable():
+                    raise LessonfileParseException(_('Question number %(index)i in the lesson file "%(filename)s": the elements cannot fill a %(timesig)s bar exactly.') % {
+                        'index': idx + 1,
+                        'filename': self.m_filename,
+                        'timesig': "%i/%i" % (num, den)})
+                question['fillers'][num, den] = filler
 
-    def generate_random_question(self):
+    @staticmethod
+    def rat_len_of_digits(digits):
+        """
+        Return a Rat representing the length of the list of digits.
+        ["4", "8", "8"] returns Rat(2, 4)
+        """
+        ret = Rat(0, 1)
+        for d in digits:
+            ret += Duration.new_from_string(d).get_rat_value()
+        return ret
 
-        def rat_len_of_digits(digits):
-            """
-            Return a Rat representing the length of the digits.
-            "4 8 8" returns Rat(2, 4)
-            """
-            ret = Rat(0, 1)
-            for d in digits.split():
-                ret += Duration.new_from_string(d).get_rat_value()
-            return ret
+    def generate_random_question(self):
         notename = mpd.MusicalPitch.new_from_int(cfg.get_int("config/rhythm_perc")).get_octave_notename()
         self._idx = random.randint(0, len(self.m_questions) - 1)
+        question = self.m_questions[self._idx]
         # The score where the user enters his answer
         self.m_answer_score = score = elems.Score()
         score.add_staff(staff_class=elems.RhythmStaff)
-        for num, den in self.m_questions[self._idx]['bars']:
+        for num, den in question['bars']:
             score.add_bar(elems.TimeSignature(num, den))
         for bar in score.m_bars:
             bar.fill_skips(score.voice11)
         # the question being played
         self.m_question_score = score = elems.Score()
         score.add_staff(staff_class=elems.RhythmStaff)
-        for num, den in self.m_questions[self._idx]['bars']:
+        for num, den in question['bars']:
             score.add_bar(elems.TimeSignature(num, den))
-            bar = self.m_question_score.m_bars[-1]
-            total = Rat(0, 1)
-            # We try only 1000 times, since it is possible that the lesson
-            # file is badly written with too long elements or too short bars.
-            count = 0
-            max_count = 100
-            while total < bar.m_timesig.as_rat() and count < max_count:
-                elem = random.choice(self.m_questions[self._idx]['elements'])
-                if total + rat_len_of_digits(elem) > bar.m_timesig.as_rat():
-                    count += 1
-                    continue
-                total += rat_len_of_digits(elem)
-                for e in elem.split(" "):
-                    e = e.strip()
+            for elem_idx in question['fillers'][num, den].random_fill():
+                for e in question['element_notes'][elem_idx]:
                     n = elems.Note.new_from_string(u"%s%s" % (notename, e))
                     score.voice11.append(n)
-                    count = 0
-                count += 1
-
-            if count == max_count:
-                raise LessonfileException("Bad elements variable in the lessonfile. Too long elements.")
 
     def play_question(self):
         tracks = mpd.score_to_tracks(self.m_question_score)
@@ -1986,6 +2060,179 @@ class ElembuilderLessonfile(QuestionsLessonfile):
                     self.m_elements[e['name']] = e
 
 
+class ParseTreeCache(object):
+    """
+    Store the parse trees of lesson files as pickle files, so that we
+    don't have to lex and parse files that have not changed since the
+    last time the program was run. The files are named by a hash of
+    the content of the lesson file, and the trees are only used if the
+    content of the files it imports and includes are unchanged too.
+    """
+    # Increase this number if the parse tree classes change in a way
+    # that makes old pickled trees useless.
+    CACHE_FORMAT = 2
+    # prune() keep this many trees in the first directory. Each
+    # version of an edited lesson file get a new file, and so do all
+    # lesson files when the program is upgraded.
+    MAX_FILES = 1000
+
+    def __init__(self, dirs):
+        """
+        dirs is a list of directories to look for compiled trees in.
+        New trees are saved in the first directory. The others can
+        be directories with trees made by --precompile-lessonfiles.
+        """
+        self.m_dirs = dirs
+
+    def get_key(self, s, location):
+        """
+        Return the hash used to name the file the parse tree of the
+        lesson file with content s is saved in. import, rimport, include
+        and load() find files relative to the lesson file, so equal files
+        in different directories does not have equal trees.
+        """
+        if isinstance(location, unicode):
+            location = location.encode("utf-8")
+        sha1 = hashlib.sha1()
+        sha1.update("%i %s\n" % (self.CACHE_FORMAT, buildinfo.VERSION_STRING))
+        sha1.update(location + "\n")
+        sha1.update(s)
+        return sha1.hexdigest()
+
+    def load(self, key):
+        """
+        Return the parse tree saved with key. Return None if we don't
+        have it, or if any of the files it imports or includes have
+        changed since it was saved.
+        """
+        for dirname in self.m_dirs:
+            fn = os.path.join(dirname, key)
+            if not os.path.isfile(fn):
+                continue
+            try:
+                with open(fn, 'rb') as f:
+                    stamps, tree = cPickle.loads(zlib.decompress(f.read()))
+            except Exception, e:
+                logging.debug("ParseTreeCache.load: failed reading %s: %s",
+                              fn, e)
+                continue
+            if not dataparser.stamps_changed(stamps):
+                if dirname == self.m_dirs[0]:
+                    # Mark the file as recently used, for prune()
+                    try:
+                        os.utime(fn, None)
+                    except OSError:
+                        pass
+                return tree
+        return None
+
+    def prune(self, max_files=None):
+        """
+        Delete the least recently used files in the first directory,
+        so that there are at most max_files left, MAX_FILES if None.
+        Also delete temporary files left by instances of the program
+        that were killed while saving.
+        """
+        if max_files is None:
+            max_files = self.MAX_FILES
+        dirname = self.m_dirs[0]
+        if not os.path.isdir(dirname):
+            return
+        files = []
+        for fn in os.listdir(dirname):
+            fn = os.path.join(dirname, fn)
+            try:
+                mtime = os.stat(fn).st_mtime
+                if fn.endswith(".tmp") and mtime < time.time() - 3600:
+                    os.remove(fn)
+                    continue
+            except OSError:
+                continue
+            files.append((mtime, fn))
+        files.sort(reverse=True)
+        for mtime, fn in files[max_files:]:
+            try:
+                os.remove(fn)
+            except OSError, e:
+                logging.debug("ParseTreeCache.prune: failed deleting %s: %s",
+                              fn, e)
+
+    def save(self, key, dp):
+        """
+        Save the tree of the dataparser dp, if there is not a file for
+        key already.
+        """
+        fn = os.path.join(self.m_dirs[0], key)
+        try:
+            if not os.path.exists(self.m_dirs[0]):
+                os.makedirs(self.m_dirs[0])
+            # Write to a temporary file, so that other instances of the
+            # program never read a file that is half written.
+            tmp_fn = "%s.%i.tmp" % (fn, os.getpid())
+            # The trees of included files are saved in the tree of
+            # every file including them. Compressing makes the files
+            # about 4 times smaller, and costs little time when loading.
+            with open(tmp_fn, 'wb') as f:
+                f.write(zlib.compress(cPickle.dumps(
+                    (dp.m_import_stamps, dp.tree), cPickle.HIGHEST_PROTOCOL)))
+            if sys.platform == 'win32' and os.path.exists(fn):
+                os.remove(fn)
+            os.rename(tmp_fn, fn)
+        except (IOError, OSError, cPickle.PicklingError), e:
+            logging.debug("ParseTreeCache.save: failed writing %s: %s",
+                          fn, e)
+
+    def get_tree(self, s, location, really_filename):
+        """
+        Return the parse tree of the lesson file with content s. Parse
+        the file and save the tree if we don't have it in the cache.
+        """
+        key = self.get_key(s, location)
+        tree = self.load(key)
+        if tree is None:
+            dp = parse_lessonfile_string(s, location, really_filename)
+            self.save(key, dp)
+            return dp.tree
+        tree.m_filename = really_filename
+        return tree
+
+    def precompile(self, dirname):
+        """
+        Save the parse trees of all lesson files below dirname.
+        Return the number of files saved.
+        """
+        count = 0
+        for root, dirs, files in os.walk(dirname):
+            # Included files are saved in the trees of the lesson files
+            # including them, and the other directories have sound files
+            # and programs.
+            dirs[:] = [d for d in dirs if d not in NON_LESSONFILE_DIRS]
+            for fn in files:
+                filename = os.path.join(root, fn)
+                if lesson_file_header_info(filename) is None:
+                    continue
+                s = open(filename, 'rU').read()
+                location = os.path.split(filename)[0]
+                try:
+                    dp = parse_lessonfile_string(s, location, filename)
+                except Exception, e:
+                    logging.debug("ParseTreeCache.precompile: %s: %s",
+                                  filename, e)
+                    continue
+                self.save(self.get_key(s, location), dp)
+                count += 1
+        return count
+
+# The directories below lesson-files that are not for lesson files.
+NON_LESSONFILE_DIRS = ('bin', 'include', 'share')
+
+# The ParseTreeCache used by LessonfileCommon, if any.
+parsetreecache = None
+# Where --precompile-lessonfiles saves the parse trees of the standard
+# lesson files.
+precompiled_dir = os.path.join(exercises_dir, u"parsetrees")
+
+
 class InfoCache(object):
 
     class InfoCacheException(IOError):
@@ -2028,10 +2275,89 @@ class InfoCache(object):
                 if value == self.OLD_FORMAT:
                     yield filename
 
-    def __init__(self):
+    # Increase this number if the content of the dicts stored in
+    # self._data changes, so that old cache files are discarded.
+    CACHE_FORMAT = 1
+
+    def __init__(self, cache_filename=None):
+        """
+        If cache_filename is not None, the data is read from and saved
+        to that file, so that we only have to parse the lesson files
+        that have been changed since the last time the program was run.
+        """
         self._data = {}
+        # filename: (mtime, size) of files we know are not lesson files
+        self._not_lessonfiles = {}
         self._dir_mtime = {}
         self.frontpage = self.FrontPageCache()
+        self.m_cache_filename = cache_filename
+        self.m_changed = False
+        if cache_filename:
+            self.load()
+
+    @staticmethod
+    def cache_stamp():
+        """
+        The cached titles are translated, and the header parsing can
+        change between releases, so the cache is only valid if it was
+        written by the same version of the program, using the same
+        languages.
+        """
+        return (InfoCache.CACHE_FORMAT, buildinfo.VERSION_STRING,
+                tuple(i18n.langs()))
+
+    def load(self):
+        """
+        Read the cache file. Do nothing if the file does not exist, or
+        if it was written by another version of Solfege or using other
+        languages.
+        """
+        if not os.path.isfile(self.m_cache_filename):
+            return
+        try:
+            with open(self.m_cache_filename, 'rb') as f:
+                d = pickle.load(f)
+            if d['stamp'] != self.cache_stamp():
+                logging.debug("InfoCache.load: discarding outdated %s",
+                              self.m_cache_filename)
+                return
+            self._data = d['data']
+            self._not_lessonfiles = d['not_lessonfiles']
+        except Exception, e:
+            # A broken cache file is not worth more than a log message.
+            # We will just parse all files and write a new one.
+            logging.debug("InfoCache.load: failed reading %s: %s",
+                          self.m_cache_filename, e)
+
+    def save(self):
+        """
+        Write the cache file, if we have a cache file and if we have
+        parsed any files since it was loaded or last saved.
+        """
+        if not (self.m_cache_filename and self.m_changed):
+            return
+        try:
+            head = os.path.dirname(self.m_cache_filename)
+            if not os.path.exists(head):
+                os.makedirs(head)
+            with open(self.m_cache_filename, 'wb') as f:
+                pickle.dump({'stamp': self.cache_stamp(),
+                             'data': self._data,
+                             'not_lessonfiles': self._not_lessonfiles},
+                            f, pickle.HIGHEST_PROTOCOL)
+            self.m_changed = False
+        except (IOError, OSError, pickle.PicklingError), e:
+            logging.debug("InfoCache.save: failed writing %s: %s",
+                          self.m_cache_filename, e)
+
+    @staticmethod
+    def _stat(filename):
+        """
+        Return the (mtime, size) tuple we use to decide if a file has
+        changed since it was parsed.
+        """
+        st = os.stat(uri_expand(filename))
+        return st.st_mtime, st.st_size
 
     def get(self, filename, field):
         """
@@ -2042,42 +2368,57 @@ class InfoCache(object):
         assert is_uri(filename) or os.path.isabs(filename)
         if not os.path.isfile(uri_expand(filename)):
             raise InfoCache.FileNotFound(filename)
-        mtime = os.path.getmtime(uri_expand(filename))
-
-        if filename not in self._data or self._data[filename]['mtime'] < mtime:
-            self.parse_file(filename, mtime)
+        self.cond_parse_file(filename)
         return self._data[filename][field]
 
-    def parse_file(self, filename, mtime=None):
-        assert is_uri(filename) or os.path.isabs(filename)
-        p = parse_lesson_file_header(uri_expand(filename))
-        if not p:
+    def _needs_parse(self, filename, mtime, size):
+        """
+        Return True unless the cache has data for the file with the
+        same mtime and size, either as a lesson file or as a file that
+        is not a lesson file.
+        """
+        if filename in self._data:
+            return (self._data[filename]['mtime'] != mtime
+                    or self._data[filename]['size'] != size)
+        return self._not_lessonfiles.get(filename) != (mtime, size)
+
+    def cond_parse_file(self, filename):
+        """
+        Parse the file unless the cache has data for it with the same
+        mtime and size as the file has now. Raise FileNotLessonfile
+        if we already know that the file is not a lesson file.
+        """
+        mtime, size = self._stat(filename)
+        if self._needs_parse(filename, mtime, size):
+            self.parse_file(filename, mtime, size)
+        elif filename not in self._data:
             raise self.FileNotLessonfile(filename)
-        try:
-            try:
-                module = p.header['module'].m_name
-            except AttributeError:
-                # If the module name is the same as a word defined in predef
-                module = p.header['module']
-            self._data[filename] = {
-                'title': p.header.get('title', 'error: no title in file'),
-                'module': module,
-                'test': p.header.get('test', None),
-                'test_requirement': p.header.get('test_requirement', None),
-                'mtime': mtime if mtime else os.path.getmtime(uri_expand(filename)),
-                'replaces': p.header.get('replaces', []),
-        }
-        except KeyError:
-            logging.debug("InfoCache.parse_file: FileNotLessonfile(%s)", filename)
-            print "file not lessonfile:", filename
+
+    def parse_file(self, filename, mtime=None, size=None):
+        assert is_uri(filename) or os.path.isabs(filename)
+        if mtime is None or size is None:
+            mtime, size = self._stat(filename)
+        self._store(filename, lesson_file_header_info(filename), mtime, size)
+
+    def _store(self, filename, info, mtime, size):
+        """
+        Put info, as returned by lesson_file_header_info, into the cache.
+        Raise FileNotLessonfile if info is None.
+        """
+        self.m_changed = True
+        if info is None:
+            self._data.pop(filename, None)
+            self._not_lessonfiles[filename] = (mtime, size)
             raise self.FileNotLessonfile(filename)
-        if not self._data[filename]['title']:
-            self._data[filename]['title'] = "error: empty string as title in '%s'" % filename
+        info['mtime'] = mtime
+        info['size'] = size
+        self._data[filename] = info
+        self._not_lessonfiles.pop(filename, None)
 
     def iter_parse_all_files(self):
         """
-        Parse the files and put then in the cache.
-        yield filename.
+        Parse the files that have changed since they were put in the
+        cache, and yield the filename of all lesson files.
         """
         logging.debug("iter_parse_all_files()")
         for filename in self._iter_files(
@@ -2089,8 +2430,9 @@ class InfoCache(object):
     def _iter_files(self, *path):
         """
         Parse and put into the cache all lesson files in the directories
-        in the list path and yield the file names of the files that are
-        parsed and found to be lesson files.
+        in the list path that have changed since they were put in the
+        cache, and yield the file names of the files found to be lesson
+        files.
         """
         for directory in path:
             if os.path.isdir(directory):
@@ -2101,18 +2443,109 @@ class InfoCache(object):
                         continue
                     filename = mk_uri(filename)
                     try:
-                        self.parse_file(filename)
+                        self.cond_parse_file(filename)
                     except self.FileNotLessonfile:
                         continue
                     yield filename
 
-    def parse_all_files(self, when_idle):
+    def _iter_all_filenames(self):
+        """
+        Yield the file names of all the files iter_parse_all_files
+        will check.
+        """
+        directory = os.path.join(exercises_dir, u"lesson-files")
+        if os.path.isdir(directory):
+            for fn in os.listdir(directory):
+                filename = os.path.join(directory, fn)
+                if os.path.isfile(filename):
+                    yield mk_uri(filename)
+        for fn in glob.glob(os.path.join(filesystem.user_data(), u"exercises", u"*/*/*")):
+            if os.path.isfile(fn):
+                yield fn
+
+    def _start_parallel_parse(self, processes):
+        """
+        Start parsing the files that need parsing in a pool of worker
+        processes. Return a tuple (pool, results, stats, filenames):
+        results is the iterator returned by Pool.imap_unordered, stats
+        is a dict mapping the file names to (mtime, size), and filenames
+        lists all the files checked. pool is None if no files need parsing.
+        """
+        filenames = list(self._iter_all_filenames())
+        stats = {}
+        for filename in filenames:
+            stats[filename] = self._stat(filename)
+        todo = [fn for fn in filenames if self._needs_parse(fn, *stats[fn])]
+        logging.debug("_start_parallel_parse: %i of %i files need parsing",
+                      len(todo), len(filenames))
+        if not todo:
+            return None, iter([]), stats, filenames
+        if not processes:
+            processes = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_lesson_file_header_worker, todo,
+                                      len(todo) // (processes * 4) + 1)
+        pool.close()
+        return pool, results, stats, filenames
+
+    def _store_result(self, result, stats):
+        filename, info = result
+        try:
+            self._store(filename, info, *stats[filename])
+        except self.FileNotLessonfile:
+            pass
+
+    def iter_parse_all_files_parallel(self, processes=None):
         """
-        Parse all standard lesson files and the user_lessonfiles.
-        Will not check if reparse is necessary.
+        Do the same as iter_parse_all_files, but spread the parsing over
+        a pool of worker processes. processes is the number of worker
+        processes, None means one per cpu. The file names are yielded
+        when all files are parsed.
         """
-        logging.debug("parse_all_files(when_idle=%s)", when_idle)
-        if when_idle:
+        pool, results, stats, filenames = self._start_parallel_parse(processes)
+        try:
+            for result in results:
+                self._store_result(result, stats)
+        finally:
+            if pool:
+                pool.terminate()
+        for filename in filenames:
+            if filename in self._data:
+                yield filename
+
+    def parse_all_files(self, when_idle, processes=0):
+        """
+        Parse all standard lesson files and the user_lessonfiles that
+        have changed since they were put in the cache, and save the
+        cache when done.
+        If processes is not 0, the files are parsed by that many worker
+        processes, and with when_idle=True the gui only has to collect
+        the results.
+        """
+        logging.debug("parse_all_files(when_idle=%s, processes=%s)", when_idle, processes)
+        if processes and when_idle:
+            pool, results, stats, filenames = self._start_parallel_parse(processes)
+
+            def on_timeout_collect():
+                try:
+                    while True:
+                        self._store_result(results.next(timeout=0), stats)
+                except multiprocessing.TimeoutError:
+                    return True
+                except StopIteration:
+                    logging.debug("parse_all_files(...) done.")
+                    if pool:
+                        pool.join()
+                    pt.Identifier.check_ns = True
+                    self.save()
+                    return False
+            GObject.timeout_add(50, on_timeout_collect)
+
+        elif processes:
+            list(self.iter_parse_all_files_parallel(processes))
+            self.save()
+
+        elif when_idle:
             self._lessonfiles_iterator = self.iter_parse_all_files()
 
             def on_idle_parse():
@@ -2121,14 +2554,14 @@ class InfoCache(object):
                     return True
                 except StopIteration:
                     logging.debug("parse_all_files(...) done.")
-                    import time
-                    print "all files parsed:", time.time() - start_time
                     pt.Identifier.check_ns = True
+                    self.save()
                     return False
             GObject.idle_add(on_idle_parse)
 
         else:
             list(self.iter_parse_all_files())
+            self.save()
 
     def update_modified_files(self):
         self.cond_parse_dir(filesystem.user_lessonfiles())
@@ -2154,15 +2587,11 @@ class InfoCache(object):
                 if not os.path.isfile(fn):
                     continue
                 fn = mk_uri(fn)
-                file_mtime = os.path.getmtime(uri_expand(fn))
-
-                if fn not in self._data or file_mtime > self._data[fn]['mtime']:
-                    try:
-                        logging.debug(" will parse %s. in data:%s", fn, fn in self._data)
-                        self.parse_file(fn, file_mtime)
-                    except self.InfoCacheException:
-                        logging.debug(" exception, not parsed: %s", fn)
-                        pass
+                try:
+                    self.cond_parse_file(fn)
+                except self.InfoCacheException:
+                    logging.debug(" exception, not parsed: %s", fn)
+                    pass
 
     def iter_user_files(self, only_user_collection=False):
         """
@@ -2182,7 +2611,7 @@ class InfoCache(object):
 
             if os.path.isfile(fn):
                 try:
-                    self.parse_file(fn)
+                    self.cond_parse_file(fn)
                     yield fn
                 except self.InfoCacheException:
                     continue
@@ -2211,10 +2640,52 @@ def parse_lesson_file_header(filename):
     check_ns = pt.Identifier.check_ns
     pt.Identifier.check_ns = False
     try:
-        p.get_lessonfile(m.group(), None)
+        # The header snippets should not fill up the parse tree cache.
+        p.get_lessonfile(m.group(), None, use_cache=False)
     except dataparser.DataparserException:
         return None
     finally:
         pt.Identifier.check_ns = check_ns
     return p
 
+def lesson_file_header_info(filename):
+    """
+    Return a dict with the header variables InfoCache store for the
+    lesson file filename, that is either a solfege: uri or an absolute
+    file name. Return None if the file is not a lesson file.
+    """
+    p = parse_lesson_file_header(uri_expand(filename))
+    if not p:
+        return None
+    try:
+        try:
+            module = p.header['module'].m_name
+        except AttributeError:
+            # If the module name is the same as a word defined in predef
+            module = p.header['module']
+        info = {
+            'title': p.header.get('title', 'error: no title in file'),
+            'module': module,
+            'test': p.header.get('test', None),
+            'test_requirement': p.header.get('test_requirement', None),
+            'replaces': p.header.get('replaces', []),
+        }
+    except KeyError:
+        logging.debug("lesson_file_header_info: not lessonfile: %s", filename)
+        return None
+    if not info['title']:
+        info['title'] = "error: empty string as title in '%s'" % filename
+    return info
+
+
+def _lesson_file_header_worker(filename):
+    """
+    Run by the worker processes started by
+    InfoCache._start_parallel_parse. Return (filename, info).
+    """
+    try:
+        return filename, lesson_file_header_info(filename)
+    except (IOError, OSError), e:
+        logging.debug("_lesson_file_header_worker: %s: %s", filename, e)
+        return filename, None
+
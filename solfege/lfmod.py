@@ -22,6 +22,7 @@ sys.path.append(".")
 
 import re
 
+from solfege import i18n
 import solfege.parsetree as pt
 from solfege.dataparser import Question
 
@@ -34,6 +35,40 @@ class LfMod(object):
         self.m_globals = builtins.copy()
         self.m_blocklists = {}
 
+    def copy(self, builtins):
+        """
+        Return a copy of the module that use builtins. The blocks, lists
+        and imported modules are copied, so the copy can be changed
+        without changing this module. Other values, like strings and
+        music objects, are shared.
+        """
+        memo = {}
+        def copy_value(value):
+            if id(value) in memo:
+                return memo[id(value)]
+            if isinstance(value, LfMod):
+                retval = value.copy(builtins)
+            elif isinstance(value, dict):
+                retval = value.__class__()
+                memo[id(value)] = retval
+                for k, v in value.iteritems():
+                    dict.__setitem__(retval, k, copy_value(v))
+            elif isinstance(value, list):
+                retval = []
+                memo[id(value)] = retval
+                retval.extend([copy_value(v) for v in value])
+            else:
+                return value
+            memo[id(value)] = retval
+            return retval
+        mod = LfMod(builtins)
+        for name, value in self.m_globals.iteritems():
+            if self.m_builtins.get(name) is not value:
+                mod.m_globals[name] = copy_value(value)
+        for blocktype, blocks in self.m_blocklists.iteritems():
+            mod.m_blocklists[blocktype] = copy_value(blocks)
+        return mod
+
     def dump(self):
         import pprint
         print "Globals:"
@@ -53,7 +88,7 @@ def do_assignment(mod, statement, local_namespace, global_namespace, in_header,
     and functions.
     """
     if isinstance(statement.right, pt.Program):
-        local_namespace[unicode(statement.left)] = parse_tree_interpreter(statement.right, mod.m_builtins)
+        local_namespace[unicode(statement.left)] = library_interpreter(statement.right, mod.m_builtins)
 
     else:
         m = translation_re.match(unicode(statement.left))
@@ -143,3 +178,21 @@ def parse_tree_interpreter(tree, builtins=None):
     do_module(tree, mod)
     return mod
 
+
+def library_interpreter(tree, builtins):
+    """
+    Interpret the parse tree of a library loaded by 'import' or 'rimport'.
+    The parse tree is shared by all lesson files importing the library,
+    so we keep the interpreted module on the tree, and give each
+    importer its own copy of it.
+    """
+    try:
+        # Strings are translated when the tree is interpreted.
+        key = (tuple(i18n.langs()), frozenset(builtins.iteritems()))
+    except TypeError:
+        # Unhashable builtins. Don't cache.
+        return parse_tree_interpreter(tree, builtins)
+    cache = tree.__dict__.setdefault('_interpreted', {})
+    if key not in cache:
+        cache[key] = parse_tree_interpreter(tree, builtins)
+    return cache[key].copy(builtins)
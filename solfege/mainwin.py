@@ -790,8 +790,7 @@ class MainWin(Gtk.Window, cfg.ConfigUtils):
 
         solfege.app.reset_exercise()
         solfege.app.m_options.profile = prof
-        solfege.db.conn.commit()
-        solfege.db.conn.close()
+        solfege.db.close()
 
         if prof == None:
             prof = ''
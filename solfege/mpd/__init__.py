@@ -38,6 +38,7 @@ from solfege.mpd.rat import Rat
 from solfege.mpd.track import Track, PercussionTrack
 from solfege.mpd._exceptions import MpdException
 from solfege.mpd.performer import score_to_tracks
+from solfege.mpd.scorecache import score_cache
 try:
     # solfege.app_running is set in solfege/startup.py, but will be
     # unset if run from some of the build scripts. This way we can
@@ -56,10 +57,10 @@ def music_to_tracklist(music, start=None, end=None):
     return a list of tracks, where track[0] use only channel 0,
     track[1] only use channel 1 etc.
     """
-    return score_to_tracks(parse_to_score_object(music), start, end)
+    return score_cache.get_tracks(music, start, end)
 
 def music_to_track(music, start=None, end=None):
-    tracklist = score_to_tracks(parse_to_score_object(music), start, end)
+    tracklist = score_cache.get_tracks(music, start, end)
     track = tracklist[0]
     for x in range(1, len(tracklist)):
         track.merge_with(tracklist[x])
@@ -24,7 +24,9 @@ from __future__ import absolute_import
 # noteheads. So I think it should be given the created NoteHeadEngravers
 # and then shift the notes.
 
+import bisect
 import copy
+import heapq
 import re
 import weakref
 
@@ -132,6 +134,67 @@ class TimeSignature(object):
     def __repr__(self):
         return "<TimeSignature %s/%s>" % (self.m_num, self.m_den)
 
+class TimeDict(dict):
+    """
+    A dict with timeposes as keys, that also keep a sorted list of the
+    keys, so that the Voice and Staff code don't have to sort the keys
+    every time it need them in order. Keys added after the last key are
+    appended, and others are inserted using bisect.
+    """
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.m_keys = None
+    def __setitem__(self, key, value):
+        if self.m_keys is not None and key not in self:
+            if not self.m_keys or self.m_keys[-1] < key:
+                self.m_keys.append(key)
+            else:
+                bisect.insort(self.m_keys, key)
+        dict.__setitem__(self, key, value)
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        if self.m_keys is not None:
+            del self.m_keys[bisect.bisect_left(self.m_keys, key)]
+    def _changed(self):
+        self.m_keys = None
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+    def pop(self, *args):
+        self._changed()
+        return dict.pop(self, *args)
+    def popitem(self):
+        self._changed()
+        return dict.popitem(self)
+    def update(self, *args, **kwargs):
+        self._changed()
+        dict.update(self, *args, **kwargs)
+    def clear(self):
+        self._changed()
+        dict.clear(self)
+    def copy(self):
+        return TimeDict(self)
+    def __reduce__(self):
+        return (self.__class__, (), None, None, self.iteritems())
+    def sorted_keys(self):
+        """
+        Return the sorted list of keys. The caller must not modify it.
+        """
+        if self.m_keys is None:
+            self.m_keys = sorted(dict.keys(self))
+        return self.m_keys
+    def index(self, key):
+        """
+        Return the position of key in sorted_keys(). Raise ValueError
+        if key is not in the dict.
+        """
+        v = self.sorted_keys()
+        i = bisect.bisect_left(v, key)
+        if i == len(v) or v[i] != key:
+            raise ValueError(key)
+        return i
+
 class HasParent(object):
     def __init__(self, parent):
         self.set_parent(parent)
@@ -234,6 +297,17 @@ class Stem(list):
         self.m_tupletinfo = None
     def __repr__(self):
         return "<Stem %s %s>" % (str(list(self)), self.m_stemdir)
+    def copy(self, parent):
+        """
+        Return a copy of this Stem, belonging to parent, with copies of
+        the notes.
+        """
+        ret = copy.copy(self)
+        ret[:] = [copy.deepcopy(n) for n in self]
+        ret.w_parent = weakref.ref(parent)
+        for note in ret:
+            note.w_parent = weakref.ref(ret)
+        return ret
 
 
 class Voice(HasParent):
@@ -260,15 +334,28 @@ class Voice(HasParent):
         HasParent.__init__(self, parent)
         # The timelen of the Voice
         self.m_length = Rat(0, 1)
-        self.m_tdict = {}
-    def copy(self, parent):
+        self.m_tdict = TimeDict()
+    def copy(self, parent, deep=False):
         """
         Return a copy of this Voice object. We make a copy of the dict and
         the m_length variable, but the dict revers to the same object.
+        If deep is True, the stems, notes, rests and skips are copied
+        too, so that the copy can be changed without changing this voice.
         """
         ret = Voice(parent)
         ret.m_length = Rat(self.m_length.m_num, self.m_length.m_den)
-        ret.m_tdict = self.m_tdict.copy()
+        if not deep:
+            ret.m_tdict = self.m_tdict.copy()
+            return ret
+        for timepos, entry in self.m_tdict.iteritems():
+            entry = dict(entry)
+            elem = entry['elem']
+            if isinstance(elem, Stem):
+                entry['elem'] = elem.copy(ret)
+            else:
+                entry['elem'] = [copy.deepcopy(elem[0])]
+                entry['elem'][0].w_parent = weakref.ref(ret)
+            ret.m_tdict[timepos] = entry
         return ret
     def append(self, elem, stemdir=const.BOTH):
         """
@@ -441,35 +528,17 @@ class Voice(HasParent):
         """
         Return a sorted list of all timeposes in bar in this Voice
         """
-        v = sorted(self.m_tdict.keys())
-        try:
-            # this is the fastest way to set start_i
-            start_i = v.index(bar.m_timepos)
-        except ValueError:
-            # but if code has recently removed the timepos, then we have to
-            # search for it.
-            start_i = 0
-            while start_i < len(v) and v[start_i] < bar.m_timepos:
-                start_i += 1
-        if start_i >= len(v) or v[start_i] >= bar.end():
-            start_i = None
-        try:
-            end_i = v.index(bar.end())
-        except ValueError:
-            end_i = None
-        if start_i == None:
-            return []
-        elif end_i:
-            return v[start_i:end_i]
-        else:
-            return v[start_i:]
+        v = self.m_tdict.sorted_keys()
+        end = bar.end()
+        start_i = bisect.bisect_left(v, bar.m_timepos)
+        return v[start_i:bisect.bisect_left(v, end, start_i)]
     def get_time_pitch_list(self, bpm):
         """
         Return a list of tuples (pitch, duration-in-seconds) of the tones
         and rests in the voice. -1 is used for pitch for rests.
         """
         ret = []
-        for timepos in sorted(self.m_tdict.keys()):
+        for timepos in self.m_tdict.sorted_keys():
             # stem is a Stem or [Rest]
             stem = self.m_tdict[timepos]['elem']
             if len(stem) != 1:
@@ -648,23 +717,22 @@ class Voice(HasParent):
         timepos in the voice.
         """
         assert timepos in self.m_tdict
-        v = sorted(self.m_tdict.keys())
-        i = v.index(timepos)
+        i = self.m_tdict.index(timepos)
         if i > 0:
-            return v[i - 1]
+            return self.m_tdict.sorted_keys()[i - 1]
     def get_next_timepos(self, timepos):
         """
         Return the next timepos. Return None if this is the last timepos
         in the Voice.
         """
         assert timepos in self.m_tdict
-        v = sorted(self.m_tdict.keys())
-        i = v.index(timepos)
+        v = self.m_tdict.sorted_keys()
+        i = self.m_tdict.index(timepos)
         if i +1 < len(v):
             return v[i + 1]
     def get_timelist(self):
         retval = []
-        for timepos in sorted(self.m_tdict.keys()):
+        for timepos in self.m_tdict.sorted_keys():
             if isinstance(self.m_tdict[timepos]['elem'][0], Rest):
                 if retval[-1][0] == False:
                     retval[-1][1] += self.m_tdict[timepos]['elem'][0].m_duration.get_rat_value()
@@ -691,8 +759,7 @@ class Voice(HasParent):
         """
         return self.m_tdict[timepos]['elem'][0].m_duration.get_rat_value() + timepos == self.w_score().get_bar_at(timepos).end()
     def __getitem__(self, idx):
-        v = sorted(self.m_tdict)
-        return self.m_tdict[v[idx]]
+        return self.m_tdict[self.m_tdict.sorted_keys()[idx]]
 
 class Bar(object):
     def __init__(self, timesig, timepos):
@@ -858,11 +925,16 @@ class _StaffCommon(HasParent):
         # I think the only things stored in Staff.m_tdict are "clef" and
         # "keysig". We don't store time signature changes where, since
         # Score.m_bars take care about that.
-        self.m_tdict = {}
-    def copy(self, parent):
+        self.m_tdict = TimeDict()
+    def copy(self, parent, deep=False):
         staff = self.__class__(parent)
-        staff.m_voices = [v.copy(staff) for v in self.m_voices]
-        staff.m_tdict = self.m_tdict.copy()
+        staff.m_voices = [v.copy(staff, deep) for v in self.m_voices]
+        if deep:
+            staff.m_tdict = TimeDict()
+            for timepos, entry in self.m_tdict.iteritems():
+                staff.m_tdict[timepos] = dict(entry)
+        else:
+            staff.m_tdict = self.m_tdict.copy()
         return staff
     def add_voice(self):
         self.m_voices.append(Voice(self))
@@ -875,10 +947,12 @@ class _StaffCommon(HasParent):
         staff because of Clefs and TimeSignatures, and then all timeposes
         in the voices.
         """
-        timeposes = set()
-        for has_timeposes in self.m_voices + [self]:
-            [timeposes.add(t) for t in has_timeposes.m_tdict]
-        return sorted(timeposes)
+        timeposes = []
+        for t in heapq.merge(*[has_timeposes.m_tdict.sorted_keys()
+                               for has_timeposes in self.m_voices + [self]]):
+            if not timeposes or timeposes[-1] != t:
+                timeposes.append(t)
+        return timeposes
     def get_timelist(self):
         data = {}
         for voice_idx, voice in enumerate(self.m_voices):
@@ -970,10 +1044,18 @@ class Score(object):
     def __init__(self):
         self.m_staffs = []
         self.m_bars = []
-    def copy(self):
+        # The m_timepos of the bars in m_bars, for get_bar_at
+        self.m_bar_starts = []
+    def copy(self, deep=False):
+        """
+        Return a copy of the score. If deep is False, the copy share
+        the music elements with this score, so only staffs, voices
+        and bars can be added to the copy without changing this score.
+        """
         score = Score()
-        score.m_staffs = [s.copy(score) for s in self.m_staffs]
+        score.m_staffs = [s.copy(score, deep) for s in self.m_staffs]
         score.m_bars = copy.deepcopy(self.m_bars)
+        score.create_shortcuts()
         return score
     def add_staff(self, staff_class=Staff):
         self.m_staffs.append(staff_class(self))
@@ -1026,6 +1108,17 @@ class Score(object):
         Return the bar timepos is within. Raise IndexError if timepos
         is after the last bar.
         """
+        if len(self.m_bar_starts) != len(self.m_bars):
+            self.m_bar_starts = [bar.m_timepos for bar in self.m_bars]
+        i = bisect.bisect_right(self.m_bar_starts, timepos) - 1
+        if i >= 0 and self.m_bars[i].m_timepos == self.m_bar_starts[i]:
+            if timepos < self.m_bars[i].end():
+                return self.m_bars[i]
+            if i == len(self.m_bars) - 1:
+                raise IndexError(timepos)
+        # The bars have been changed after m_bar_starts was made, or
+        # timepos is not within any bar.
+        self.m_bar_starts = [bar.m_timepos for bar in self.m_bars]
         for bar in self.m_bars:
             if bar.m_timepos <= timepos < bar.end():
                 return bar
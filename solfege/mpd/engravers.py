@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import absolute_import
+import bisect
 import operator
 
 from gi.repository import Gtk
@@ -656,48 +657,113 @@ class SkipEngraver(Engraver):
 class _StaffCommon(list):
     def __init__(self, staff, last_timepos):
         """
-        Create engraver objects for the staff, one timepos at the time.
-        Append them to self, and add refs to them in the m_engravers dict
-        to access them by timepos and type.
+        Prepare to create engraver objects for the staff. ScoreContext
+        will call engrave_bar for each bar, and the engravers will be
+        added to self when it calls update_list.
+
+        The m_engravers dict give access to the engravers by timepos
+        and type. The m_bar_* lists keep for each bar the state when we
+        started engraving it, the engravers created, the barlines
+        ScoreContext added and the timeposes the bar has in m_engravers,
+        so that one bar can be engraved again without doing the bars
+        before it.
         """
         list.__init__(self)
         self.m_label = getattr(staff, 'm_label', None)
+        self.m_staff = staff
+        self.m_last_timepos = last_timepos
         self.m_engravers = {}
-        # When joining two empty Scores with Score.concat2, we need to return
-        # to avoid IndexErrors further down this method.
-        if not staff.w_parent().m_bars:
-            return
-        # make a set of all timeposes in the staffs voices
-        t = set()
-        # We need to add the timepos of the beginning of all bars, since
-        # all staffs has to display the time signature if it changes. Normally
-        # it is not necessary to do this here, since staff.m_tdict will have
-        # the timepos. But it is necessary for Scores created by Score.concat2
-        [t.add(b.m_timepos) for b in staff.w_parent().m_bars]
-        # Then we add the timepos of all notes and rests
-        [t.add(tp) for tp in staff.m_tdict]
-        for voice in staff.m_voices:
-            [t.add(tp) for tp in voice.m_tdict]
-        if last_timepos is None:
-            # display all notes
-            timeposes = sorted(t)
-        else:
-            timeposes = [x for x in sorted(t) if x < last_timepos]
-        #
-        clef = None
-        keysig = ("c", "major")
-        self.refill_accidentals_info(keysig)
-        for voice in staff.m_voices:
-            # tmp variable needed to keep track of the beams. Deleted at method exit.
+        num_bars = len(staff.w_parent().m_bars)
+        self.m_bar_states = [None] * num_bars
+        self.m_bar_engravers = [[] for x in range(num_bars)]
+        self.m_bar_barlines = [[] for x in range(num_bars)]
+        self.m_bar_timeposes = [[] for x in range(num_bars)]
+        # Beams created since the last call to layout_beams.
+        self.m_beams = []
+        self.reset()
+    def reset(self):
+        """
+        Set the state used when we start engraving the first bar.
+        """
+        self.m_clef = None
+        self.m_keysig = ("c", "major")
+        self.m_props = {
+            'hide-timesignature': False,
+        }
+        self.m_bar_idx = 0
+        self.refill_accidentals_info(self.m_keysig)
+        for voice in self.m_staff.m_voices:
+            # tmp variable needed to keep track of the beams.
             voice.m_beam = None
             voice.m_ties = {}
             # tuplet
             voice.m_tuplet = None
-        bar_idx = 0
-        props = {
-            'hide-timesignature': False,
-        }
-        beams = []
+    def is_clean(self):
+        """
+        Return True if no beams, ties or tuplets are open, so that
+        the engravers of the next bar does not depend on the engravers
+        of the bars before it.
+        """
+        for voice in self.m_staff.m_voices:
+            if voice.m_beam or voice.m_ties or voice.m_tuplet:
+                return False
+        return True
+    def get_state(self):
+        return (self.m_clef, self.m_keysig, dict(self.m_props),
+                self.m_bar_idx, self.is_clean())
+    def set_state(self, state):
+        """
+        Continue engraving from a state returned by get_state. We can
+        only do this if the state is clean.
+        """
+        assert state[4]
+        self.reset()
+        self.m_clef, self.m_keysig, props, self.m_bar_idx = state[:4]
+        self.m_props = dict(props)
+    def get_bar_timeposes(self, bar_idx):
+        """
+        Return a sorted list of the timeposes in bar bar_idx that we
+        need to engrave. Music before the first bar is engraved with the
+        first bar, and music after the last bar with the last bar.
+        """
+        staff = self.m_staff
+        bars = staff.w_parent().m_bars
+        start = bars[bar_idx].m_timepos if bar_idx > 0 else None
+        end = bars[bar_idx + 1].m_timepos if bar_idx < len(bars) - 1 else None
+        # We need to add the timepos of the beginning of the bar, since
+        # all staffs has to display the time signature if it changes.
+        # Normally it is not necessary to do this here, since
+        # staff.m_tdict will have the timepos. But it is necessary for
+        # Scores created by Score.concat2
+        t = set([bars[bar_idx].m_timepos])
+        # Then we add the timepos of all notes and rests
+        for tdict in [staff.m_tdict] + [voice.m_tdict for voice in staff.m_voices]:
+            v = tdict.sorted_keys()
+            i = 0 if start is None else bisect.bisect_left(v, start)
+            t.update(v[i:len(v) if end is None else bisect.bisect_left(v, end, i)])
+        if self.m_last_timepos is None:
+            # display all notes
+            return sorted(t)
+        return [x for x in sorted(t) if x < self.m_last_timepos]
+    def engrave_bar(self, idx):
+        """
+        Create the engravers for bar number idx, replacing any engravers
+        the bar already has. The state must be the state at the
+        beginning of the bar, that is after engraving the bar before
+        it, or set by set_state.
+        """
+        for timepos in self.m_bar_timeposes[idx]:
+            if timepos in self.m_engravers:
+                del self.m_engravers[timepos]
+        self.m_bar_states[idx] = self.get_state()
+        self.m_bar_engravers[idx] = seg = []
+        self.m_bar_timeposes[idx] = timeposes = self.get_bar_timeposes(idx)
+        staff = self.m_staff
+        clef = self.m_clef
+        keysig = self.m_keysig
+        props = self.m_props
+        bar_idx = self.m_bar_idx
+        beams = self.m_beams
         for timepos in timeposes:
             if (bar_idx < len(staff.w_parent().m_bars) -1
                   and timepos == staff.w_parent().m_bars[bar_idx + 1].m_timepos):
@@ -720,28 +786,26 @@ class _StaffCommon(list):
             if timepos in staff.m_tdict and 'clef' in staff.m_tdict[timepos]:
                 clef = staff.m_tdict[timepos]['clef']
                 eng['clef'] = ClefEngraver(staff.m_tdict[timepos]['clef'])
-                self.append(eng['clef'])
+                seg.append(eng['clef'])
             #################
             # Key signature #
             #################
             if timepos in staff.m_tdict and 'keysig' in staff.m_tdict[timepos]:
                 eng['keysig'] = KeySignatureEngraver(keysig,
                     staff.m_tdict[timepos]['keysig'], clef)
-                self.append(eng['keysig'])
+                seg.append(eng['keysig'])
                 keysig = staff.m_tdict[timepos]['keysig']
                 self.refill_accidentals_info(keysig)
             ##################
             # Time signature #
             ##################
-            if not staff.w_parent().m_bars:
-                return
             if (props['hide-timesignature'] == False
                 and ((timepos == staff.w_parent().m_bars[bar_idx].m_timepos
                 and bar_idx > 0
                 and staff.w_parent().m_bars[bar_idx].m_timesig
                  != staff.w_parent().m_bars[bar_idx - 1].m_timesig) or timepos == elems.TimeSignature(0, 1))):
                 eng['timesig'] = TimeSignatureEngraver(staff.w_parent().m_bars[bar_idx].m_timesig)
-                self.append(eng['timesig'])
+                seg.append(eng['timesig'])
             ###############
             # Accidentals #
             ###############
@@ -760,8 +824,8 @@ class _StaffCommon(list):
                         if e is not None:
                             v[clef.steps_to_ylinepos(elem.m_musicalpitch.steps())] = e
                 if v:
-                    self.append(AccidentalsEngraver(v))
-                    eng['accidentals'] = self[-1]
+                    seg.append(AccidentalsEngraver(v))
+                    eng['accidentals'] = seg[-1]
             ############################################
             # Create stems, noteheads and ledger lines #
             ############################################
@@ -777,7 +841,7 @@ class _StaffCommon(list):
                         if elem.m_beaminfo == 'start':
                             voice.m_beam = BeamEngraver()
                             beams.append(voice.m_beam)
-                            self.append(voice.m_beam)
+                            seg.append(voice.m_beam)
                         # If the tuplet contain only one tone, then elem.m_tupletinfo == 'end' and
                         # voice.m_tuplet will be None
                         if elem.m_tupletinfo == 'start' or (elem.m_tupletinfo == 'end' and voice.m_tuplet == None):
@@ -786,11 +850,11 @@ class _StaffCommon(list):
                         eng['elem'] = []
                     if isinstance(voice.m_tdict[timepos]['elem'][0], elems.Rest):
                         e = RestEngraver(0, voice.m_tdict[timepos]['elem'][0].m_duration)
-                        self.append(e)
+                        seg.append(e)
                         eng['elem'].append(e)
                     elif isinstance(elem[0], elems.Skip):
                         e = SkipEngraver(elem[0].m_duration)
-                        self.append(e)
+                        seg.append(e)
                         eng['elem'].append(e)
                     elif not isinstance(voice.m_tdict[timepos]['elem'][0], elems.Skip):
                         elist, stemengraver = self.create_notehead_engraver(clef, voice.m_tdict[timepos]['elem'])
@@ -798,11 +862,11 @@ class _StaffCommon(list):
                             if note.m_tieinfo == 'start':
                                 voice.m_ties[note.m_musicalpitch.get_octave_notename()] = engraver
                             elif note.m_tieinfo == 'go':
-                                self.append(TieEngraver(voice.m_ties[note.m_musicalpitch.get_octave_notename()], engraver))
+                                seg.append(TieEngraver(voice.m_ties[note.m_musicalpitch.get_octave_notename()], engraver))
                                 del voice.m_ties[note.m_musicalpitch.get_octave_notename()]
                                 voice.m_ties[note.m_musicalpitch.get_octave_notename()] = engraver
                             elif note.m_tieinfo == 'end':
-                                self.append(TieEngraver(voice.m_ties[note.m_musicalpitch.get_octave_notename()], engraver))
+                                seg.append(TieEngraver(voice.m_ties[note.m_musicalpitch.get_octave_notename()], engraver))
                                 del voice.m_ties[note.m_musicalpitch.get_octave_notename()]
                         if voice.m_beam:
                             stemengraver.m_is_beamed = True
@@ -811,13 +875,13 @@ class _StaffCommon(list):
                             voice.m_tuplet.add_stem(stemengraver)
                         eng['elem'].extend(elist)
                         eng['elem'].append(stemengraver)
-                        self.extend(elist)
-                        self.append(stemengraver)
+                        seg.extend(elist)
+                        seg.append(stemengraver)
                     if isinstance(elem, elems.Stem):
                         if elem.m_beaminfo == 'end':
                             voice.m_beam = None
                         if elem.m_tupletinfo == 'end':
-                            self.append(voice.m_tuplet)
+                            seg.append(voice.m_tuplet)
                             voice.m_tuplet = None
                 # Ledger lines
                 for elem in voice.m_tdict[timepos]['elem']:
@@ -838,12 +902,50 @@ class _StaffCommon(list):
             if yline_up or yline_down:
                 e = LedgerLineEngraver(yline_up, yline_down)
                 eng['elem'].append(e)
-                self.append(e)
-        # We do this here instead of further up where we check for'
-        # if m_beaminfo == 'end' because we need to do do_layout for beams
-        # even when we only want to engrave the first note in a beam.
-        for b in beams:
+                seg.append(e)
+        self.m_clef = clef
+        self.m_keysig = keysig
+        self.m_bar_idx = bar_idx
+    def layout_beams(self):
+        # We do this after engraving instead of further up where we
+        # check for if m_beaminfo == 'end' because we need to do
+        # do_layout for beams even when we only want to engrave the first
+        # note in a beam.
+        for b in self.m_beams:
             b.do_layout()
+        self.m_beams = []
+    def add_barline(self, bar_idx, timepos, barline):
+        self.m_engravers.setdefault(timepos, {})['barline'] = barline
+        self.m_bar_barlines[bar_idx].append((timepos, barline))
+    def remove_barlines(self, bar_idx):
+        for timepos, barline in self.m_bar_barlines[bar_idx]:
+            if self.m_engravers.get(timepos, {}).get('barline') is barline:
+                del self.m_engravers[timepos]['barline']
+        self.m_bar_barlines[bar_idx] = []
+    def shift_bar(self, bar_idx, delta):
+        """
+        Move the engravers of the bar delta pixels to the right.
+        """
+        timeposes = set(self.m_bar_timeposes[bar_idx])
+        timeposes.update([t for t, e in self.m_bar_barlines[bar_idx]])
+        for timepos in timeposes:
+            for key, eng in self.m_engravers[timepos].items():
+                if key == 'elem':
+                    for e in eng:
+                        e.m_xpos += delta
+                else:
+                    eng.m_xpos += delta
+    def update_list(self):
+        """
+        Fill self with the engravers of all bars. The barlines are
+        added last.
+        """
+        v = []
+        for seg in self.m_bar_engravers:
+            v.extend(seg)
+        for seg in self.m_bar_barlines:
+            v.extend([e for t, e in seg])
+        self[:] = v
 
 
 class StaffContext(_StaffCommon):
@@ -917,30 +1019,136 @@ class RhythmStaffContext(_StaffCommon):
         return [notehead], StemEngraver([notehead], elem[0].m_duration, elem.m_stemdir, False)
 
 class ScoreContext(object):
+    """
+    Create the engravers for all staffs in the score and set their
+    xpos. The engraving and layout is done one bar at the time, and
+    the state at the beginning of each bar is saved, so that update()
+    can engrave the bars that have been changed again, and only move
+    the bars after them.
+    """
     def __init__(self, score, last_timepos=None):
-        t = set()
+        self.m_score = score
+        self.m_last_timepos = last_timepos
+        self.m_contexts = []
+        self.m_bar_states = []
+        self.m_bar_starts = []
+        self.update(0)
+    def create_contexts(self):
+        score = self.m_score
         self.m_contexts = staff_contexts = []
         # Create one staff context for each staff line.
         for staff in score.m_staffs:
             if isinstance(staff, elems.RhythmStaff):
-                staff_contexts.append(RhythmStaffContext(staff, last_timepos))
+                staff_contexts.append(RhythmStaffContext(staff, self.m_last_timepos))
             else:
-                staff_contexts.append(StaffContext(staff, last_timepos))
-            [t.add(timepos) for timepos in staff_contexts[-1].m_engravers]
-        # BarlineEngravers have the timepos of the beginning of the next
-        # bar. So the last bar line will have the timepos of where the
-        # bar after the last bar would begin. We need to add that timepos
-        # to the set 't' because it is not added by the above loop.
-        if score.m_bars:
-            t.add(score.m_bars[-1].end())
+                staff_contexts.append(StaffContext(staff, self.m_last_timepos))
+        # m_bar_states[i] is the layout state when we start to set the
+        # xpos of bar i.
+        self.m_bar_states = [None] * len(score.m_bars)
+        self.m_bar_starts = [bar.m_timepos for bar in score.m_bars]
+    def reset(self):
+        self.m_xpos = 0
+        self.m_barline_idx = 0
         # Initialize the property dict for each staff.
-        for staff_context in staff_contexts:
+        for staff_context in self.m_contexts:
             staff_context.props = {
                 'hide-barline': False,
             }
-        xpos = 0
-        bar_idx = 0
-        # This loop will set the m_xpos variable for all engraver objects
+    def get_state(self):
+        return (self.m_xpos, self.m_barline_idx,
+                [dict(c.props) for c in self.m_contexts])
+    def set_state(self, state):
+        self.m_xpos, self.m_barline_idx, props = state
+        for staff_context, p in zip(self.m_contexts, props):
+            staff_context.props = dict(p)
+    def get_bar_idx(self, timepos):
+        """
+        Return the index of the bar timepos is within.
+        """
+        return max(bisect.bisect_right(self.m_bar_starts, timepos) - 1, 0)
+    def update(self, first_bar, last_bar=None):
+        """
+        Engrave the bars from first_bar to last_bar again, after the
+        music in them has been changed. If last_bar is None, all bars
+        from first_bar to the end of the score are engraved again.
+        The bars after last_bar are only moved to their new xpos, unless
+        a tie or beam from the changed bars continue into them.
+        Everything is engraved again if bars or staffs have been added
+        or removed since the last time.
+        """
+        score = self.m_score
+        if (len(self.m_contexts) != len(score.m_staffs)
+                or len(self.m_bar_states) != len(score.m_bars)
+                or [c.m_staff for c in self.m_contexts] != score.m_staffs):
+            self.create_contexts()
+            first_bar = 0
+            last_bar = None
+        num_bars = len(score.m_bars)
+        if last_bar is None:
+            last_bar = num_bars - 1
+        # We can only start engraving at the beginning of a bar where
+        # no ties, beams or tuplets are open from the bars before it.
+        start = min(first_bar, num_bars - 1)
+        while start > 0 and not all([c.m_bar_states[start][4] for c in self.m_contexts]):
+            start -= 1
+        if start <= 0:
+            start = 0
+            for staff_context in self.m_contexts:
+                staff_context.reset()
+            self.reset()
+        else:
+            for staff_context in self.m_contexts:
+                staff_context.set_state(staff_context.m_bar_states[start])
+            self.set_state(self.m_bar_states[start])
+        bar_idx = start
+        # Engrave until we are after last_bar and find a bar that will
+        # be engraved like it was the last time.
+        while bar_idx < num_bars:
+            if bar_idx > last_bar and not [c for c in self.m_contexts
+                    if not (c.m_bar_states[bar_idx][4]
+                            and c.m_bar_states[bar_idx] == c.get_state())]:
+                break
+            for staff_context in self.m_contexts:
+                staff_context.engrave_bar(bar_idx)
+            bar_idx += 1
+        for staff_context in self.m_contexts:
+            staff_context.layout_beams()
+        # The bars after the engraved bars keep their engravers. They
+        # only have to be moved if the width of the engraved bars have
+        # changed.
+        for idx in range(start, num_bars):
+            state = self.m_bar_states[idx]
+            if idx >= bar_idx and state[1:] == self.get_state()[1:]:
+                delta = self.m_xpos - state[0]
+                if delta:
+                    for i in range(idx, num_bars):
+                        self.m_bar_states[i] = (self.m_bar_states[i][0] + delta,) + self.m_bar_states[i][1:]
+                        for staff_context in self.m_contexts:
+                            staff_context.shift_bar(i, delta)
+                break
+            self.layout_bar(idx)
+        for staff_context in self.m_contexts:
+            staff_context.update_list()
+    def layout_bar(self, layout_idx):
+        """
+        Set the m_xpos variable for all engraver objects in the bar.
+        """
+        score = self.m_score
+        staff_contexts = self.m_contexts
+        for staff_context in staff_contexts:
+            staff_context.remove_barlines(layout_idx)
+        self.m_bar_states[layout_idx] = self.get_state()
+        t = set()
+        for staff_context in staff_contexts:
+            t.update(staff_context.m_bar_timeposes[layout_idx])
+        # BarlineEngravers have the timepos of the beginning of the next
+        # bar. So the last bar line will have the timepos of where the
+        # bar after the last bar would begin. We need to add that timepos
+        # to the set 't' because it is not added by the staff contexts.
+        if layout_idx == len(score.m_bars) - 1:
+            t.add(score.m_bars[-1].end())
+        xpos = self.m_xpos
+        bar_idx = self.m_barline_idx
         for timepos in sorted(t):
             ########################
             # Per score properties #
@@ -950,13 +1158,10 @@ class ScoreContext(object):
                         and 'properties' in staff.m_tdict[timepos]):
                     staff_context.props.update(staff.m_tdict[timepos]['properties'])
             if timepos == score.m_bars[bar_idx].end():
-                bar = score.m_bars[bar_idx]
                 for staff_context in staff_contexts:
                     if not staff_context.props['hide-barline']:
-                        e = BarlineEngraver("|")
-                        staff_context.append(e)
-                        staff_context.m_engravers.setdefault(
-                            score.m_bars[bar_idx].end(), {})['barline'] = e
+                        staff_context.add_barline(layout_idx, timepos,
+                                                  BarlineEngraver("|"))
                 bar_idx += 1
             def do_col(s, xpos):
                 max_width = 0
@@ -985,4 +1190,5 @@ class ScoreContext(object):
                     max_width = max(max_width, max(
                         [e.get_width() for e in context.m_engravers[timepos]['elem']]))
             xpos += max_width
-
+        self.m_xpos = xpos
+        self.m_barline_idx = bar_idx
@@ -122,3 +122,66 @@ class MThd:
         write_int32(f, len(v)) #chunk len
         write_vect(f, v)
 
+class MidiTrackWriter(object):
+    """
+    Encode the events of a MIDI file with one MTrk chunk into a
+    bytearray. The output is the same as when building the track with
+    the mf_* functions, MThd and write_vect, but the data is written to
+    the file in one call.
+    """
+    def __init__(self):
+        self.m_data = bytearray()
+    def delta(self, i):
+        assert isinstance(i, int) and i >= 0
+        if i < 0x80:
+            self.m_data.append(i)
+            return
+        v = [i & 0x7f]
+        i = i >> 7
+        while i:
+            v.append((i & 0x7f) | 0x80)
+            i = i >> 7
+        v.reverse()
+        self.m_data.extend(v)
+    def tempo(self, n):
+        """
+        n -- number of quarter tones per minute.
+        """
+        i = int(500000*120/n)
+        assert 0 <= i < 2**24
+        self.m_data.extend((0, 0xff, 0x51, 0x03,
+                            i >> 16 & 0xff, i >> 8 & 0xff, i & 0xff))
+    def program_change(self, chan, prg):
+        assert 0 <= chan < 16
+        self.m_data.extend((0, chan + MIDI_PROGRAM_CHANGE, prg))
+    def volume_change(self, chan, volume):
+        assert 0 <= chan < 16
+        assert 0 <= volume < 256
+        self.m_data.extend((0, chan + MIDI_CONTROLLER_CHANGE,
+                            MIDI_CONTROLLER_VOLUME, volume))
+    def note_on(self, delta, chan, note, vel):
+        assert 0 <= chan < 16
+        self.delta(delta)
+        self.m_data.extend((chan + MIDI_NOTE_ON, note, vel))
+    def note_off(self, delta, chan, note, vel):
+        assert 0 <= chan < 16
+        self.delta(delta)
+        self.m_data.extend((chan + MIDI_NOTE_OFF, note, vel))
+    def get_midifile(self):
+        """
+        Return a str with the MIDI file: the MThd chunk and the MTrk
+        chunk with the events, terminated by an end of track event.
+        """
+        track_len = len(self.m_data) + 4
+        return str(bytearray("MThd")
+                   + bytearray(mf_int32(6) + mf_int16(1) + mf_int16(1)
+                               + mf_int16(MThd.PPQN))
+                   + bytearray("MTrk")
+                   + bytearray(mf_int32(track_len))
+                   + self.m_data
+                   + bytearray(mf_end_of_track()))
+    def write(self, filename):
+        f = open(filename, "wb")
+        f.write(self.get_midifile())
+        f.close()
+
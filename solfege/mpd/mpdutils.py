@@ -22,16 +22,11 @@ should go into this file.
 
 import re
 from solfege.mpd.musicalpitch import MusicalPitch
-
-def int_to_octave_notename(i):
-    return MusicalPitch.new_from_int(i).get_octave_notename()
+from solfege.mpd.musicalpitch import notename_to_int, int_to_octave_notename
 
 def int_to_user_octave_notename(i):
     return MusicalPitch.new_from_int(i).get_user_octave_notename()
 
-def notename_to_int(n):
-    return MusicalPitch.new_from_notename(n).semitone_pitch()
-
 
 def key_to_accidentals(key):
     i = ['aeses', 'eeses', 'beses', 'fes', 'ces', 'ges', 'des', 'aes',
@@ -77,6 +77,7 @@ Lukk
 d'
 """
 
+import __builtin__
 import logging
 import random
 
@@ -243,12 +244,22 @@ class MusicalPitch:
     def pitch_class(self):
         return ([0, 2, 4, 5, 7, 9, 11][self.m_notename_i] + self.m_accidental_i) % 12
     def set_from_int(self, midiint):
+        if 0 <= midiint < 128:
+            self.m_octave_i, self.m_notename_i, self.m_accidental_i \
+                = _int_table[midiint]
+            return
         self.m_octave_i = (midiint-48)/12
         self.m_notename_i = {0:0, 1:0, 2:1, 3:1, 4:2, 5:3, 6:3, 7:4, 8:4,
                              9:5, 10:5, 11:6}[midiint % 12]
         self.m_accidental_i = midiint-(self.m_octave_i+4)*12 \
                               -[0, 2, 4, 5, 7, 9, 11][self.m_notename_i]
     def set_from_notename(self, notename):
+        try:
+            self.m_octave_i, self.m_notename_i, self.m_accidental_i \
+                = _notename_table[notename]
+            return
+        except KeyError:
+            pass
         if not notename:
             raise InvalidNotenameException(notename)
         tmp = notename
@@ -355,15 +366,30 @@ class MusicalPitch:
     def __str__(self):
         return "(MusicalPitch %s)" % self.get_octave_notename()
     def get_user_notename(self):
-        # xgettext:no-python-format
-        return self._format_notename(_i("notenameformat|%(notename)s"))
+        key = (self.m_octave_i, self.m_notename_i, self.m_accidental_i, False)
+        cache = _get_user_notename_cache()
+        if key not in cache:
+            # xgettext:no-python-format
+            cache[key] = self._format_notename(_i("notenameformat|%(notename)s"))
+        return cache[key]
     def get_user_octave_notename(self):
-        # xgettext:no-python-format
-        return self._format_notename(_i("notenameformat|%(notename)s%(oct)s"))
+        key = (self.m_octave_i, self.m_notename_i, self.m_accidental_i, True)
+        cache = _get_user_notename_cache()
+        if key not in cache:
+            # xgettext:no-python-format
+            cache[key] = self._format_notename(_i("notenameformat|%(notename)s%(oct)s"))
+        return cache[key]
     def get_notename(self):
-        return self._format_notename("%(utnotename)s")
+        try:
+            return _notename_strings[self.m_notename_i, self.m_accidental_i]
+        except KeyError:
+            return self._format_notename("%(utnotename)s")
     def get_octave_notename(self):
-        return self._format_notename("%(utnotename)s%(oct)s")
+        try:
+            return _octave_notename_strings[
+                self.m_octave_i, self.m_notename_i, self.m_accidental_i]
+        except KeyError:
+            return self._format_notename("%(utnotename)s%(oct)s")
     def _format_notename(self, format_string):
         """
         utnotename : untranslated notename, solfege-internal format.
@@ -422,3 +448,72 @@ class MusicalPitch:
             logging.error("musicalpitch: Bad translation of notenameformat string")
             return "%(notename)s%(oct)s" % D
 
+# Lookup tables, so that the notenames used by the exercises are not
+# parsed and formatted every time. They cover every notename with at most
+# two accidentals from c,,,, to b'''''', with the
+# (m_octave_i, m_notename_i, m_accidental_i) tuple as value or key.
+# Notenames outside the tables are handled by the code above.
+_notename_table = {}
+_notename_strings = {}
+_octave_notename_strings = {}
+
+def _build_tables():
+    for notename_i, n in enumerate(('c', 'd', 'e', 'f', 'g', 'a', 'b')):
+        for accidental_i in range(-2, 3):
+            accidental = ['eses', 'es', '', 'is', 'isis'][accidental_i + 2]
+            utnotename = n + accidental
+            _notename_strings[notename_i, accidental_i] = utnotename
+            for octave_i in range(-4, 7):
+                if octave_i > 0:
+                    octave = "'" * octave_i
+                else:
+                    octave = "," * -octave_i
+                key = (octave_i, notename_i, accidental_i)
+                _octave_notename_strings[key] = utnotename + octave
+                _notename_table[utnotename + octave] = key
+                # set_from_notename accept es and as for ees and aes
+                if n in ('e', 'a') and accidental_i < 0:
+                    _notename_table[n + accidental[1:] + octave] = key
+_build_tables()
+
+def _build_int_table():
+    p = MusicalPitch()
+    table = []
+    for midiint in range(128):
+        p.m_octave_i = (midiint-48)/12
+        p.m_notename_i = {0:0, 1:0, 2:1, 3:1, 4:2, 5:3, 6:3, 7:4, 8:4,
+                          9:5, 10:5, 11:6}[midiint % 12]
+        p.m_accidental_i = midiint-(p.m_octave_i+4)*12 \
+                           -[0, 2, 4, 5, 7, 9, 11][p.m_notename_i]
+        table.append((p.m_octave_i, p.m_notename_i, p.m_accidental_i))
+    return tuple(table)
+_int_table = _build_int_table()
+
+# The translated notenames depend on the gettext translation installed,
+# so the cache is emptied when _ or _i in __builtin__ is replaced.
+_user_notename_cache = {}
+_user_notename_cache_translation = (None, None)
+
+def _get_user_notename_cache():
+    global _user_notename_cache_translation
+    translation = (__builtin__.__dict__.get('_'), __builtin__.__dict__.get('_i'))
+    if translation[0] is not _user_notename_cache_translation[0] \
+            or translation[1] is not _user_notename_cache_translation[1]:
+        _user_notename_cache.clear()
+        _user_notename_cache_translation = translation
+    return _user_notename_cache
+
+def notename_to_int(notename):
+    """
+    Return the semitone pitch of the notename.
+    """
+    try:
+        octave_i, notename_i, accidental_i = _notename_table[notename]
+    except KeyError:
+        return MusicalPitch.new_from_notename(notename).semitone_pitch()
+    return [0, 2, 4, 5, 7, 9, 11][notename_i] + accidental_i + octave_i * 12 + 48
+
+def int_to_octave_notename(midiint):
+    if 0 <= midiint < 128:
+        return _octave_notename_strings[_int_table[midiint]]
+    return MusicalPitch.new_from_int(midiint).get_octave_notename()
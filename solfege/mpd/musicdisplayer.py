@@ -15,23 +15,56 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import absolute_import
+import math
+
+import cairo
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import GObject
 from gi.repository import Pango
 from solfege.mpd import elems
 from solfege.mpd import engravers
-from solfege.mpd import parser
+from solfege.mpd.scorecache import score_cache
 from solfege.mpd.rat import Rat
 
+class ClickableRegions(object):
+    """
+    Rectangles on the score that call MusicDisplayer.m_callback when
+    clicked. The rectangles are stored in buckets of BUCKET_WIDTH pixels
+    along the x axis, so finding the rectangles below the pointer only
+    has to check the few rectangles in one bucket.
+    """
+    BUCKET_WIDTH = 64
+    def __init__(self):
+        self.m_buckets = {}
+    def add(self, x, y, w, h, midi_int):
+        r = {'x':x, 'y':y, 'w':w, 'h':h, 'midi_int': midi_int}
+        for b in range(int(x) // self.BUCKET_WIDTH,
+                       int(x + w) // self.BUCKET_WIDTH + 1):
+            self.m_buckets.setdefault(b, []).append(r)
+    def find(self, x, y):
+        """
+        Return the list of regions containing the point.
+        """
+        return [r for r in self.m_buckets.get(int(x) // self.BUCKET_WIDTH, [])
+                if r['x'] < x < r['x'] + r['w']
+                   and r['y'] < y < r['y'] + r['h']]
+
 class MusicDisplayer(Gtk.ScrolledWindow):
+    # cairo cannot create image surfaces larger than this, in device
+    # pixels. Longer scores are drawn directly on the widget.
+    MAX_SURFACE_SIZE = 32767
     def __init__(self):
         Gtk.ScrolledWindow.__init__(self)
         self.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.NEVER)
         self.m_callback = None
         self.m_engravers = []
         self.m_fontsize = 20
-        self.m_clickables = []
+        self.m_clickables = ClickableRegions()
+        # The engraved score is drawn once into m_surface, and on_draw
+        # copy from it until the music or the size of the widget changes.
+        self.m_surface = None
+        self.m_surface_key = None
         self.g_d = Gtk.DrawingArea()
         self.g_d.show()
 
@@ -49,12 +82,12 @@ class MusicDisplayer(Gtk.ScrolledWindow):
             for x in range(numstaff):
                 sc.add_staff()
             self.m_engravers = engravers.ScoreContext(sc).m_contexts
-        self.g_d.queue_draw()
+        self.invalidate()
         dim = engravers.dimentions[20]
         self.set_size_request(self.get_size_request()[0], numstaff*dim.staff_spacing+dim.first_staff_ypos)
     def display(self, music, fontsize, last_timepos=None):
         """Exception handling should be done by the caller."""
-        score = parser.parse_to_score_object(music)
+        score = score_cache.get_score(music)
         sc = engravers.ScoreContext(score, last_timepos)
         self.m_engravers = sc.m_contexts
         self.m_fontsize = fontsize
@@ -68,7 +101,9 @@ class MusicDisplayer(Gtk.ScrolledWindow):
             self.m_width = 0
             for eng in self.m_engravers:
                 if eng:
-                    self.m_width = max(self.m_width, max([e.m_xpos for e in eng if not isinstance(e, (engravers.BeamEngraver, engravers.TupletEngraver, engravers.TieEngraver))]))
+                    for e in eng:
+                        if e.m_xpos > self.m_width and not isinstance(e, (engravers.BeamEngraver, engravers.TupletEngraver, engravers.TieEngraver)):
+                            self.m_width = e.m_xpos
                     if not isinstance(eng[-1], engravers.BarlineEngraver):
                         self.m_width += 20
             self.m_height = len(self.m_engravers)*dim.staff_spacing+dim.first_staff_ypos
@@ -78,30 +113,53 @@ class MusicDisplayer(Gtk.ScrolledWindow):
             self.m_height = dim.staff_spacing + dim.first_staff_ypos
         self.set_size_request(self.get_size_request()[0], self.m_height)
         self.g_d.set_size_request(self.m_width, self.m_height-4)
+        self.invalidate()
+    def invalidate(self):
+        """
+        Forget the engraved score and clickable regions, and redraw.
+        """
+        self.m_surface = None
+        self.m_clickables = ClickableRegions()
         self.g_d.queue_draw()
     def add_clickable_region(self, x, y, w, h, midi_int):
-        self.m_clickables.append({'x':x, 'y':y, 'w':w, 'h':h,
-                                  'midi_int': midi_int})
+        self.m_clickables.add(x, y, w, h, midi_int)
     def on_button_press_event(self, arg1, event):
         if self.m_callback:
-            for r in self.m_clickables:
-                if r['x'] < event.x < r['x'] + r['w'] \
-                   and r['y'] < event.y < r['y'] + r['h']:
-                    self.m_callback(r['midi_int'])
+            for r in self.m_clickables.find(event.x, event.y):
+                self.m_callback(r['midi_int'])
     def on_draw(self, darea, ct):
-        dim = engravers.dimentions[self.m_fontsize]
-        d = self.get_allocation()
         if self.m_width < self.get_allocated_width():
             self.m_width = self.get_allocated_width()
         if self.m_height < self.get_allocated_height():
             self.m_height = self.get_allocated_height()
+        width = int(math.ceil(self.m_width))
+        height = int(math.ceil(self.m_height))
+        scale = self.g_d.get_scale_factor()
+        if max(width, height) * scale > self.MAX_SURFACE_SIZE:
+            self.m_surface = None
+            self.engrave(ct)
+            return
+        key = (self.m_fontsize, width, height, scale)
+        if self.m_surface is None or self.m_surface_key != key:
+            # The surface has scale times as many pixels as the widget
+            # on HiDPI screens, and a device scale so that we draw on it
+            # with the same coordinates as on the widget.
+            self.m_surface = self.g_d.get_window().create_similar_image_surface(
+                cairo.FORMAT_RGB24, width * scale, height * scale, scale)
+            self.m_surface_key = key
+            self.engrave(cairo.Context(self.m_surface))
+        # ct is clipped to the region that has to be redrawn, so only
+        # the visible part of the surface is copied.
+        ct.set_source_surface(self.m_surface, 0, 0)
+        ct.paint()
+    def engrave(self, ct):
+        dim = engravers.dimentions[self.m_fontsize]
         staff_len = self.m_width
         ct.rectangle(0, 0, self.m_width, self.m_height)
         ct.set_source_rgb(1, 1, 1)
         ct.fill()
         ct.set_source_rgb(0, 0, 0)
         staff_centrum = dim.first_staff_ypos
-        self.m_clickables = []
         ct.set_line_width(1.0)
         for staff in self.m_engravers:
             if staff.m_label:
@@ -18,7 +18,7 @@ from __future__ import absolute_import
 
 import operator
 
-from solfege.mpd.rat import Rat
+from solfege.mpd import track
 from solfege.mpd.track import Track, PercussionTrack
 from solfege.mpd import const
 from solfege.mpd import elems
@@ -52,25 +52,42 @@ class MidiPerformer(object):
             assert start is not None and end is not None
             return self.get_tracks_of(
                 [i for i in self.get_all_tpos_keys() if start <= i < end])
-    def get_event_dict(self, voice, kv):
+    def get_timeline(self, voice, kv):
+        """
+        Return the track.Timeline to place the start and stop position
+        of every note in voice at the timeposes in kv on.
+        """
+        durations = list(kv)
+        for timepos in kv:
+            if timepos in voice.m_tdict:
+                durations.extend([n.m_duration.get_rat_value()
+                                  for n in voice.m_tdict[timepos]['elem']
+                                  if isinstance(n, elems.Note)])
+        return track.create_timeline(durations)
+    def get_event_dict(self, voice, kv, timeline=None):
         """
         Return a dict that tell us where every note in the voice starts
-        and stops. The key is a Rat, and the values are a list of tuples.
+        and stops. The key is the position on the track.Timeline, a Rat
+        if timeline is not set, and the values are a list of tuples.
         Each tuple has thee elements
         (id, 'start|stop-note', midiint)
         """
         ################
+        if timeline is None:
+            timeline = track.Timeline()
         D = {}
         i = 2
         for idx, timepos in enumerate(kv):
             if timepos in voice.m_tdict:
                 if not isinstance(voice.m_tdict[timepos]['elem'][0], elems.Note):
                     continue
-                for n in sorted(voice.m_tdict[timepos]['elem'],
+                notes = voice.m_tdict[timepos]['elem']
+                timepos = timeline.pos(timepos)
+                for n in sorted(notes,
                         key=operator.attrgetter('m_musicalpitch')):
                     if timepos not in D:
                         D[timepos] = []
-                    stop_pos = timepos + n.m_duration.get_rat_value()
+                    stop_pos = timepos + timeline.pos(n.m_duration.get_rat_value())
                     if stop_pos not in D:
                         D[stop_pos] = []
                     if n.m_tieinfo in ('end', 'go'):
@@ -87,15 +104,16 @@ class MidiPerformer(object):
                     i = i + 1
         return D
     def generate_track_for_voice(self, voice, kv, tracktype):
-        D = self.get_event_dict(voice, kv)
+        timeline = self.get_timeline(voice, kv)
+        D = self.get_event_dict(voice, kv, timeline)
+        prev_time = timeline.m_start
         keys = D.keys()
         keys.sort()
-        prev_time = Rat(0)
         ms = tracktype()
         for k in keys:
             delta = None
-            if k != Rat(0, 1):
-                delta = k-prev_time
+            if k != timeline.m_start:
+                delta = timeline.rat(k - prev_time)
             prev_time = k
             for e in D[k]:
                 if e[1] == START_NOTE:
@@ -20,6 +20,9 @@ def gcd(a, b):
         a, b = b, a % b
     return a
 
+def lcm(a, b):
+    return a / gcd(a, b) * b
+
 class Rat(object):
     __slots__ = ('m_num', 'm_den')
     """
@@ -34,6 +37,21 @@ class Rat(object):
         self.m_den = den
     def clone(self):
         return Rat(self.m_num, self.m_den)
+    @staticmethod
+    def from_ticks(ticks, ticks_per_whole):
+        """
+        Return the Rat of a duration that is TICKS long when a whole
+        note is TICKS_PER_WHOLE ticks long.
+        """
+        g = gcd(ticks, ticks_per_whole)
+        return Rat(ticks / g, ticks_per_whole / g)
+    def ticks(self, ticks_per_whole):
+        """
+        Return the number of ticks this duration is when a whole note
+        is TICKS_PER_WHOLE ticks long. TICKS_PER_WHOLE must be a
+        multiple of m_den.
+        """
+        return self.m_num * (ticks_per_whole / self.m_den)
     def __repr__(self):
         return "(Rat %i/%i)" % (self.m_num, self.m_den)
     def __str__(self):
@@ -74,7 +74,6 @@ class RhythmWidgetController(Gtk.HBox):
                 if added:
                     self.g_rwidget.cursor_next()
                 self.g_rwidget.grab_focus()
-                self.g_rwidget.score_updated()
             b.connect('clicked', f, k)
         # For simplicity, we use two buttons. One normal button for
         # adding dots, and a ToggleButton that will put a dot on new notes.
@@ -166,6 +165,7 @@ class RhythmWidget(MusicDisplayer):
             self.grab_focus()
         self.connect("button-press-event", f)
         self.m_cursor = None
+        self.m_scorecontext = None
         self.m_input_mode = RhythmWidget.NOTE_INPUT
     def get_cursor_timepos(self):
         """
@@ -246,14 +246,14 @@ class RhythmWidget(MusicDisplayer):
             return
         if self.m_score.voice11.m_tdict[timepos]['elem'][0].m_tieinfo in (None, 'end'):
             if self.m_score.voice11.tie_timepos(timepos):
-                self.score_updated()
+                self.score_updated(timepos)
         elif self.m_score.voice11.m_tdict[timepos]['elem'][0].m_tieinfo in ('start', 'go'):
             if self.m_score.voice11.untie_next(timepos):
-                self.score_updated()
+                self.score_updated(timepos)
     def delete(self):
         timepos = self.get_cursor_timepos()
         self.m_score.voice11.del_elem(timepos)
-        self.score_updated()
+        self.score_updated(timepos)
     def on_toggle_dots(self, delta):
         """
         delta is the number of dots to add or remove.
@@ -269,29 +269,38 @@ class RhythmWidget(MusicDisplayer):
         new_elem = copy.deepcopy(self.m_score.voice11.m_tdict[timepos]['elem'][0])
         new_elem.m_duration.m_dots += delta
         if self.m_score.voice11.try_set_elem(new_elem, timepos, False):
-            self.score_updated()
+            self.score_updated(timepos)
         return True
     def on_add_item(self, item):
         """
         Return True if an item was added.
         Return False if it was not added.
         """
-        if self.m_score.voice11.try_set_elem(item, self.get_cursor_timepos(),
-                self.m_ins_mode):
-            self.score_updated()
+        timepos = self.get_cursor_timepos()
+        if self.m_score.voice11.try_set_elem(item, timepos, self.m_ins_mode):
+            self.score_updated(timepos)
             self.adjust_hadjustment()
             return True
         return False
     def set_score(self, score, cursor=0):
         self.m_score = score
         self.m_cursor = cursor
+        self.m_scorecontext = None
         self.score_updated()
-    def score_updated(self):
+    def score_updated(self, timepos=None):
         """
         Redraw the staff. This should be called whenever m_score is updated.
         It is not necessary to call when only the cursor have been moved.
+        timepos is the timepos of the music that was changed. If it is
+        given, only the bar with timepos and the bars next to it are
+        engraved again, since ties to the notes before and after may
+        have been changed.
         """
-        self.m_scorecontext = engravers.ScoreContext(self.m_score)
+        if self.m_scorecontext is None or timepos is None:
+            self.m_scorecontext = engravers.ScoreContext(self.m_score)
+        else:
+            bar_idx = self.m_scorecontext.get_bar_idx(timepos)
+            self.m_scorecontext.update(max(bar_idx - 1, 0), bar_idx + 1)
         self.m_engravers = self.m_scorecontext.m_contexts
         self._display()
         if self.m_score.m_staffs:
@@ -0,0 +1,74 @@
+# GNU Solfege - free ear training software
+# Copyright (C) 2011   Tom Cato Amundsen
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+from solfege.mpd.parser import parse_to_score_object
+from solfege.mpd.performer import score_to_tracks
+
+class ScoreCache(object):
+    """
+    A bounded LRU cache of the elems.Score objects parsed from music
+    strings, and of the tracks score_to_tracks create from them.
+
+    The cached objects are never given to the caller. get_score return
+    a deep copy of the score and get_tracks copies of the tracks, so the
+    caller can change the music, or concatenate the score with others,
+    or prepend patch and volume events without changing what is cached.
+    """
+    def __init__(self, maxsize=64):
+        self.m_maxsize = maxsize
+        self.m_data = OrderedDict()
+        self.m_hits = 0
+        self.m_misses = 0
+    def _lookup(self, key, create_func):
+        try:
+            value = self.m_data.pop(key)
+            self.m_hits += 1
+        except KeyError:
+            value = create_func()
+            self.m_misses += 1
+            if len(self.m_data) >= self.m_maxsize:
+                self.m_data.popitem(last=False)
+        self.m_data[key] = value
+        return value
+    def _get_score(self, music):
+        return self._lookup(('score', music),
+                            lambda: parse_to_score_object(music))
+    def get_score(self, music):
+        """
+        Return a copy of the elems.Score object of music.
+        """
+        return self._get_score(music).copy(deep=True)
+    def get_tracks(self, music, start=None, end=None):
+        """
+        Return copies of the tracks score_to_tracks(score, start, end)
+        return for the score of music.
+        """
+        tracks = self._lookup(('tracks', music, start, end),
+            lambda: score_to_tracks(self._get_score(music), start, end))
+        return [track.copy() for track in tracks]
+    def clear(self):
+        self.m_data.clear()
+    def get_stats(self):
+        """
+        Return a tuple (hits, misses, number of cached objects).
+        """
+        return self.m_hits, self.m_misses, len(self.m_data)
+
+score_cache = ScoreCache()
@@ -2,6 +2,7 @@
 # Copyright (C) 2007, 2008, 2010, 2011 Tom Cato Amundsen
 # License is GPL, see file COPYING
 
+import copy
 import unittest
 from solfege.mpd.musicalpitch import MusicalPitch, InvalidNotenameException
 from solfege.mpd.elems import *
@@ -327,6 +328,15 @@ c4 c8 c8
         self.assertEquals(f(r" \times 2/3 { c4 d2 }"), [(48, 2.0/3), (50, 4.0/3)])
         self.assertEquals(f("c4 r8. d4"), [(48, 1.0), (-1, 0.75), (50, 1.0)])
         self.assertRaises(Voice.NotUnisonException, f, "<c4 d4>")
+    def test_stem_copy(self):
+        voice = parser.parse_to_score_object(r"\staff{ \times 2/3 { c8 d e } }").voice11
+        stem = voice.m_tdict[Rat(0, 1)]['elem']
+        stem.m_extra = 1
+        copied = voice.copy(None, deep=True).m_tdict[Rat(0, 1)]['elem']
+        self.assertEquals(copied.m_extra, 1)
+        self.assertEquals(copied.m_tupletinfo, stem.m_tupletinfo)
+        self.assert_(copied[0] is not stem[0])
+        self.assert_(copied[0].w_parent() is copied)
     def test_is_last(self):
         voice = self.score.voice11
         voice.append(Note.new_from_string("c2"))
@@ -406,7 +416,46 @@ class TestBarProxy(unittest.TestCase):
         bp.fill_skips()
         bp.end()
 
+class TestTimeDict(unittest.TestCase):
+    def test_sorted_keys(self):
+        d = TimeDict()
+        for t in (Rat(1, 2), Rat(0, 1), Rat(3, 4), Rat(1, 4)):
+            d[t] = t
+        self.assertEquals(d.sorted_keys(), [Rat(0, 1), Rat(1, 4), Rat(1, 2), Rat(3, 4)])
+        del d[Rat(1, 4)]
+        d[Rat(1, 2)] = None
+        d.setdefault(Rat(1, 8), {})
+        self.assertEquals(d.sorted_keys(), [Rat(0, 1), Rat(1, 8), Rat(1, 2), Rat(3, 4)])
+        self.assertEquals(d.index(Rat(1, 2)), 2)
+        self.assertRaises(ValueError, d.index, Rat(1, 4))
+        d.pop(Rat(0, 1))
+        c = copy.deepcopy(d)
+        self.assertTrue(isinstance(c, TimeDict))
+        c[Rat(5, 8)] = 1
+        self.assertEquals(c.sorted_keys(), [Rat(1, 8), Rat(1, 2), Rat(5, 8), Rat(3, 4)])
+        self.assertEquals(d.copy().sorted_keys(), [Rat(1, 8), Rat(1, 2), Rat(3, 4)])
+    def test_voice(self):
+        score = parser.parse_to_score_object(r"\staff{ c'4 d'8 e' f'2 | g'1 | a'2 b' }")
+        v = score.voice11
+        self.assertEquals(v.get_timeposes_of(score.m_bars[0]),
+            [Rat(0, 1), Rat(1, 4), Rat(3, 8), Rat(1, 2)])
+        self.assertEquals(v.get_timeposes_of(score.m_bars[2]),
+            [Rat(2, 1), Rat(5, 2)])
+        self.assertEquals(v.get_next_timepos(Rat(1, 2)), Rat(1, 1))
+        self.assertEquals(v.get_prev_timepos(Rat(1, 1)), Rat(1, 2))
+        self.assertEquals(v.get_prev_timepos(Rat(0, 1)), None)
+        self.assertEquals(v.get_next_timepos(Rat(5, 2)), None)
+        self.assertEquals([e['elem'][0].m_musicalpitch.get_octave_notename()
+                           for e in v],
+                          ["c'", "d'", "e'", "f'", "g'", "a'", "b'"])
+        self.assertEquals(score.staff1.get_timeposes(),
+            [Rat(0, 1), Rat(1, 4), Rat(3, 8), Rat(1, 2), Rat(1, 1), Rat(2, 1), Rat(5, 2)])
+        self.assertEquals(score.get_bar_at(Rat(5, 2)), score.m_bars[2])
+        self.assertEquals(score.get_bar_at(Rat(7, 8)), score.m_bars[0])
+        self.assertRaises(IndexError, score.get_bar_at, Rat(3, 1))
+
 suite = unittest.makeSuite(TestScore)
 suite.addTest(unittest.makeSuite(TestNote))
 suite.addTest(unittest.makeSuite(TestBarProxy))
+suite.addTest(unittest.makeSuite(TestTimeDict))
 
@@ -6,8 +6,11 @@
 import unittest
 
 from solfege import mpd
+from solfege.mpd import Duration
+from solfege.mpd import MusicalPitch
 from solfege.mpd import elems
 from solfege.mpd import engravers
+from solfege.mpd.rat import Rat
 
 class TestMisc(unittest.TestCase):
     def test_empty(self):
@@ -17,6 +20,49 @@ class TestMisc(unittest.TestCase):
         sc.add_staff()
         e = engravers.ScoreContext(sc)
 
+class TestScoreContext(unittest.TestCase):
+    def get_xposes(self, sc):
+        return [[(e.__class__.__name__, getattr(e, 'm_xpos', None))
+                 for e in context] for context in sc.m_contexts]
+    def test_update(self):
+        score = elems.Score()
+        score.add_staff(staff_class=elems.RhythmStaff)
+        for x in range(6):
+            score.add_bar(elems.TimeSignature(3, 4))
+        score.voice11.fill_with_skips()
+        sc = engravers.ScoreContext(score)
+        for timepos, dur in ((Rat(3, 4), 8), (Rat(7, 8), 2), (Rat(11, 8), 8),
+                             (Rat(0, 1), 4), (Rat(3, 1), 16)):
+            self.assertTrue(score.voice11.try_set_elem(elems.Note(
+                MusicalPitch.new_from_notename("c"), Duration(dur, 0)),
+                timepos, False))
+            bar_idx = sc.get_bar_idx(timepos)
+            sc.update(bar_idx, bar_idx)
+            self.assertEquals(self.get_xposes(sc),
+                self.get_xposes(engravers.ScoreContext(score)))
+        # A tie into the next bar
+        self.assertTrue(score.voice11.try_set_elem(elems.Note(
+                MusicalPitch.new_from_notename("c"), Duration(4, 0)),
+                Rat(3, 2), False))
+        self.assertTrue(score.voice11.tie_timepos(Rat(11, 8)))
+        sc.update(1, 2)
+        self.assertEquals(self.get_xposes(sc),
+            self.get_xposes(engravers.ScoreContext(score)))
+        self.assertEquals(len([e for e in sc.m_contexts[0]
+            if isinstance(e, engravers.TieEngraver)]), 1)
+        # Adding a bar will engrave everything again
+        score.add_bar(elems.TimeSignature(3, 4))
+        score.voice11.fill_with_skips()
+        sc.update(5)
+        self.assertEquals(self.get_xposes(sc),
+            self.get_xposes(engravers.ScoreContext(score)))
+    def test_get_bar_idx(self):
+        score = mpd.parser.parse_to_score_object(r"\staff{ \time 3/4 c'2. d'2. e'2. }")
+        sc = engravers.ScoreContext(score)
+        self.assertEquals(sc.get_bar_idx(Rat(0, 1)), 0)
+        self.assertEquals(sc.get_bar_idx(Rat(3, 4)), 1)
+        self.assertEquals(sc.get_bar_idx(Rat(2, 1)), 2)
+
 class TestClefs(unittest.TestCase):
     def test_raise_on_bad_clef(self):
         for clef in ('XX', ):
@@ -67,4 +113,5 @@ class TestClefs(unittest.TestCase):
 
 suite = unittest.makeSuite(TestClefs)
 suite.addTest(unittest.makeSuite(TestMisc))
+suite.addTest(unittest.makeSuite(TestScoreContext))
 
@@ -60,6 +60,44 @@ class TestMusicalPitch(unittest.TestCase):
                 ("b", 11), ("bis", 0), ("bisis", 1), ("ces", 11)):
             p = MusicalPitch.new_from_notename(n)
             self.assertEquals(p.pitch_class(), i)
+    def test_tables(self):
+        # The lookup tables must give the same result as parsing
+        # and formatting the notenames.
+        for n in ("c,,,,", "es", "ees'", "as,", "aeses", "ases''",
+                  "bisis''''''", "fes,,"):
+            p = MusicalPitch.new_from_notename(n)
+            q = MusicalPitch()
+            q.set_from_notename(n + "'',,")
+            self.assertEquals((p.m_octave_i, p.m_notename_i, p.m_accidental_i),
+                (q.m_octave_i, q.m_notename_i, q.m_accidental_i))
+            self.assertEquals(solfege.mpd.musicalpitch.notename_to_int(n),
+                              q.semitone_pitch())
+        for i in range(128):
+            p = MusicalPitch.new_from_int(i)
+            self.assertEquals(p.semitone_pitch(), i)
+            self.assertEquals(p.get_octave_notename(),
+                              p._format_notename("%(utnotename)s%(oct)s"))
+            self.assertEquals(
+                solfege.mpd.musicalpitch.int_to_octave_notename(i),
+                p.get_octave_notename())
+        self.assertEquals(MusicalPitch.new_from_notename("cisisis").semitone_pitch(), 51)
+        self.assertRaises(solfege.mpd.musicalpitch.InvalidNotenameException,
+            solfege.mpd.musicalpitch.notename_to_int, "h")
+    def test_user_notename_cache(self):
+        class T(gettext.NullTranslations):
+            def ugettext(self, s):
+                return {u"notename|b": u"h"}.get(s, s)
+        import __builtin__
+        saved = __builtin__.__dict__['_']
+        try:
+            n = MusicalPitch.new_from_notename("b")
+            gettext.NullTranslations().install(unicode=True)
+            self.assertEquals(n.get_user_notename(), "b")
+            T().install(unicode=True)
+            self.assertEquals(n.get_user_notename(), "h")
+            self.assertEquals(n.get_user_octave_notename(), "h")
+        finally:
+            __builtin__.__dict__['_'] = saved
 
 suite = unittest.makeSuite(TestMusicalPitch)
 suite.addTest(doctest.DocTestSuite(solfege.mpd.musicalpitch))
@@ -0,0 +1,63 @@
+# Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+# License is GPL, see file COPYING
+
+from __future__ import absolute_import
+import gc
+import unittest
+
+from solfege.mpd.elems import Score, Stem
+from solfege.mpd.performer import score_to_tracks
+from solfege.mpd.rat import Rat
+from solfege.mpd.scorecache import ScoreCache
+
+class TestScoreCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = ScoreCache(maxsize=3)
+    def test_get_score(self):
+        music = r"\staff{ c'4 d' e' f' }"
+        s1 = self.cache.get_score(music)
+        s2 = self.cache.get_score(music)
+        self.assertEquals(self.cache.get_stats(), (1, 1, 1))
+        self.assertFalse(s1 is s2)
+        self.assertEquals(s1.voice11.m_tdict.keys(), s2.voice11.m_tdict.keys())
+        s1.add_staff()
+        self.assertEquals(len(self.cache.get_score(music).m_staffs), 1)
+    def test_get_score_concat2(self):
+        music = r"\rhythmstaff{ c4 c8 c8 }"
+        countin = self.cache.get_score(r"\rhythmstaff{ d4 d4 }")
+        s = Score.concat2(countin, self.cache.get_score(music))
+        self.assertEquals(len(score_to_tracks(s)), 2)
+        del s
+        gc.collect()
+        s = self.cache.get_score(music)
+        for timepos in s.voice11.m_tdict:
+            for note in s.voice11.m_tdict[timepos]['elem']:
+                self.assertTrue(isinstance(note.w_parent(), Stem))
+                self.assertTrue(note.w_parent().w_parent() is s.voice11)
+        self.assertEquals(score_to_tracks(s)[0].str_repr(),
+                          self.cache.get_tracks(music)[0].str_repr())
+    def test_get_tracks(self):
+        music = r"\staff{ c'4 d' } \staff{ e'2 }"
+        t1 = self.cache.get_tracks(music)
+        t1[0].prepend_patch(3)
+        t2 = self.cache.get_tracks(music)
+        self.assertEquals(len(t2), 2)
+        self.assertEquals(t2[0].str_repr(), "n60 d1/4 o60 n62 d1/4 o62")
+        self.assertEquals(t1[0].str_repr(), "p3 n60 d1/4 o60 n62 d1/4 o62")
+        # The tracks was created from the cached score
+        self.assertEquals(self.cache.get_stats(), (1, 2, 2))
+        self.assertEquals(self.cache.get_tracks(music, Rat(1, 4))[0].str_repr(),
+                          "d1/4 n62 d1/4 o62")
+        self.assertEquals(self.cache.get_stats(), (2, 3, 3))
+    def test_lru(self):
+        for x in range(3):
+            self.cache.get_score(r"\staff{ c'%i }" % 2 ** x)
+        self.cache.get_score(r"\staff{ c'1 }")
+        self.cache.get_score(r"\staff{ c'8 }")
+        self.assertEquals(self.cache.get_stats(), (1, 4, 3))
+        self.cache.get_score(r"\staff{ c'1 }")
+        self.cache.get_score(r"\staff{ c'2 }")
+        self.assertEquals(self.cache.get_stats(), (2, 5, 3))
+
+suite = unittest.makeSuite(TestScoreCache)
@@ -2,8 +2,10 @@
 # Copyright (C) 2007, 2008, 2011 Tom Cato Amundsen
 # License is GPL, see file COPYING
 
+import os
 import unittest
 from solfege import mpd
+from solfege.mpd import mfutils
 from solfege.testlib import TmpFileBase
 from solfege.mpd.track import Track, MidiEventStream
 from solfege.mpd.rat import Rat
@@ -40,6 +42,14 @@ class TestTrack(unittest.TestCase):
            ('notelen-time', Rat(1, 4)),
            ('note-off', 1, 91, 127),
            ])
+    def test_events_have_no_dict(self):
+        t = Track()
+        t.set_bpm(120)
+        t.set_patch(3)
+        t.set_volume(90)
+        t.note(4, 60)
+        for e in t.m_v:
+            self.assertFalse(hasattr(e, '__dict__'), e)
     def test_midi_overlap(self):
         t1 = Track()
         t1.note(8, 92, 121)
@@ -372,6 +382,74 @@ class TestMidiEventStream(TmpFile):
         m.num_MIDI_channels = 1
         # We don't handle running out of MIDI channels yet
         self.assertRaises(Exception, m.str_repr, 1)
+    def test_program_change_placement(self):
+        # The program changes for channel 1, 2 and 3 are moved to the
+        # beginning, since those channels are not used before.
+        t1 = Track()
+        t1.note(4, 60)
+        t1.note(4, 62)
+        t1.set_patch(5)
+        t1.note(4, 64)
+        t1.set_patch(6)
+        t1.note(4, 65)
+        t2 = Track()
+        t2.note(2, 70)
+        t2.set_patch(7)
+        t2.note(2, 71)
+        self.assertEquals(MidiEventStream(t1, t2).str_repr(1),
+            "p0:0 p1:5 p2:7 p3:6 v0:100 n0:60 n0:70 d1/4 o60 n0:62 d1/4 "
+            "o62 o70 v1:100 n1:64 v2:100 n2:71 d1/4 o64 v3:100 n3:65 d1/4 "
+            "o65 o71")
+    def test_integer_ticks(self):
+        music = r"""
+        \staff{ \times 2/3 { c'8 d' e' } f'4 \times 4/5 { g'16 a' b' c'' d'' } e''8. f''16 }
+        \staff{ c2 \times 2/3 { e4 g e } }
+        \rhythmstaff{ c8 c16 c \times 2/3 { c8 c c } c4 c }
+        """
+        self.assertEquals(mpd.track.ticks_per_whole(
+            [Rat(1, 4), Rat(1, 12), Rat(1, 5)]), 1920)
+        rats = MidiEventStream(*mpd.music_to_tracklist(music))
+        self.assertEquals(rats.m_timeline.m_ticks_per_whole, None)
+        merged = mpd.music_to_track(music).str_repr()
+        mpd.track.use_integer_ticks = True
+        try:
+            ticks = MidiEventStream(*mpd.music_to_tracklist(music))
+            self.assertEquals(ticks.m_timeline.m_ticks_per_whole, 1920)
+            self.assertEquals(list(ticks), list(rats))
+            self.assertEquals(merged, mpd.music_to_track(music).str_repr())
+        finally:
+            mpd.track.use_integer_ticks = False
+    def test_create_midifile(self):
+        t = Track()
+        t.set_bpm(90)
+        t.note(4, 60, 100)
+        t.note(1, 62, 101)
+        t.note(Rat(1, 20), 64, 102)
+        filename = os.path.join(self.tmpdir, "test.mid")
+        self.m_files.add("test.mid")
+        set_patch_delay = mpd.track.set_patch_delay
+        mpd.track.set_patch_delay = 0
+        try:
+            MidiEventStream(t).create_midifile(filename, [MidiEventStream(t)])
+        finally:
+            mpd.track.set_patch_delay = set_patch_delay
+        v = mfutils.mf_tempo(60)
+        for x in range(2):
+            v += mfutils.mf_tempo(90 * 4 / 4) \
+                + mfutils.mf_program_change(0, 0) \
+                + mfutils.mf_volume_change(0, 100) \
+                + mfutils.mf_note_on(0, 0, 60, 100) \
+                + mfutils.mf_note_off(96, 0, 60, 100) \
+                + mfutils.mf_note_on(0, 0, 62, 101) \
+                + mfutils.mf_note_off(384, 0, 62, 101) \
+                + mfutils.mf_note_on(0, 0, 64, 102) \
+                + mfutils.mf_note_off(19, 0, 64, 102)
+        f = open(filename, "rb")
+        self.assertEquals(f.read(),
+            "MThd\x00\x00\x00\x06\x00\x01\x00\x01\x00\x60MTrk"
+            + "".join([chr(c) for c in mfutils.mf_int32(len(v) + 4) + v
+                       + mfutils.mf_end_of_track()]))
+        f.close()
 
 
 class TestChannelDevice(unittest.TestCase):
@@ -15,38 +15,110 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import absolute_import
+import copy
+import itertools
 import logging
 
-from solfege.mpd.rat import Rat
+from solfege.mpd.rat import Rat, lcm
 from solfege.mpd import mfutils
 from solfege.mpd.const import DEFAULT_VELOCITY, DEFAULT_VOLUME
 
 set_patch_delay = 0
 
+# Resolution of the integer timeline, in ticks per quarter note.
+PPQN = 96
+# Set to True to make MidiEventStream, Track.merge_with and the
+# MidiPerformer calculate event positions as integer ticks instead of
+# Rat objects. The number of ticks per whole note is 4 * PPQN scaled up
+# to the least common multiple of the denominators of all the
+# durations, so tuplets are exact. Rat objects are still used in the
+# events returned. See create_timeline.
+use_integer_ticks = False
+
+def ticks_per_whole(durations, tpw=4 * PPQN):
+    """
+    Return the smallest multiple of tpw that makes each Rat in
+    durations an integer number of ticks.
+    """
+    for d in durations:
+        if tpw % d.m_den:
+            tpw = lcm(tpw, d.m_den)
+    return tpw
+
+class Timeline(object):
+    """
+    Convert between Rat durations and the positions events are placed
+    at. If ticks_per_whole is None, the positions are Rat objects, else
+    integer ticks, a whole note being ticks_per_whole ticks long.
+    """
+    def __init__(self, ticks_per_whole=None):
+        self.m_ticks_per_whole = ticks_per_whole
+        if ticks_per_whole:
+            self.m_start = 0
+        else:
+            self.m_start = Rat(0, 1)
+    def pos(self, rat):
+        """
+        Return the length of the Rat on the timeline.
+        """
+        if self.m_ticks_per_whole:
+            return rat.ticks(self.m_ticks_per_whole)
+        return rat
+    def rat(self, length):
+        """
+        Return a length on the timeline as a Rat.
+        """
+        if self.m_ticks_per_whole:
+            return Rat.from_ticks(length, self.m_ticks_per_whole)
+        return length
+
+def create_timeline(durations):
+    """
+    Return the Timeline to place events with the Rat durations on,
+    using integer ticks if use_integer_ticks is True.
+    """
+    if use_integer_ticks:
+        return Timeline(ticks_per_whole(durations))
+    return Timeline()
+
+def pairs(v):
+    """
+    Return an iterator over the pairs (v[0], v[1]), (v[2], v[3])...
+    """
+    it = iter(v)
+    return itertools.izip(it, it)
+
 class EventBase(object):
+    # A track of a long exercise can have many thousand events, so we
+    # use __slots__ to keep the events small.
+    __slots__ = ('m_pos',)
     def __init__(self):
-        self.m_time = None
+        self.m_pos = None
     def __str__(self):
-        return "(%s, time:%s)" % ( self.__class__.__name__, self.m_time)
+        return "(%s, pos:%s)" % ( self.__class__.__name__, self.m_pos)
 
 class NoteEventBase(EventBase):
+    __slots__ = ('m_pitch', 'm_velocity')
     def __init__(self, pitch, velocity):
         EventBase.__init__(self)
         assert 0 <= pitch
         self.m_pitch = pitch
         self.m_velocity = velocity
     def __str__(self):
-        return "(%s, pitch:%s, vel:%s, time:%s)" % (self.__class__.__name__, self.m_pitch, self.m_velocity, self.m_time)
+        return "(%s, pitch:%s, vel:%s, pos:%s)" % (self.__class__.__name__, self.m_pitch, self.m_velocity, self.m_pos)
 
 class NoteOnEvent(NoteEventBase):
+    __slots__ = ()
     def __init__(self, pitch, velocity):
         NoteEventBase.__init__(self, pitch, velocity)
 
 class NoteOffEvent(NoteEventBase):
+    __slots__ = ()
     def __init__(self, pitch, velocity):
         NoteEventBase.__init__(self, pitch, velocity)
 
 class Delay(EventBase):
+    __slots__ = ('m_duration',)
     def __init__(self, duration):
         """
         duration is a Rat. Rat(1, 4) denotes a quarter-note.
@@ -54,31 +126,34 @@ class Delay(EventBase):
         EventBase.__init__(self)
         self.m_duration = duration
     def __str__(self):
-        return "(%s, dur:%s, time:%s)" % (self.__class__.__name__, self.m_duration, self.m_time)
+        return "(%s, dur:%s, pos:%s)" % (self.__class__.__name__, self.m_duration, self.m_pos)
 
 class SetPatchEvent(EventBase):
+    __slots__ = ('m_patch',)
     def __init__(self, patch):
         EventBase.__init__(self)
         assert 0 <= patch < 128
         self.m_patch = patch
     def __str__(self):
-        return "(%s, time:%s, patch:%i)" % ( self.__class__.__name__, self.m_time, self.m_patch)
+        return "(%s, pos:%s, patch:%i)" % ( self.__class__.__name__, self.m_pos, self.m_patch)
 
 class SetVolumeEvent(EventBase):
+    __slots__ = ('m_volume',)
     def __init__(self, volume):
         EventBase.__init__(self)
         assert 0 <= volume < 256
         self.m_volume = int(volume)
     def __str__(self):
-        return "(%s, time:%s, volume:%i)" % ( self.__class__.__name__, self.m_time, self.m_volume)
+        return "(%s, pos:%s, volume:%i)" % ( self.__class__.__name__, self.m_pos, self.m_volume)
 
 class TempoEvent(EventBase):
+    __slots__ = ('m_bpm', 'm_notelen')
     def __init__(self, bpm, notelen):
         EventBase.__init__(self)
         self.m_bpm = bpm
         self.m_notelen = notelen
     def __str__(self):
-        return "(%s, time:%s, bpm/notelen: %s/%s)" % ( self.__class__.__name__, self.m_time, self.m_bpm, self.m_notelen)
+        return "(%s, pos:%s, bpm/notelen: %s/%s)" % ( self.__class__.__name__, self.m_pos, self.m_bpm, self.m_notelen)
 
 class MidiEventStream(object):
     TEMPO = 'tempo'
@@ -181,25 +256,36 @@ class MidiEventStream(object):
         # test handling of too few midi channels.
         self.num_MIDI_channels = 16
         self.m_tracks = tracks
+        self.m_timeline = create_timeline([d for track in self.m_tracks
+                                           for d in track.get_durations()])
         for track in self.m_tracks:
-            track.calculate_event_times()
-    def _create_dict_of_track(self, track):
-        """
-        Return a dict of the track, where the key is a list with
-        all events with the same m_time variable.
-        The dict values are a dict with three keys:
-        NoteOffEvents, OtherEvents, NoteOnEvents
-        """
-        retval = {}
-        for event in track.m_v:
-            retval[event.m_time] = retval.get(event.m_time, [])
-            retval[event.m_time].append(event)
-        for key in retval:
-            retval[key] = {
-              'NoteOffEvents': [x for x in retval[key] if isinstance(x, NoteOffEvent)],
-              'OtherEvents': [x for x in retval[key] if not isinstance(x, (NoteOffEvent, NoteOnEvent))],
-              'NoteOnEvents': [x for x in retval[key] if isinstance(x, NoteOnEvent)]}
-        return retval
+            track.calculate_event_positions(self.m_timeline)
+    def _create_time_slots(self):
+        """
+        Return a dict where the keys are all the positions in time
+        where anything happens on any track. The values are tuples
+        of three lists: the NoteOffEvents, the other events and the
+        NoteOnEvents at that time. To not create a container object for
+        each event, the lists are flat lists of track index and event
+        pairs, [idx, event, idx, event...], ordered by track index.
+        """
+        slots = {}
+        for idx, track in enumerate(self.m_tracks):
+            for event in track.m_v:
+                if isinstance(event, Delay):
+                    continue
+                t = event.m_pos
+                if t not in slots:
+                    slots[t] = ([], [], [])
+                if isinstance(event, NoteOffEvent):
+                    v = slots[t][0]
+                elif isinstance(event, NoteOnEvent):
+                    v = slots[t][2]
+                else:
+                    v = slots[t][1]
+                v.append(idx)
+                v.append(event)
+        return slots
     def sorted_events(self):
         """
         This method will rearrange the midi events so that all events of the
@@ -227,28 +313,51 @@ class MidiEventStream(object):
         for event in data[self.NOTE_OFF]:
             yield event
     def __iter__(self):
-        ret = []
-        for e in self.__mkevents():
-            if e[0] == 'program-change' and ret:
-                i = len(ret)
-                while (isinstance(ret[i-1][1], Rat) or ret[i-1][1] != e[1]) and i > 1:
-                    i -= 1
-                if i < len(ret):
-                    while ret[i][0] == 'program-change' and i < len(ret) - 1 and ret[i][1] < e[1]:
-                        i += 1
-                ret.insert(i, e)
+        return self._place_program_changes(self.__mkevents())
+    def _place_program_changes(self, events):
+        """
+        Yield the events, with each program-change moved back to just
+        after the previous event using the same MIDI channel, so the
+        synth has time to change the instrument before the notes are
+        played. Program changes for channels not used before are moved
+        to just after the first event. Program changes ending up at the
+        same place are sorted by channel.
+        """
+        # base is all events except the moved program changes, and
+        # after[j] maps from channel to the program changes placed
+        # right after base[j].
+        base = []
+        after = {}
+        # Map from e[1] (the channel for all events except notelen-time
+        # and tempo) to the index in base of the last event using it.
+        last = {}
+        set_patch = self.SET_PATCH
+        notelen_time = self.NOTELEN_TIME
+        for e in events:
+            if e[0] == set_patch and base:
+                j = last.get(e[1], 0)
+                after.setdefault(j, {}).setdefault(e[1], []).append(e)
+                last[e[1]] = j
             else:
-                ret.append(e)
-        for e in ret:
+                if e[0] != notelen_time:
+                    last[e[1]] = len(base)
+                base.append(e)
+        start = 0
+        for j in sorted(after):
+            for e in base[start:j + 1]:
+                yield e
+            pcs = after[j]
+            for channel in sorted(pcs):
+                for pc in pcs[channel]:
+                    yield pc
+            start = j + 1
+        for e in base[start:]:
             yield e
     def __mkevents(self):
-        # tpos_set will know all the positions in time where anything happens
+        # slots will know all the positions in time where anything happens
         # on any staff
-        tpos_set = set()
-        for track in self.m_tracks:
-            tpos_set.update([x.m_time for x in track.m_v if x.m_time])
-        tracks2 = [self._create_dict_of_track(track) for track in self.m_tracks]
-        tpos_list = list(tpos_set)
+        slots = self._create_time_slots()
+        tpos_list = slots.keys()
         tpos_list.sort()
         # We use this variable to remember which instrument
         # we want the track to play.
@@ -264,65 +373,64 @@ class MidiEventStream(object):
         track_notes = []
         for x in range(len(self.m_tracks)):
             track_notes.append({})
+        is_percussion = [isinstance(track, PercussionTrack)
+                         for track in self.m_tracks]
         ch_dev = self.ChannelDevice(self.num_MIDI_channels)
-        last_pos = Rat(0, 1)
+        timeline = self.m_timeline
+        last_pos = timeline.m_start
         for tpos in tpos_list:
             if tpos != last_pos: # Just to not insert before the first events
-                yield self.NOTELEN_TIME, tpos - last_pos
-            for idx, track in enumerate(tracks2):
-                if tpos in track:
-                    for e in track[tpos]['NoteOffEvents']:
-                        if e.m_pitch not in track_notes[idx]:
-                            # This could happen if the user adds extra NoteOffEvents or adds one
-                            # with the wrong pitch.
-                            logging.debug("not stopping, not playing now: %s", e)
-                            continue
-                        chn = track_notes[idx][e.m_pitch]
-                        del track_notes[idx][e.m_pitch]
-                        assert ch_dev.is_playing(chn, e.m_pitch)
-                        ch_dev.stop_note(chn, e.m_pitch)
-                        yield self.NOTE_OFF, chn, e.m_pitch, e.m_velocity
-            for idx, track in enumerate(tracks2):
-                if tpos in track:
-                    for e in track[tpos]['OtherEvents']:
-                        if isinstance(e, SetPatchEvent):
-                            track_state[idx]['patch-requested'] = e.m_patch
-                        elif isinstance(e, SetVolumeEvent):
-                            track_state[idx]['volume-requested'] = e.m_volume
-                        elif isinstance(e, TempoEvent):
-                            tempo_request = e
-                        else:
-                            logging.debug("MidiEventStream: NOT HANDLING EVENT: %s", e)
-            for idx, track in enumerate(tracks2):
-                if tpos in track:
-                    for e in track[tpos]['NoteOnEvents']:
-                        assert e.m_pitch not in track_notes[idx]
-                        if tempo_request != tempo_current:
-                            yield self.TEMPO, tempo_request.m_bpm, tempo_request.m_notelen
-                            tempo_current = tempo_request
-                        if isinstance(self.m_tracks[idx], PercussionTrack):
-                            chn = ch_dev.percussion_MIDI_channel
-                            if ch_dev.get_channel_data(chn, 'volume') != track_state[idx]['volume-requested']:
-                                ch_dev.set_channel_data(chn, 'volume', track_state[idx]['volume-requested'])
-                                yield self.VOLUME, chn, track_state[idx]['volume-requested']
-                        else:
-                            chn = ch_dev.require_channel(e.m_pitch,
-                                        track_state[idx]['patch-requested'],
-                                        track_state[idx]['volume-requested'])
-                            if ch_dev.get_channel_data(chn, 'patch') != track_state[idx]['patch-requested']:
-                                ch_dev.set_channel_data(chn, 'patch', track_state[idx]['patch-requested'])
-                                yield self.SET_PATCH, chn, track_state[idx]['patch-requested']
-                            if ch_dev.get_channel_data(chn, 'volume') != track_state[idx]['volume-requested']:
-                                ch_dev.set_channel_data(chn, 'volume', track_state[idx]['volume-requested'])
-                                yield self.VOLUME, chn, track_state[idx]['volume-requested']
-                        if ch_dev.is_playing(chn, e.m_pitch):
-                            logging.debug("MidiEventStream: ignoring duplicate tone: %s", e)
-                            continue
-                        track_notes[idx][e.m_pitch] = chn
-                        # ch_dev must know which tones are sounding on which
-                        # MIDI channels, so it can handle the midi resources.
-                        ch_dev.start_note(chn, e.m_pitch)
-                        yield self.NOTE_ON, chn, e.m_pitch, e.m_velocity
+                yield self.NOTELEN_TIME, timeline.rat(tpos - last_pos)
+            note_offs, others, note_ons = slots[tpos]
+            for idx, e in pairs(note_offs):
+                notes = track_notes[idx]
+                if e.m_pitch not in notes:
+                    # This could happen if the user adds extra NoteOffEvents or adds one
+                    # with the wrong pitch.
+                    logging.debug("not stopping, not playing now: %s", e)
+                    continue
+                chn = notes.pop(e.m_pitch)
+                assert ch_dev.is_playing(chn, e.m_pitch)
+                ch_dev.stop_note(chn, e.m_pitch)
+                yield self.NOTE_OFF, chn, e.m_pitch, e.m_velocity
+            for idx, e in pairs(others):
+                if isinstance(e, SetPatchEvent):
+                    track_state[idx]['patch-requested'] = e.m_patch
+                elif isinstance(e, SetVolumeEvent):
+                    track_state[idx]['volume-requested'] = e.m_volume
+                elif isinstance(e, TempoEvent):
+                    tempo_request = e
+                else:
+                    logging.debug("MidiEventStream: NOT HANDLING EVENT: %s", e)
+            for idx, e in pairs(note_ons):
+                notes = track_notes[idx]
+                patch = track_state[idx]['patch-requested']
+                volume = track_state[idx]['volume-requested']
+                assert e.m_pitch not in notes
+                if tempo_request != tempo_current:
+                    yield self.TEMPO, tempo_request.m_bpm, tempo_request.m_notelen
+                    tempo_current = tempo_request
+                if is_percussion[idx]:
+                    chn = ch_dev.percussion_MIDI_channel
+                    if ch_dev.get_channel_data(chn, 'volume') != volume:
+                        ch_dev.set_channel_data(chn, 'volume', volume)
+                        yield self.VOLUME, chn, volume
+                else:
+                    chn = ch_dev.require_channel(e.m_pitch, patch, volume)
+                    if ch_dev.get_channel_data(chn, 'patch') != patch:
+                        ch_dev.set_channel_data(chn, 'patch', patch)
+                        yield self.SET_PATCH, chn, patch
+                    if ch_dev.get_channel_data(chn, 'volume') != volume:
+                        ch_dev.set_channel_data(chn, 'volume', volume)
+                        yield self.VOLUME, chn, volume
+                if ch_dev.is_playing(chn, e.m_pitch):
+                    logging.debug("MidiEventStream: ignoring duplicate tone: %s", e)
+                    continue
+                notes[e.m_pitch] = chn
+                # ch_dev must know which tones are sounding on which
+                # MIDI channels, so it can handle the midi resources.
+                ch_dev.start_note(chn, e.m_pitch)
+                yield self.NOTE_ON, chn, e.m_pitch, e.m_velocity
             last_pos = tpos
     def create_midifile(self, filename, appendstreams=[]):
         """
@@ -331,43 +439,46 @@ class MidiEventStream(object):
         appendstrings -- a list of additional MidiEventStreams to append to
                     the midi file.
         """
-        v = []
+        w = mfutils.MidiTrackWriter()
         notelen = 0
         set_patch_flag = False
-        v += mfutils.mf_tempo(60 * 4 / 4)
+        w.tempo(60 * 4 / 4)
         for stream in [self] + appendstreams:
             for e in stream.sorted_events():
                 if e[0] == self.TEMPO:
-                    v = v + mfutils.mf_tempo(e[1] * 4 / e[2])
+                    w.tempo(e[1] * 4 / e[2])
                 elif e[0] == self.NOTELEN_TIME:
                     notelen = e[1]
                 elif e[0] == self.NOTE_ON:
                     if set_patch_flag:
                         if set_patch_delay:
-                            v = v + mfutils.mf_note_off(set_patch_delay, 0, 0, 0)
+                            w.note_off(set_patch_delay, 0, 0, 0)
                         set_patch_flag = False
-                    v = v + mfutils.mf_note_on(int(96 * 4 * notelen), e[1], e[2], e[3])
+                    w.note_on(self._midifile_delta(notelen), e[1], e[2], e[3])
                     notelen = 0
                 elif e[0] == self.NOTE_OFF:
-                    v = v + mfutils.mf_note_off(int(96 * 4 * notelen), e[1], e[2], e[3])
+                    w.note_off(self._midifile_delta(notelen), e[1], e[2], e[3])
                     notelen = 0
                 elif e[0] == self.SET_PATCH:
-                    v = v + mfutils.mf_program_change(e[1], e[2])
+                    w.program_change(e[1], e[2])
                     set_patch_flag = True
                 elif e[0] == self.VOLUME:
-                    v = v + mfutils.mf_volume_change(e[1], e[2])
+                    w.volume_change(e[1], e[2])
                 elif e[0] == self.BENDER:
                     logging.debug("create_midifile: FIXME todo: seq_bender for play_with_drvmidi")
                     #m.seq_bender(DEV, e[1], e[2])
                 else:
                     raise Exception("mpd.track: Corrupt track error")
-        f = open(filename, "w")
-        mfutils.MThd(f)
-        f.write("MTrk")
-        mfutils.write_int32(f, len(v)+4)
-        v = v + mfutils.mf_end_of_track()
-        mfutils.write_vect(f, v)
-        f.close()
+        w.write(filename)
+    @staticmethod
+    def _midifile_delta(notelen):
+        """
+        Return notelen, a Rat or 0, as MIDI ticks. Rounds down like
+        int(96 * 4 * notelen) does.
+        """
+        if not notelen:
+            return 0
+        return notelen.m_num * 4 * mfutils.MThd.PPQN / notelen.m_den
     def str_repr(self, details=0):
         v = []
         for e in self:
@@ -425,6 +536,14 @@ class Track:
         else:
             self.m_default_velocity = default_velocity
         self.m_v = []
+    def copy(self):
+        """
+        Return a copy of the track. The events are copied too, so the
+        event times and pitches of the copy can be changed.
+        """
+        ret = copy.copy(self)
+        ret.m_v = [copy.copy(e) for e in self.m_v]
+        return ret
     def start_note(self, pitch, vel=None):
         assert 0 <= int(pitch) < 128
         if vel is None:
@@ -486,11 +605,12 @@ class Track:
         self.m_v.append([self.BENDER, chn, value])
     def merge_with(self, B):
         D = {}
+        timeline = create_timeline(self.get_durations() + B.get_durations())
         for track in [self, B]:
-            pos = Rat(0, 1)
+            pos = timeline.m_start
             for event in track.m_v:
                 if isinstance(event, Delay):
-                    pos = pos + event.m_duration
+                    pos = pos + timeline.pos(event.m_duration)
                 else:
                     if pos not in D:
                         D[pos] = []
@@ -501,7 +621,7 @@ class Track:
         for x in range(len(kv)-1):
             for event in D[kv[x]]:
                 self.m_v.append(event)
-            self.m_v.append(Delay(kv[x+1]-kv[x]))
+            self.m_v.append(Delay(timeline.rat(kv[x+1]-kv[x])))
         for event in D[kv[-1]]:
             self.m_v.append(event)
     def replace_note(self, old, new):
@@ -513,18 +633,23 @@ class Track:
             if isinstance(event, (NoteOnEvent, NoteOffEvent)) \
                     and event.m_pitch == old:
                 event.m_pitch = new
-    def calculate_event_times(self):
+    def get_durations(self):
+        """
+        Return a list of the durations of the Delay events.
+        """
+        return [e.m_duration for e in self.m_v if isinstance(e, Delay)]
+    def calculate_event_positions(self, timeline):
         """
-        Set the variable m_time on each Event. Well actually we don't set
-        it on the Delay events because events of that type does not generate
-        any events when generating music.
+        Set the variable m_pos on each Event, except Delay events, to
+        the position on the Timeline. timeline must be created with
+        durations including the ones returned by get_durations.
         """
-        pos = Rat(0, 1)
+        pos = timeline.m_start
         for e in self.m_v:
             if isinstance(e, Delay):
-                pos += e.m_duration
+                pos += timeline.pos(e.m_duration)
             else:
-                e.m_time = pos
+                e.m_pos = pos
 
 class PercussionTrack(Track):
     def __init__(self):
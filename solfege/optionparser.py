@@ -54,6 +54,12 @@ class SolfegeOptionParser(optparse.OptionParser):
         self.add_option('--make-screenshots', action='store_true',
             dest='screenshots',
             help=_("Create or update the screenshots for the user manual. Intended for developers of this program."))
+        self.add_option('--precompile-lessonfiles', action='store_true',
+            dest='precompile_lessonfiles',
+            help=_("Save the parse trees of the standard lesson files, so that they load faster. Intended for packagers."))
+        self.add_option('--aggregate-statistics', dest='aggregate_statistics',
+            metavar='FILE',
+            help=_("Save a summary of the statistics of all the user profiles in FILE, a sqlite database, or a CSV file if the name ends with .csv. Intended for teachers."))
     
     def print_help(self, outfile=None):
         if outfile is None:
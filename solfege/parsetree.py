@@ -197,6 +197,13 @@ class Program(CodeBlock):
     def __init__(self):
         CodeBlock.__init__(self)
 
+    def __getstate__(self):
+        # The interpreted modules cached by lfmod.library_interpreter
+        # are not pickled with the tree.
+        state = self.__dict__.copy()
+        state.pop('_interpreted', None)
+        return state
+
     def dump(self, indent=0):
         print "Program:"
         for statement in self:
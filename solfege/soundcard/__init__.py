@@ -133,6 +133,14 @@ def initialise_devicefile(devicefile, devicenum=0, verbose_init=0):
                                                 verbose_init)
     solfege.mpd.track.set_patch_delay = cfg.get_int("app/set_patch_delay")
 
+def initialise_softsynth(verbose_init=0):
+    """
+    This function should only be called if the numpy module is available.
+    """
+    global synth
+    from solfege.soundcard import softsynth
+    synth = softsynth.SoftSynth(verbose_init)
+
 def initialise_using_fake_synth(verbose_init=None):
     global synth
     import solfege.soundcard.fakesynth
@@ -148,11 +156,15 @@ def start_export(filename):
     midiexporter.start_export(filename)
 
 def end_export():
+    """
+    Return the list of MidiEventStreams written to the file.
+    """
     global midiexporter, _saved_synth, synth
-    midiexporter.end_export()
+    streams = midiexporter.end_export()
     assert _saved_synth is not None
     synth = _saved_synth
     _saved_synth = None
+    return streams
 
 instrument_sections = (
     'piano',
@@ -34,8 +34,14 @@ class MidiExporter(object):
         self.m_filename = filename
         self.m_stream_list = []
     def end_export(self):
+        """
+        Write the midi file and return the list of MidiEventStreams
+        written to it.
+        """
+        streams = self.m_stream_list
         if self.m_stream_list:
             self.m_stream_list[0].create_midifile(self.m_filename, self.m_stream_list[1:])
             self.m_filename = None
             del self.m_stream_list
+        return streams
 
@@ -0,0 +1,285 @@
+# GNU Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Detect the pitch of sung or played tones in PCM audio using numpy.
+
+The audio is read as blocks of float32 samples in the range -1.0 to 1.0
+from a PCM source: a WAV file, a pipe from a recording program or the
+OSS audio device. open_audio_source picks the first source that works.
+PitchDetector.track cuts the blocks into overlapping frames and
+estimates the fundamental frequency of each frame, using either the
+YIN algorithm or the harmonic product spectrum of the windowed FFT.
+
+This module should only be imported if the numpy module is available.
+"""
+
+from __future__ import absolute_import
+import locale
+import subprocess
+import wave
+
+import numpy
+
+from solfege import utils
+
+SAMPLE_RATE = 22050
+
+# Recording programs tried by open_audio_source if the OSS audio device
+# cannot be opened. They write raw signed 16 bit little endian mono
+# samples to stdout.
+RECORD_COMMANDS = (
+    ["arecord", "-q", "-f", "S16_LE", "-c", "1", "-r", "%(rate)i", "-t", "raw"],
+    ["parec", "--format=s16le", "--channels=1", "--rate=%(rate)i"],
+)
+
+class AudioSourceException(Exception):
+    pass
+
+def pcm16_to_float(data):
+    """
+    Return a numpy float32 array of the signed 16 bit little endian
+    mono samples in the str data.
+    """
+    return numpy.frombuffer(data[:len(data) // 2 * 2], '<i2').astype(numpy.float32) / 32768
+
+def wav_blocks(filename, blocksize=1024):
+    """
+    Yield the samples of the 16 bit WAV file in blocks of blocksize
+    samples. Only the first channel of stereo files is used.
+    """
+    f = wave.open(filename, 'rb')
+    try:
+        if f.getsampwidth() != 2:
+            raise ValueError("%s: only 16 bit WAV files are supported" % filename)
+        channels = f.getnchannels()
+        while True:
+            data = f.readframes(blocksize)
+            if not data:
+                break
+            yield pcm16_to_float(data)[::channels]
+    finally:
+        f.close()
+
+def wav_sample_rate(filename):
+    f = wave.open(filename, 'rb')
+    try:
+        return f.getframerate()
+    finally:
+        f.close()
+
+def pipe_blocks(fileobj, blocksize=1024):
+    """
+    Yield blocks of samples read from a file object giving raw signed
+    16 bit little endian mono samples, for example the stdout of
+    "arecord -f S16_LE -c 1 -r 22050 -t raw" or "parec --format=s16le
+    --channels=1 --rate=22050".
+    """
+    while True:
+        data = fileobj.read(blocksize * 2)
+        if not data:
+            break
+        yield pcm16_to_float(data)
+
+class OSSAudioSource(object):
+    """
+    Record from the OSS audio device /dev/dsp.
+    """
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        import ossaudiodev
+        self.m_dev = ossaudiodev.open('r')
+        self.m_dev.setparameters(ossaudiodev.AFMT_S16_LE, 1, sample_rate)
+    def blocks(self, blocksize=1024):
+        while self.m_dev:
+            yield pcm16_to_float(self.m_dev.read(blocksize * 2))
+    def close(self):
+        if self.m_dev:
+            self.m_dev.close()
+            self.m_dev = None
+
+class PipeAudioSource(object):
+    """
+    Record from the stdout of a recording program, see RECORD_COMMANDS.
+    Raise OSError if the program cannot be run.
+    """
+    def __init__(self, cmdline):
+        self.m_cmdline = cmdline
+        self.m_proc = subprocess.Popen(cmdline, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+    def blocks(self, blocksize=1024):
+        """
+        Yield blocks until the program stops. Raise AudioSourceException
+        with the error messages of the program if it fails, for example
+        because arecord is installed but there is no capture device.
+        """
+        for block in pipe_blocks(self.m_proc.stdout, blocksize):
+            yield block
+        if self.m_proc.wait():
+            msg = self.m_proc.stderr.read().strip().decode(
+                locale.getpreferredencoding(), 'replace')
+            if not msg:
+                msg = u"exit status %i" % self.m_proc.returncode
+            raise AudioSourceException(u"%s: %s" % (self.m_cmdline[0], msg))
+    def close(self):
+        if self.m_proc:
+            if self.m_proc.poll() is None:
+                self.m_proc.terminate()
+            self.m_proc.stdout.close()
+            self.m_proc.stderr.close()
+            self.m_proc.wait()
+            self.m_proc = None
+
+def open_audio_source(sample_rate=SAMPLE_RATE):
+    """
+    Return an audio source recording from the OSS audio device, or if
+    that fails, from the first program in RECORD_COMMANDS that can be run.
+    Raise AudioSourceException if none of them works.
+    """
+    errors = []
+    try:
+        return OSSAudioSource(sample_rate)
+    except (ImportError, IOError, OSError), e:
+        errors.append("/dev/dsp: %s" % e)
+    for cmdline in RECORD_COMMANDS:
+        try:
+            return PipeAudioSource([a % {'rate': sample_rate} for a in cmdline])
+        except OSError, e:
+            errors.append("%s: %s" % (cmdline[0], e))
+    raise AudioSourceException("\n".join(errors))
+
+def parabolic_peak(v, i):
+    """
+    Return the position of the vertex of the parabola through the
+    values at i-1, i and i+1 in v.
+    """
+    if i < 1 or i >= len(v) - 1:
+        return float(i)
+    a, b, c = v[i - 1], v[i], v[i + 1]
+    d = a - 2 * b + c
+    if d == 0:
+        return float(i)
+    return i + 0.5 * (a - c) / d
+
+class PitchDetector(object):
+    """
+    method is 'yin' or 'hps'. frame_size and hop are in samples, and
+    frames quieter than min_rms are considered silence. Only frequencies
+    between min_freq and max_freq are detected.
+    """
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_size=2048, hop=512,
+                 method='yin', min_freq=60.0, max_freq=1500.0,
+                 threshold=0.15, min_rms=0.01, harmonics=5):
+        assert method in ('yin', 'hps')
+        self.m_sample_rate = sample_rate
+        self.m_frame_size = frame_size
+        self.m_hop = hop
+        self.m_method = method
+        self.m_min_freq = min_freq
+        self.m_max_freq = max_freq
+        self.m_threshold = threshold
+        self.m_min_rms = min_rms
+        self.m_harmonics = harmonics
+        self.m_window = numpy.hanning(frame_size).astype(numpy.float32)
+        # YIN compare the first half of the frame with lagged copies,
+        # so the lowest frequency must fit within half the frame.
+        self.m_min_lag = max(int(sample_rate / max_freq), 2)
+        self.m_max_lag = min(int(sample_rate / min_freq), frame_size // 2 - 1)
+    def detect(self, frame):
+        """
+        Return the fundamental frequency of the frame in Hz, or None if
+        the frame is silent or has no clear pitch.
+        """
+        if numpy.sqrt(numpy.mean(numpy.square(frame))) < self.m_min_rms:
+            return None
+        if self.m_method == 'yin':
+            return self.detect_yin(frame)
+        return self.detect_hps(frame)
+    def detect_yin(self, frame):
+        w = len(frame) // 2
+        x = frame.astype(numpy.float64)
+        # The difference function d(tau) = sum((x[j] - x[j+tau])**2) for
+        # j in 0..w-1, computed for all lags at once from the energies
+        # and the cross correlation of x[:w] and x.
+        n = 1 << int(numpy.ceil(numpy.log2(len(x) + w)))
+        corr = numpy.fft.irfft(numpy.fft.rfft(x, n)
+                               * numpy.conj(numpy.fft.rfft(x[:w], n)), n)[:w]
+        energy = numpy.concatenate(([0.0], numpy.cumsum(x * x)))
+        diff = energy[w] + (energy[w:2 * w] - energy[:w]) - 2 * corr
+        diff[0] = 0.0
+        # Cumulative mean normalized difference
+        cmnd = numpy.ones(w)
+        cumsum = numpy.cumsum(diff[1:])
+        cmnd[1:] = diff[1:] * numpy.arange(1, w) / numpy.where(cumsum == 0, 1, cumsum)
+        lags = cmnd[self.m_min_lag:self.m_max_lag + 1]
+        below = numpy.nonzero(lags < self.m_threshold)[0]
+        if not len(below):
+            return None
+        i = below[0]
+        # Walk down to the bottom of the dip.
+        while i + 1 < len(lags) and lags[i + 1] < lags[i]:
+            i += 1
+        tau = parabolic_peak(cmnd, i + self.m_min_lag)
+        return self.m_sample_rate / tau
+    def detect_hps(self, frame):
+        n = len(frame) * 4
+        spectrum = numpy.abs(numpy.fft.rfft(frame * self.m_window, n))
+        # The product of the spectrum downsampled by 1..harmonics is
+        # computed as a sum of logarithms. The floor keep a missing
+        # harmonic from cancelling the fundamental.
+        size = len(spectrum) // self.m_harmonics
+        logspec = numpy.log(spectrum + spectrum.max() * 1e-3 + 1e-12)
+        hps = logspec[:size].copy()
+        for h in range(2, self.m_harmonics + 1):
+            hps += logspec[::h][:size]
+        bin_hz = float(self.m_sample_rate) / n
+        lo = max(int(self.m_min_freq / bin_hz), 1)
+        hi = min(int(self.m_max_freq / bin_hz) + 1, size - 1)
+        if lo >= hi:
+            return None
+        i = lo + int(numpy.argmax(hps[lo:hi]))
+        # Refine the frequency on the magnitude spectrum around the
+        # fundamental.
+        return parabolic_peak(spectrum, i) * bin_hz
+    def frames(self, blocks):
+        """
+        Yield overlapping frames of frame_size samples, hop samples
+        apart, from the iterator of sample blocks.
+        """
+        buf = numpy.zeros(0, numpy.float32)
+        for block in blocks:
+            buf = numpy.concatenate((buf, block))
+            start = 0
+            while start + self.m_frame_size <= len(buf):
+                yield buf[start:start + self.m_frame_size]
+                start += self.m_hop
+            buf = buf[start:]
+    def track(self, blocks):
+        """
+        Yield a tuple (time, freq) for each frame of the iterator of
+        sample blocks. time is the start of the frame in seconds, and
+        freq is None if no pitch was detected.
+        """
+        for i, frame in enumerate(self.frames(blocks)):
+            yield float(i * self.m_hop) / self.m_sample_rate, self.detect(frame)
+
+def freq_to_notename_cent(freq):
+    """
+    Return (notename, cent) for the frequency, or (None, None) if
+    freq is None.
+    """
+    if freq is None:
+        return None, None
+    return utils.freq_to_notename_cent(freq)
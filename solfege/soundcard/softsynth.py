@@ -0,0 +1,281 @@
+# GNU Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A software synthesizer that render MidiEventStreams to PCM audio using
+numpy. It does not sound like a real GM synth, but it is good enough
+for ear training, and it does not need a MIDI device or an external
+program to play the music.
+
+This module should only be imported if the numpy module is available.
+"""
+
+from __future__ import absolute_import
+import logging
+import os
+import tempfile
+import threading
+import wave
+
+import numpy
+
+from solfege.mpd.track import MidiEventStream
+from solfege.soundcard.synth_common import SynthCommon
+from solfege import soundcard
+
+SAMPLE_RATE = 22050
+TABLE_SIZE = 2048
+
+# One entry for each of the 16 instrument families of General MIDI, in
+# the same order as soundcard.instrument_sections. Each entry is a
+# tuple of the relative amplitudes of the harmonics of the waveform,
+# and the attack, decay, sustain level and release of the envelope.
+# Times are in seconds.
+FAMILIES = (
+    ((1, .5, .3, .2, .1, .05), .005, .8, .2, .2), # piano
+    ((1, 0, .4, 0, .2), .002, .9, .05, .4), # cromatic percussion
+    ((1, .8, .6, .4, .3, .2, .1, .1), .02, .05, .9, .05), # organ
+    ((1, .6, .4, .3, .2, .1), .003, .6, .15, .2), # guitar
+    ((1, .4, .1), .005, .4, .5, .1), # bass
+    ((1, .5, .33, .25, .2, .17, .14), .08, .1, .9, .25), # strings
+    ((1, .5, .33, .25, .2), .1, .1, .9, .3), # ensemble
+    ((1, .8, .6, .5, .4, .3, .2), .04, .1, .8, .1), # brass
+    ((1, 0, .5, 0, .3, 0, .2), .03, .1, .8, .08), # reed
+    ((1, .1, .05), .05, .1, .8, .1), # pipe
+    ((1, 0, .33, 0, .2, 0, .14), .01, .1, .8, .1), # synth lead
+    ((1, .5, .33, .25), .3, .3, .8, .5), # synth pad
+    ((1, .3, .6, .2), .05, .3, .6, .3), # synth effects
+    ((1, .7, .2, .3), .005, .4, .3, .2), # ethnic
+    ((1, .2, .5, .1), .001, .3, 0, .1), # percussive
+    ((1,), .01, .1, .5, .1), # sound effects
+)
+
+PERCUSSION_LENGTH = 0.25
+
+class Renderer(object):
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.m_sample_rate = sample_rate
+        self.m_wavetables = {}
+        self.m_noise = numpy.random.RandomState(0).uniform(-1, 1,
+            int(PERCUSSION_LENGTH * sample_rate)).astype(numpy.float32)
+    def get_wavetable(self, family):
+        """
+        Return one period of the waveform of the instrument family.
+        """
+        if family not in self.m_wavetables:
+            phase = numpy.arange(TABLE_SIZE) * (2 * numpy.pi / TABLE_SIZE)
+            table = numpy.zeros(TABLE_SIZE)
+            for i, amplitude in enumerate(FAMILIES[family][0]):
+                if amplitude:
+                    table += amplitude * numpy.sin((i + 1) * phase)
+            table /= numpy.abs(table).max()
+            self.m_wavetables[family] = table.astype(numpy.float32)
+        return self.m_wavetables[family]
+    def get_notes(self, streams):
+        """
+        Return a tuple (notes, length). notes is a list of tuples
+        (start, stop, channel, pitch, velocity, patch, volume), with
+        start and stop in seconds. length is the length of the music
+        in seconds. The streams are played after each other, like
+        MidiEventStream.create_midifile does.
+        """
+        # Seconds per whole note. create_midifile starts the midi file
+        # with a tempo of 60 quarter notes per minute.
+        whole = 4.0
+        pos = 0.0
+        patch = [0] * 16
+        volume = [100] * 16
+        playing = {}
+        notes = []
+        for stream in streams:
+            for e in stream:
+                if e[0] == MidiEventStream.TEMPO:
+                    whole = 60.0 * e[2] / e[1]
+                elif e[0] == MidiEventStream.NOTELEN_TIME:
+                    pos += float(e[1]) * whole
+                elif e[0] == MidiEventStream.SET_PATCH:
+                    patch[e[1]] = e[2]
+                elif e[0] == MidiEventStream.VOLUME:
+                    volume[e[1]] = e[2]
+                elif e[0] == MidiEventStream.NOTE_ON:
+                    playing[e[1], e[2]] = (pos, e[3], patch[e[1]], volume[e[1]])
+                elif e[0] == MidiEventStream.NOTE_OFF:
+                    if (e[1], e[2]) not in playing:
+                        continue
+                    start, velocity, p, v = playing.pop((e[1], e[2]))
+                    notes.append((start, pos, e[1], e[2], velocity, p, v))
+        # Tones never stopped are stopped at the end of the music.
+        for (channel, pitch), (start, velocity, p, v) in playing.items():
+            notes.append((start, pos, channel, pitch, velocity, p, v))
+        return notes, pos
+    def envelope(self, held, release, family):
+        """
+        Return the ADSR envelope of a tone of the instrument family
+        that is held for HELD samples and then released for
+        RELEASE samples.
+        """
+        attack, decay, sustain = FAMILIES[family][1:4]
+        attack = max(int(attack * self.m_sample_rate), 1)
+        decay = max(int(decay * self.m_sample_rate), 1)
+        t = numpy.arange(held + release, dtype=numpy.float32)
+        env = numpy.where(t < attack, t / attack,
+                numpy.maximum(sustain,
+                              1 - (1 - sustain) * (t - attack) / decay))
+        if release:
+            level = env[held - 1] if held else 0.0
+            env[held:] = level * numpy.linspace(1, 0, release)
+        return env
+    def render_tone(self, duration, pitch, patch):
+        family = patch // 8
+        held = max(int(duration * self.m_sample_rate), 1)
+        release = int(FAMILIES[family][4] * self.m_sample_rate)
+        freq = 440.0 * 2 ** ((pitch - 69) / 12.0)
+        idx = (numpy.arange(held + release) * (freq * TABLE_SIZE / self.m_sample_rate)).astype(numpy.int64) % TABLE_SIZE
+        return self.get_wavetable(family)[idx] * self.envelope(held, release, family)
+    def render_percussion(self, pitch):
+        """
+        Return a short noise burst. Low pitches, the bass drums, decay
+        slower than the cymbals and other high pitches.
+        """
+        t = numpy.arange(len(self.m_noise), dtype=numpy.float32) / self.m_sample_rate
+        return self.m_noise * numpy.exp(-t * max(pitch - 20, 10) * 2)
+    def render(self, streams):
+        """
+        Return a numpy float32 array with the samples of the streams,
+        scaled to be in the range -1.0 to 1.0.
+        """
+        notes, length = self.get_notes(streams)
+        buf = numpy.zeros(int((length + 0.5) * self.m_sample_rate) + 1,
+                          numpy.float32)
+        for start, stop, channel, pitch, velocity, patch, volume in notes:
+            if channel == MidiEventStream.ChannelDevice.percussion_MIDI_channel:
+                tone = self.render_percussion(pitch)
+            else:
+                tone = self.render_tone(stop - start, pitch, patch)
+            i = int(start * self.m_sample_rate)
+            tone = tone[:len(buf) - i]
+            buf[i:i + len(tone)] += tone * (0.3 * velocity * volume / 127 ** 2)
+        peak = numpy.abs(buf).max() if len(buf) else 0
+        if peak > 1.0:
+            buf /= peak
+        return buf
+
+def to_pcm16(buf):
+    """
+    Return a str with the samples in buf as signed 16 bit little endian.
+    """
+    return (buf * 32767).astype('<i2').tostring()
+
+def write_wav(filename, buf, sample_rate=SAMPLE_RATE):
+    f = wave.open(filename, 'wb')
+    f.setnchannels(1)
+    f.setsampwidth(2)
+    f.setframerate(sample_rate)
+    f.writeframes(to_pcm16(buf))
+    f.close()
+
+def render_to_wav(streams, filename):
+    """
+    Render the list of MidiEventStreams to a WAV file.
+    """
+    write_wav(filename, Renderer().render(streams))
+
+class OSSAudioSink(object):
+    """
+    Play PCM data on the OSS audio device /dev/dsp from a thread,
+    so that play() return at once.
+    """
+    CHUNK = 4096
+    def __init__(self, sample_rate):
+        import ossaudiodev
+        self.m_dev = ossaudiodev.open('w')
+        self.m_dev.setparameters(ossaudiodev.AFMT_S16_LE, 1, sample_rate)
+        self.m_lock = threading.Lock()
+        self.m_thread = None
+        self.m_stop = False
+    def play(self, pcm):
+        self.stop()
+        self.m_stop = False
+        self.m_thread = threading.Thread(target=self._write, args=(pcm,))
+        self.m_thread.setDaemon(True)
+        self.m_thread.start()
+    def _write(self, pcm):
+        for i in range(0, len(pcm), self.CHUNK):
+            if self.m_stop:
+                break
+            with self.m_lock:
+                self.m_dev.write(pcm[i:i + self.CHUNK])
+    def stop(self):
+        if self.m_thread:
+            self.m_stop = True
+            self.m_thread.join()
+            self.m_thread = None
+            with self.m_lock:
+                self.m_dev.reset()
+    def close(self):
+        self.stop()
+        self.m_dev.close()
+
+def open_audio_sink(sample_rate):
+    """
+    Return an object that can play PCM data in-process, or None if
+    no audio device we know how to use is available.
+    """
+    try:
+        return OSSAudioSink(sample_rate)
+    except (ImportError, IOError, EnvironmentError), e:
+        logging.debug("softsynth: no OSS audio device: %s", e)
+        return None
+
+class SoftSynth(SynthCommon):
+    NUM_CHANNELS = 16
+    def __init__(self, verbose_init):
+        SynthCommon.__init__(self)
+        self.m_type_major = "Softsynth"
+        self.m_renderer = Renderer()
+        self.m_sink = open_audio_sink(self.m_renderer.m_sample_rate)
+        fd, self.m_tmpfilename = tempfile.mkstemp(".wav")
+        os.close(fd)
+        self.error_report_cb = None
+        if verbose_init:
+            print "Solfege will use the built-in software synth."
+            if self.m_sink:
+                print "Playing on the OSS audio device."
+            else:
+                print "Playing the WAV file %s with the WAV player." % self.m_tmpfilename
+    def close(self):
+        if self.m_sink:
+            self.m_sink.close()
+            self.m_sink = None
+        try:
+            if os.path.exists(self.m_tmpfilename):
+                os.remove(self.m_tmpfilename)
+        except OSError:
+            pass
+    def play_track(self, *tracks):
+        self.play_midieventstream(MidiEventStream(*tracks))
+    def play_midieventstream(self, midieventstream):
+        buf = self.m_renderer.render([midieventstream])
+        if self.m_sink:
+            self.m_sink.play(to_pcm16(buf))
+        else:
+            write_wav(self.m_tmpfilename, buf, self.m_renderer.m_sample_rate)
+            soundcard.play_mediafile('wav', self.m_tmpfilename)
+    def stop(self):
+        if self.m_sink:
+            self.m_sink.stop()
+        else:
+            self.play_midieventstream(MidiEventStream())
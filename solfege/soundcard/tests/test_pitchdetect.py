@@ -0,0 +1,86 @@
+# Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+# License is GPL, see file COPYING
+
+from __future__ import absolute_import
+import os
+import unittest
+import wave
+
+from solfege.testlib import outdir
+try:
+    import numpy
+    from solfege.soundcard import pitchdetect
+except ImportError:
+    pitchdetect = None
+
+def tone(freq, seconds, sample_rate=22050):
+    t = numpy.arange(int(seconds * sample_rate)) / float(sample_rate)
+    x = numpy.zeros(len(t))
+    for h, a in ((1, .5), (2, .3), (3, .15)):
+        x += a * numpy.sin(2 * numpy.pi * h * freq * t)
+    return x.astype(numpy.float32)
+
+class TestPitchDetector(unittest.TestCase):
+    def check_method(self, method):
+        d = pitchdetect.PitchDetector(method=method)
+        for freq in (98.0, 220.0, 440.0, 880.0):
+            freqs = [f for t, f in d.track([tone(freq, 0.5)])]
+            self.assertEquals(len(freqs), (11025 - 2048) // 512 + 1)
+            for f in freqs:
+                self.assertTrue(abs(f - freq) / freq < 0.005, (method, freq, f))
+    def test_yin(self):
+        self.check_method('yin')
+    def test_hps(self):
+        self.check_method('hps')
+    def test_silence(self):
+        d = pitchdetect.PitchDetector()
+        self.assertEquals(d.detect(numpy.zeros(2048, numpy.float32)), None)
+    def test_frames(self):
+        d = pitchdetect.PitchDetector(frame_size=4, hop=2)
+        frames = [list(f) for f in d.frames(
+            [numpy.arange(3), numpy.arange(3, 5), numpy.arange(5, 9)])]
+        self.assertEquals(frames, [[0, 1, 2, 3], [2, 3, 4, 5], [4, 5, 6, 7]])
+    def test_wav_blocks(self):
+        fn = os.path.join(outdir, "pitchdetect.wav")
+        f = wave.open(fn, 'wb')
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(22050)
+        f.writeframes((tone(330.0, 0.3) * 32767).astype('<i2').tostring())
+        f.close()
+        self.assertEquals(sum(len(b) for b in pitchdetect.wav_blocks(fn)),
+                          int(0.3 * 22050))
+        d = pitchdetect.PitchDetector(sample_rate=pitchdetect.wav_sample_rate(fn))
+        for t, freq in d.track(pitchdetect.wav_blocks(fn)):
+            self.assertEquals(pitchdetect.freq_to_notename_cent(freq)[0], 'e')
+        os.remove(fn)
+    def test_pipe_source(self):
+        fn = os.path.join(outdir, "pitchdetect.raw")
+        f = open(fn, 'wb')
+        f.write((tone(330.0, 0.3) * 32767).astype('<i2').tostring())
+        f.close()
+        source = pitchdetect.PipeAudioSource(["cat", fn])
+        self.assertEquals(sum(len(b) for b in source.blocks()),
+                          int(0.3 * 22050))
+        source.close()
+        self.assertEquals(source.m_proc, None)
+        os.remove(fn)
+    def test_pipe_source_fails(self):
+        source = pitchdetect.PipeAudioSource(
+            ["sh", "-c", "echo no capture device >&2; exit 1"])
+        try:
+            list(source.blocks())
+        except pitchdetect.AudioSourceException, e:
+            self.assertEquals(unicode(e), u"sh: no capture device")
+        else:
+            self.fail("AudioSourceException not raised")
+        source.close()
+    def test_pipe_source_missing_program(self):
+        self.assertRaises(OSError, pitchdetect.PipeAudioSource,
+                          ["solfege-no-such-recording-program"])
+
+if pitchdetect:
+    suite = unittest.makeSuite(TestPitchDetector)
+else:
+    suite = unittest.TestSuite()
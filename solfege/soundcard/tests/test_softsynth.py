@@ -0,0 +1,50 @@
+# Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+# License is GPL, see file COPYING
+
+from __future__ import absolute_import
+import os
+import unittest
+import wave
+
+from solfege.mpd.track import Track, MidiEventStream
+from solfege.testlib import outdir
+try:
+    from solfege.soundcard import softsynth
+except ImportError:
+    softsynth = None
+
+class TestSoftSynth(unittest.TestCase):
+    def setUp(self):
+        self.renderer = softsynth.Renderer()
+        self.track = Track()
+        self.track.set_bpm(120)
+        self.track.note(4, 69, 100)
+        self.track.note(2, 72, 100)
+    def test_get_notes(self):
+        notes, length = self.renderer.get_notes([MidiEventStream(self.track)])
+        self.assertEquals(len(notes), 2)
+        self.assertEquals(notes[0][:4], (0.0, 0.5, 0, 69))
+        self.assertEquals(notes[1][:4], (0.5, 1.5, 0, 72))
+        self.assertEquals(length, 1.5)
+    def test_render(self):
+        buf = self.renderer.render([MidiEventStream(self.track)])
+        self.assertEquals(len(buf), int(2.0 * softsynth.SAMPLE_RATE) + 1)
+        self.assertTrue(0 < abs(buf).max() <= 1.0)
+        self.assertEquals(len(self.renderer.render([MidiEventStream()])),
+                          int(0.5 * softsynth.SAMPLE_RATE) + 1)
+    def test_render_to_wav(self):
+        fn = os.path.join(outdir, "softsynth.wav")
+        softsynth.render_to_wav([MidiEventStream(self.track)], fn)
+        f = wave.open(fn, 'rb')
+        self.assertEquals(f.getnchannels(), 1)
+        self.assertEquals(f.getsampwidth(), 2)
+        self.assertEquals(f.getframerate(), softsynth.SAMPLE_RATE)
+        self.assertEquals(f.getnframes(), int(2.0 * softsynth.SAMPLE_RATE) + 1)
+        f.close()
+        os.remove(fn)
+
+if softsynth:
+    suite = unittest.makeSuite(TestSoftSynth)
+else:
+    suite = unittest.TestSuite()
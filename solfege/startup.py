@@ -104,6 +104,21 @@ if options.warranty:
     print solfege.application.warranty
     sys.exit()
 
+if options.precompile_lessonfiles:
+    print "Saved the parse trees of %i lesson files in %s" % (
+        lessonfile.ParseTreeCache([lessonfile.precompiled_dir]).precompile(
+            os.path.join(lessonfile.exercises_dir, u"lesson-files")),
+        lessonfile.precompiled_dir)
+    sys.exit()
+
+if options.aggregate_statistics:
+    count, errors = statistics.aggregate_profiles(options.aggregate_statistics)
+    for error in errors:
+        print >> sys.stderr, error
+    print "Saved the statistics of %i profiles in %s" % (
+        count, options.aggregate_statistics)
+    sys.exit()
+
 # redirect error messages to a window that will popup if
 # something bad happens.
 
@@ -140,7 +155,12 @@ def start_gui(datadir):
 
     cfg.set_bool('config/no_random', bool(options.no_random))
 
-    lessonfile.infocache = lessonfile.InfoCache()
+    lessonfile.infocache = lessonfile.InfoCache(
+        os.path.join(filesystem.app_data(), u"infocache.pickle"))
+    lessonfile.parsetreecache = lessonfile.ParseTreeCache([
+        os.path.join(filesystem.app_data(), u"parsetrees"),
+        lessonfile.precompiled_dir])
+    lessonfile.parsetreecache.prune()
 
     def f(s):
         if solfege.splash_win:
@@ -196,7 +216,8 @@ def start_gui(datadir):
     # We parse all lesson files when we are idle to save a half a
     # second the first time the user searches all lesson files using
     # Ctrl-F.
-    lessonfile.infocache.parse_all_files(True)
+    lessonfile.infocache.parse_all_files(True,
+        cfg.get_int('app/lessonfile_scan_processes'))
 
     if options.screenshots:
         make_screenshots.make_screenshots()
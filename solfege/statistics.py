@@ -18,14 +18,19 @@
 
 from __future__ import absolute_import
 
+import csv
 import hashlib
 import logging
+import multiprocessing
 import os
 import pickle
 import shutil
 import sqlite3
+import sys
 import time
 
+from gi.repository import GObject
+
 from solfege import filesystem
 from solfege import lessonfile
 from solfege import mpd
@@ -58,6 +63,9 @@ class DB(object):
     class VariableTypeError(Exception): pass
     class VariableUndefinedError(Exception): pass
     class FileNotInDB(Exception): pass
+    # Answers are kept in memory, and saved this many seconds after
+    # the first unsaved answer. See add_answer.
+    FLUSH_INTERVAL = 10
     def __init__(self, callback=None, profile=None):
         """
         callback is called to display progress when scanning lesson files.
@@ -66,6 +74,9 @@ class DB(object):
         app_data()/profiles/PROFILENAME
         """
         self.m_profile = profile
+        self.m_pending_sessioninfo = {}
+        self.m_pending_answers = {}
+        self.m_flush_handle = None
         try:
             if testsuite_is_running:
                 statistics_filename = ":memory:"
@@ -81,7 +92,7 @@ class DB(object):
 
             if not os.path.exists(head):
                 os.makedirs(head)
-        self.conn = sqlite3.connect(statistics_filename)
+        self.connect(statistics_filename)
         # Solfege 3.15.0-3.15.2
 
         if self.drop_if_has_uuid_column():
@@ -103,9 +114,97 @@ class DB(object):
 
         if db_ver < 3:
             self.upgrade_to_version_3()
-        self.set_variable("database_version", 3)
+
+        if db_ver < 4:
+            self.upgrade_to_version_4()
+
+        if db_ver < 5:
+            self.upgrade_to_version_5()
+        self.set_variable("database_version", 5)
         self.conn.commit()
 
+    def connect(self, filename):
+        self.conn = sqlite3.connect(filename)
+        # With write-ahead logging, a commit appends to the -wal file
+        # instead of writing to the database file and the journal, and
+        # with synchronous=normal it does not wait for the disk. A crash
+        # can lose the last commits, but cannot corrupt the database.
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
+
+    def add_answer(self, fileid, timestamp, sessiontype, answerkey, guessed):
+        """
+        Count one answer. The answers are kept in memory and saved in
+        one transaction by flush, that is called FLUSH_INTERVAL seconds
+        after the first unsaved answer. This way we don't have to wait
+        for the disk every time the user answers a question.
+
+        The session is added to the sessioninfo table together with the
+        first answer, to avoid empty sessions because users start an
+        exercise and then decides it was the wrong exercise.
+        """
+        self.m_pending_sessioninfo.setdefault((fileid, timestamp), sessiontype)
+        key = (fileid, timestamp, answerkey, guessed)
+        self.m_pending_answers[key] = self.m_pending_answers.get(key, 0) + 1
+        if self.m_flush_handle is None:
+            self.m_flush_handle = GObject.timeout_add_seconds(
+                self.FLUSH_INTERVAL, self._flush_timeout)
+
+    def write_pending(self):
+        """
+        Write the answers kept in memory to the database, without
+        committing. This must be done before reading from the
+        sessions and sessioninfo tables.
+        """
+        if self.m_pending_sessioninfo:
+            self.conn.executemany("insert or ignore into sessioninfo "
+                "(fileid, timestamp, sessiontype) values (?, ?, ?)",
+                [k + (v,) for k, v in self.m_pending_sessioninfo.iteritems()])
+            self.m_pending_sessioninfo = {}
+        if self.m_pending_answers:
+            rows = self.m_pending_answers.items()
+            self.m_pending_answers = {}
+            # "insert ... on conflict do update" needs sqlite 3.24, so
+            # we create the missing rows first, and then add the counts.
+            self.conn.executemany("insert or ignore into sessions "
+                "(fileid, timestamp, answerkey, guessed, count) "
+                "values (?, ?, ?, ?, 0)", [k for k, n in rows])
+            self.conn.executemany("update sessions set count=count+? "
+                "where fileid=? and timestamp=? and answerkey=? and guessed=?",
+                [(n,) + k for k, n in rows])
+            summary = {}
+            for (fileid, timestamp, answerkey, guessed), n in rows:
+                v = summary.setdefault((fileid, answerkey), [0, 0])
+                v[0] += n
+                if answerkey == guessed:
+                    v[1] += n
+                summary.setdefault((fileid, guessed), [0, 0])
+            self.conn.executemany("insert or ignore into keysummary "
+                "(fileid, answerkey) values (?, ?)", summary.keys())
+            self.conn.executemany("update keysummary "
+                "set num_guess=num_guess+?, num_correct=num_correct+? "
+                "where fileid=? and answerkey=?",
+                [(v[0], v[1]) + k for k, v in summary.iteritems() if v[0]])
+
+    def flush(self):
+        """
+        Save the answers kept in memory, and commit.
+        """
+        if self.m_flush_handle is not None:
+            GObject.source_remove(self.m_flush_handle)
+            self.m_flush_handle = None
+        self.write_pending()
+        self.conn.commit()
+
+    def _flush_timeout(self):
+        self.m_flush_handle = None
+        self.flush()
+        return False
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
     def insert_file(self, filename):
         assert lessonfile.is_uri(filename) or os.path.isabs(filename)
         self.conn.execute("insert into lessonfiles "
@@ -126,9 +225,14 @@ class DB(object):
             return self.get_noprofile_statistics_filename()
 
     def reset_database(self):
+        if self.m_flush_handle is not None:
+            GObject.source_remove(self.m_flush_handle)
+            self.m_flush_handle = None
+        self.m_pending_sessioninfo = {}
+        self.m_pending_answers = {}
         self.conn.close()
         os.remove(self.get_statistics_filename())
-        self.conn = sqlite3.connect(self.get_statistics_filename())
+        self.connect(self.get_statistics_filename())
         self.create_tables()
 
     def remove_tables(self):
@@ -139,6 +243,7 @@ class DB(object):
         self.conn.execute("drop table if exists sessioninfo")
         self.conn.execute("drop table if exists lessonfiles")
         self.conn.execute("drop table if exists variables")
+        self.conn.execute("drop table if exists keysummary")
         # Current Solfege does not use this table, but we did until
         # the 3.17.0 release. So we remove it if it exists.
         self.conn.execute("drop table if exists tests")
@@ -164,7 +269,30 @@ class DB(object):
         self.conn.execute("create table if not exists sessioninfo "
             "(fileid int, timestamp int, sessiontype int, "
             "unique (fileid, timestamp))")
-        self.set_variable("database_version", 3)
+        self.create_keysummary()
+        self.create_sessioninfo_index()
+        self.set_variable("database_version", 5)
+
+    def create_keysummary(self):
+        """
+        The keysummary table has the all time number of times each
+        key has been asked and answered correctly, so that we don't
+        have to sum all the rows in the sessions table every time
+        the statistics are displayed. There are also rows for keys
+        that only have been guessed, so that the table has all the
+        keys AbstractStatistics.get_keys(True) return.
+        """
+        self.conn.execute("create table if not exists keysummary "
+            "(fileid int not null, answerkey text not null, "
+            "num_guess int not null default 0, "
+            "num_correct int not null default 0, "
+            "primary key (fileid, answerkey))")
+        # The unique constraint on sessions is an index on
+        # (fileid, timestamp, ...). This one is for the queries that
+        # look at one key without limiting the timestamps, and
+        # include count so that sqlite does not have to read the table.
+        self.conn.execute("create index if not exists sessions_answerkey "
+            "on sessions (fileid, answerkey, guessed, count)")
 
     def drop_if_has_uuid_column(self):
         """
@@ -234,6 +362,7 @@ class DB(object):
         Return an int telling the number of practise sessions we have
         stored for the given fileid.
         """
+        self.write_pending()
         count = self.conn.execute("select count(distinct timestamp) from sessions where fileid=?", (fileid,)).fetchone()[0]
         return count if count is not None else 0
 
@@ -243,6 +372,7 @@ class DB(object):
         practise session recorded for this fileid.
         Return None if no sessions are found.
         """
+        self.write_pending()
         return self.conn.execute("select min(timestamp) from sessions where fileid=?",
                           (fileid,)).fetchone()[0]
 
@@ -252,16 +382,66 @@ class DB(object):
         practise session recorded for this fileid.
         Return None if no sessions are found.
         """
+        self.write_pending()
         return self.conn.execute("select max(timestamp) from sessions where fileid=?",
                           (fileid,)).fetchone()[0]
 
     def delete_statistics(self, filename):
         fileid = self.get_fileid(filename)
+        self.write_pending()
         cursor = self.conn.cursor()
         cursor.execute("delete from sessions where fileid=?", (fileid,))
         cursor.execute("delete from sessioninfo where fileid=?", (fileid,))
+        cursor.execute("delete from keysummary where fileid=?", (fileid,))
         self.conn.commit()
 
+    def delete_session(self, fileid, timestamp):
+        """
+        Delete the answers from one practise session.
+        """
+        self.write_pending()
+        self.conn.execute("update keysummary set "
+            "num_guess=num_guess-(select coalesce(sum(count), 0) from sessions "
+            "  where sessions.fileid=keysummary.fileid and timestamp=? "
+            "  and sessions.answerkey=keysummary.answerkey), "
+            "num_correct=num_correct-(select coalesce(sum(count), 0) from sessions "
+            "  where sessions.fileid=keysummary.fileid and timestamp=? "
+            "  and sessions.answerkey=keysummary.answerkey "
+            "  and sessions.guessed=keysummary.answerkey) "
+            "where fileid=?", (timestamp, timestamp, fileid))
+        self.conn.execute("delete from sessions "
+            "where fileid=? and timestamp=?", (fileid, timestamp))
+        self.conn.execute("delete from keysummary "
+            "where fileid=? and num_guess=0 and answerkey not in "
+            "(select guessed from sessions where fileid=?)", (fileid, fileid))
+
+    def create_sessioninfo_index(self):
+        """
+        Index used by _recent to find the newest sessions.
+        """
+        self.conn.execute("create index if not exists sessioninfo_type_time "
+            "on sessioninfo (sessiontype, timestamp)")
+
+    def upgrade_to_version_5(self):
+        self.create_sessioninfo_index()
+
+    def upgrade_to_version_4(self):
+        """
+        Create the keysummary table and fill it from the sessions table.
+        """
+        self.create_keysummary()
+        self.conn.execute("delete from keysummary")
+        self.conn.execute("insert into keysummary "
+            "(fileid, answerkey, num_guess, num_correct) "
+            "select fileid, answerkey, coalesce(sum(count), 0), "
+            "coalesce(sum(case when answerkey=guessed then count else 0 end), 0) "
+            "from sessions where answerkey is not null "
+            "group by fileid, answerkey")
+        self.conn.execute("insert or ignore into keysummary "
+            "(fileid, answerkey) "
+            "select distinct fileid, guessed from sessions "
+            "where guessed is not null")
+
     def upgrade_to_version_3(self):
         try:
             if self.get_variable("database_version") >= 3:
@@ -358,6 +538,7 @@ class DB(object):
         """
         logging.debug("cache_new_test_result(%s, %s, %s, %s)",
             filename, timestamp, required, num_questions)
+        self.flush()
         fileid = self.get_fileid(filename)
         count_correct = self.conn.execute("select sum(count) from sessions where fileid=? and timestamp=? and answerkey=guessed", (fileid, timestamp)).fetchone()[0]
         if not count_correct:
@@ -449,6 +630,7 @@ class DB(object):
                         number of times we have practised,
                         number of times we have taken a test)
         """
+        self.write_pending()
         session_count = self.conn.execute('select count(fileid) '
             'from sessioninfo '
             'where sessiontype=0').fetchone()[0]
@@ -462,22 +644,19 @@ class DB(object):
 
     def _recent(self, count, sessiontype):
         """
+        Return the filenames of the count lesson files with the newest
+        sessions of type sessiontype, newest first.
         sessiontype 0 == normal statistics
         sessiontype 1 == test results
         """
-        filenames = []
-        for fileid, timestamp in self.conn.execute(
-                'select fileid, timestamp from sessioninfo '
-                'where sessiontype=? '
-                'order by -timestamp',
-                (sessiontype,)):
-            filename = self.conn.execute('select filename from lessonfiles where fileid=?', (fileid,)).fetchone()[0]
-            if filename not in filenames:
-                filenames.append(filename)
-
-            if len(filenames) == count:
-                break
-        return filenames
+        self.write_pending()
+        return [row[0] for row in self.conn.execute(
+            'select lessonfiles.filename from sessioninfo '
+            'join lessonfiles on lessonfiles.fileid=sessioninfo.fileid '
+            'where sessioninfo.sessiontype=? '
+            'group by sessioninfo.fileid '
+            'order by max(sessioninfo.timestamp) desc '
+            'limit ?', (sessiontype, count))]
 
     def recent(self, count):
         return self._recent(count, 0)
@@ -534,6 +713,164 @@ class DB(object):
             raise self.VariableUndefinedError()
 
 
+def find_profile_databases(app_data=None):
+    """
+    Return a list of tuples (profile, filename) of the statistics
+    databases of all the profiles. The standard profile has the
+    name u"".
+    """
+    if app_data is None:
+        app_data = filesystem.app_data()
+    retval = []
+    filename = os.path.join(app_data, "statistics.sqlite")
+    if os.path.isfile(filename):
+        retval.append((u"", filename))
+    profiles_dir = os.path.join(app_data, "profiles")
+    if os.path.isdir(profiles_dir):
+        for profile in sorted(os.listdir(profiles_dir)):
+            filename = os.path.join(profiles_dir, profile, "statistics.sqlite")
+            if os.path.isfile(filename):
+                if not isinstance(profile, unicode):
+                    profile = profile.decode(sys.getfilesystemencoding(), 'replace')
+                retval.append((profile, filename))
+    return retval
+
+
+def read_keysummary(conn):
+    """
+    Return a list of tuples (filename, answerkey, num_guess,
+    num_correct) for all the keys that have been asked, from the
+    statistics database conn. Nothing is written to the database, so
+    databases older than version 4, without the keysummary table, are
+    summed from the sessions table like DB.upgrade_to_version_4 does.
+    """
+    try:
+        db_ver = int(conn.execute("select value from variables "
+            "where variable_name='database_version'").fetchone()[0])
+    except (sqlite3.OperationalError, TypeError):
+        db_ver = 1
+    if db_ver >= 4:
+        return conn.execute("select lessonfiles.filename, "
+            "keysummary.answerkey, keysummary.num_guess, "
+            "keysummary.num_correct from keysummary "
+            "join lessonfiles on lessonfiles.fileid=keysummary.fileid "
+            "where keysummary.num_guess>0").fetchall()
+    return conn.execute("select lessonfiles.filename, sessions.answerkey, "
+        "sum(sessions.count), "
+        "sum(case when sessions.answerkey=sessions.guessed "
+        "then sessions.count else 0 end) from sessions "
+        "join lessonfiles on lessonfiles.fileid=sessions.fileid "
+        "where sessions.answerkey is not null "
+        "group by lessonfiles.filename, sessions.answerkey "
+        "having sum(sessions.count)>0").fetchall()
+
+
+def _profile_keysummary_worker(profile_filename):
+    """
+    Return a tuple (profile, rows, error) where rows is what
+    read_keysummary return for the database. Run in the worker
+    processes of aggregate_profiles, each opening one database.
+
+    We use a plain connection and not DB, since DB would upgrade
+    the database and write to it, and the profiles might be in use.
+    """
+    profile, filename = profile_filename
+    try:
+        conn = sqlite3.connect(filename)
+        try:
+            return profile, read_keysummary(conn), None
+        finally:
+            conn.close()
+    except sqlite3.Error, e:
+        return profile, [], "%s: %s" % (filename, e)
+
+
+def create_summary_tables(conn, results):
+    """
+    Create the tables of the summary database in the sqlite connection
+    conn, from a list of the tuples _profile_keysummary_worker return.
+
+    profile_keysummary has the rows from each of the profiles.
+    keysummary and lessonfile_summary sum them for each key and
+    lesson file, with the number of profiles that has practised them.
+    """
+    for table in ('profiles', 'profile_keysummary', 'keysummary',
+                  'lessonfile_summary'):
+        conn.execute("drop table if exists %s" % table)
+    conn.execute("create table profiles "
+        "(profile text primary key, error text)")
+    conn.execute("create table profile_keysummary "
+        "(profile text not null, filename text not null, "
+        "answerkey text not null, num_guess int not null, "
+        "num_correct int not null, "
+        "primary key (profile, filename, answerkey))")
+    for profile, rows, error in results:
+        conn.execute("insert into profiles (profile, error) values (?, ?)",
+                     (profile, error))
+        conn.executemany("insert into profile_keysummary "
+            "(profile, filename, answerkey, num_guess, num_correct) "
+            "values (?, ?, ?, ?, ?)", [(profile,) + tuple(row) for row in rows])
+    conn.execute("create table keysummary as select filename, answerkey, "
+        "count(profile) as num_profiles, sum(num_guess) as num_guess, "
+        "sum(num_correct) as num_correct, "
+        "1.0 * sum(num_correct) / sum(num_guess) as accuracy "
+        "from profile_keysummary group by filename, answerkey "
+        "order by filename, answerkey")
+    conn.execute("create table lessonfile_summary as select filename, "
+        "count(distinct profile) as num_profiles, "
+        "sum(num_guess) as num_guess, sum(num_correct) as num_correct, "
+        "1.0 * sum(num_correct) / sum(num_guess) as accuracy "
+        "from profile_keysummary group by filename order by filename")
+    conn.commit()
+
+
+def aggregate_profiles(outfile, app_data=None, processes=None):
+    """
+    Read the statistics of all the profiles and save the summary in
+    outfile. If outfile ends with .csv, the keysummary table is
+    written as CSV. Else outfile is a sqlite database with the tables
+    create_summary_tables create.
+
+    The databases are read by a pool of processes worker processes,
+    None means one per cpu. Return a tuple (number of profiles read,
+    list of error messages).
+    """
+    databases = find_profile_databases(app_data)
+    if databases:
+        if not processes:
+            processes = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(min(processes, len(databases)))
+        try:
+            results = list(pool.imap_unordered(_profile_keysummary_worker,
+                                               databases))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = []
+    results.sort()
+    errors = [error for profile, rows, error in results if error]
+    if outfile.lower().endswith(".csv"):
+        conn = sqlite3.connect(":memory:")
+        create_summary_tables(conn, results)
+        f = open(outfile, 'wb')
+        try:
+            writer = csv.writer(f)
+            writer.writerow(['filename', 'answerkey', 'num_profiles',
+                             'num_guess', 'num_correct', 'accuracy'])
+            for row in conn.execute("select filename, answerkey, "
+                    "num_profiles, num_guess, num_correct, accuracy "
+                    "from keysummary"):
+                writer.writerow([unicode(v).encode('utf-8') for v in row])
+        finally:
+            f.close()
+    else:
+        conn = sqlite3.connect(outfile)
+        create_summary_tables(conn, results)
+    conn.close()
+    return len(results) - len(errors), errors
+
+
 class AbstractStatistics(object):
 
     def __init__(self, teacher):
@@ -561,18 +898,13 @@ class AbstractStatistics(object):
             fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
         except DB.FileNotInDB:
             return []
+        solfege.db.write_pending()
         if all_keys:
-            c = set()
-            for colname in "answerkey", "guessed":
-                c1 = list(solfege.db.conn.execute("select distinct(%s) from sessions where fileid=?" % colname, (fileid,)))
-
-                if c1:
-                    [c.add(x[0]) for x in c1]
-            c = list(c)
+            c = solfege.db.conn.execute("select answerkey from keysummary where fileid=?", (fileid,))
 
         else:
-            c = solfege.db.conn.execute("select distinct(answerkey) from sessions where fileid=? and answerkey=guessed", (fileid,))
-            c = [x[0] for x in list(c)]
+            c = solfege.db.conn.execute("select answerkey from keysummary where fileid=? and num_correct>0", (fileid,))
+        c = [x[0] for x in c]
         v = [self.int_if_int(x) for x in c]
         v.sort()
         return [unicode(x) for x in v]
@@ -592,6 +924,7 @@ class AbstractStatistics(object):
             fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
         except DB.FileNotInDB:
             return {}
+        solfege.db.write_pending()
         if seconds == -1:
             q = solfege.db.conn.execute("select answerkey, guessed, sum(count) from sessions where fileid=? group by answerkey, guessed", (fileid,))
 
@@ -618,9 +951,7 @@ class AbstractStatistics(object):
         method instead of reset_session.
         """
         self.m_timestamp = 1
-        fileid = solfege.db.get_fileid(filename)
-        solfege.db.conn.execute("delete from sessions "
-                          "where fileid=? and timestamp=1", (fileid,))
+        solfege.db.delete_session(solfege.db.get_fileid(filename), 1)
 
     def enter_test_mode(self):
         self.m_test_mode = True
@@ -651,40 +982,10 @@ class AbstractStatistics(object):
 
         if isinstance(answer, tuple):
             answer = str(answer)
-        cursor = solfege.db.conn.cursor()
-        fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
-        # Let us check if the session has been added to "sessioninfo"
-        # We don't add the session to the "sessioninfo" table before we have
-        # an answer to store, to avoid empty sessions because users start
-        # an exercise and the descides it was the wrong exercise.
-
-        if not cursor.execute("select * from sessioninfo where fileid=? and timestamp=?", (fileid, self.m_timestamp)).fetchone():
-            cursor.execute("insert into sessioninfo"
-                    "(fileid, timestamp, sessiontype) "
-                    "values (?, ?, ?)",
-                    (fileid, self.m_timestamp, 1 if self.m_test_mode else 0))
-
-        row = cursor.execute(
-                "select count from sessions where fileid=? and timestamp=? "
-                "and answerkey=? and guessed=?",
-                (fileid, self.m_timestamp, unicode(question), unicode(answer))).fetchone()
-
-        if not row:
-            cursor.execute(
-                "insert into sessions "
-                "(fileid, timestamp, answerkey, guessed, count) "
-                "values(?, ?, ?, ?, ?)",
-                (fileid, self.m_timestamp,
-                 unicode(question), unicode(answer), 1))
-
-        else:
-            assert cursor.fetchone() is None
-            cursor.execute(
-                "update sessions set count=? where "
-                "fileid=? and timestamp=? and answerkey=? and guessed=?",
-                (row[0] + 1, fileid,
-                 self.m_timestamp, unicode(question), unicode(answer)))
-        solfege.db.conn.commit()
+        solfege.db.add_answer(
+            solfege.db.get_fileid(self.m_t.m_P.m_filename),
+            self.m_timestamp, 1 if self.m_test_mode else 0,
+            unicode(question), unicode(answer))
 
     def add_wrong(self, question, answer):
         self._add(question, answer)
@@ -703,6 +1004,7 @@ class AbstractStatistics(object):
         correct in this session.
         """
         fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
+        solfege.db.write_pending()
         num_correct = solfege.db.conn.execute("select sum(count) from sessions where answerkey=guessed and timestamp=? and fileid=?", (self.m_timestamp, fileid)).fetchone()[0]
         num_asked = solfege.db.conn.execute("select sum(count) from sessions where timestamp=? and  fileid=?", (self.m_timestamp, fileid)).fetchone()[0]
         if not num_correct:
@@ -713,6 +1015,66 @@ class AbstractStatistics(object):
             return 0
         return 100.0 * num_correct / num_asked
 
+    def get_snapshot(self, windows):
+        """
+        Return the number of answers and correct answers for all keys
+        and all the time windows in the list 'windows', using one query.
+        The windows are seconds, with the same special values as
+        get_num_correct_for_key.
+
+        Return a tuple (totals, counts). totals is a list with a
+        (num_guess, num_correct) tuple for each window. counts is a dict
+        where the keys are the keys from get_keys(True), and the values
+        are lists like totals.
+        """
+        try:
+            fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
+        except DB.FileNotInDB:
+            return [(0, 0)] * len(windows), {}
+        solfege.db.write_pending()
+        # The all-time counts are in keysummary. For the other windows
+        # we sum the rows in sessions, but only join the rows that are
+        # new enough to be in one of the windows.
+        columns = []
+        params = []
+        oldest = None
+        for seconds in windows:
+            if seconds == -1:
+                columns.append("max(k.num_guess), max(k.num_correct)")
+                continue
+            if seconds == 0:
+                cond = "s.timestamp=?"
+                start = self.m_timestamp
+                params.extend([self.m_timestamp] * 2)
+            else:
+                cond = "s.timestamp>?"
+                start = self.m_timestamp - seconds + 1
+                params.extend([self.m_timestamp - seconds] * 2)
+            columns.append("coalesce(sum(case when %(c)s then s.count end), 0), "
+                "coalesce(sum(case when %(c)s and s.guessed=s.answerkey "
+                "then s.count end), 0)" % {'c': cond})
+            if oldest is None or start < oldest:
+                oldest = start
+        if oldest is None:
+            # Only all-time windows. Don't join any sessions rows.
+            oldest = sys.maxint
+        q = solfege.db.conn.execute("select k.answerkey, %s "
+            "from keysummary k left join sessions s "
+            "on s.fileid=k.fileid and s.answerkey=k.answerkey "
+            "and s.timestamp>=? "
+            "where k.fileid=? group by k.answerkey" % ", ".join(columns),
+            params + [oldest, fileid])
+        totals = [[0, 0] for seconds in windows]
+        counts = {}
+        for row in q:
+            counts[row[0]] = v = []
+            for i in range(len(windows)):
+                num_guess, num_correct = row[i * 2 + 1], row[i * 2 + 2]
+                v.append((num_guess, num_correct))
+                totals[i][0] += num_guess
+                totals[i][1] += num_correct
+        return [tuple(x) for x in totals], counts
+
     def get_num_correct_for_key(self, seconds, key):
         """
         Return the number of correct answers for the given key 'key' the
@@ -722,8 +1084,10 @@ class AbstractStatistics(object):
              0  statistics from this session
         """
         fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
+        solfege.db.write_pending()
         if seconds == -1:
-            ret = solfege.db.conn.execute("select sum(count) from sessions where answerkey=? and guessed=? and fileid=?", (key, key, fileid)).fetchone()[0]
+            ret = solfege.db.conn.execute("select num_correct from keysummary where answerkey=? and fileid=?", (key, fileid)).fetchone()
+            ret = ret and ret[0]
 
         elif seconds == 0:
             ret = solfege.db.conn.execute("select sum(count) from sessions where answerkey=? and guessed=? and timestamp=? and fileid=?", (key, key, self.m_timestamp, fileid)).fetchone()[0]
@@ -740,8 +1104,10 @@ class AbstractStatistics(object):
         See get_num_correct_for_key docstring.
         """
         fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
+        solfege.db.write_pending()
         if seconds == -1:
-            ret = solfege.db.conn.execute("select sum(count) from sessions where answerkey=? and fileid=?", (key, fileid)).fetchone()[0]
+            ret = solfege.db.conn.execute("select num_guess from keysummary where answerkey=? and fileid=?", (key, fileid)).fetchone()
+            ret = ret and ret[0]
 
         elif seconds == 0:
             ret = solfege.db.conn.execute("select sum(count) from sessions where answerkey=? and timestamp=? and fileid=?", (key, self.m_timestamp, fileid)).fetchone()[0]
@@ -755,8 +1121,9 @@ class AbstractStatistics(object):
 
     def get_num_guess(self, seconds):
         fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
+        solfege.db.write_pending()
         if seconds == -1:
-            ret = solfege.db.conn.execute("select sum(count) from sessions where fileid=?", (fileid,)).fetchone()[0]
+            ret = solfege.db.conn.execute("select sum(num_guess) from keysummary where fileid=?", (fileid,)).fetchone()[0]
 
         elif seconds == 0:
             ret = solfege.db.conn.execute("select sum(count) from sessions where timestamp=? and fileid=?", (self.m_timestamp, fileid,)).fetchone()[0]
@@ -770,8 +1137,9 @@ class AbstractStatistics(object):
 
     def get_num_correct(self, seconds):
         fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
+        solfege.db.write_pending()
         if seconds == -1:
-            ret = solfege.db.conn.execute("select sum(count) from sessions where fileid=? and answerkey=guessed", (fileid,)).fetchone()[0]
+            ret = solfege.db.conn.execute("select sum(num_correct) from keysummary where fileid=?", (fileid,)).fetchone()[0]
 
         elif seconds == 0:
             ret = solfege.db.conn.execute("select sum(count) from sessions where timestamp=? and fileid=? and answerkey=guessed", (self.m_timestamp, fileid,)).fetchone()[0]
@@ -792,6 +1160,7 @@ class AbstractStatistics(object):
             fileid = solfege.db.get_fileid(self.m_t.m_P.m_filename)
         except DB.FileNotInDB:
             return
+        solfege.db.write_pending()
         for [timestamp] in solfege.db.conn.execute("select timestamp from sessioninfo where fileid=? and sessiontype=? order by -timestamp", (fileid, 1)):
             ret = {}
             for answerkey, guessed, count in solfege.db.conn.execute("select answerkey, guessed, count from sessions where fileid=? and timestamp=?", (fileid, timestamp)):
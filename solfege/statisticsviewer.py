@@ -177,33 +177,31 @@ class PercentagesTable(Gtk.Frame):
         for box in self.boxdict.values():
             for o in box.get_children():
                 o.destroy()
-        for sk, seconds in (('session', 0),
-                       ('today', 60*60*24),
-                       ('last7', 60*60*24*7),
-                       ('total', -1)):
-            num_guess = statistics.get_num_guess(seconds)
+        windows = (('session', 0),
+                   ('today', 60*60*24),
+                   ('last7', 60*60*24*7),
+                   ('total', -1))
+        totals, counts = statistics.get_snapshot([w[1] for w in windows])
+        for (sk, seconds), (num_guess, num_correct) in zip(windows, totals):
             if num_guess == 0:
                 self.m_totals[sk+'percent'].set_text("-")
 
             else:
                 self.m_totals[sk+'percent'].set_text(u"%.0f%%" %
-                   (statistics.get_num_correct(seconds) / num_guess * 100))
+                   (num_correct / num_guess * 100))
             self.m_totals[sk+'count'].set_text(unicode(num_guess))
         for k in statistics.get_keys(True):
             l = label_from_key(statistics, k)
             self.boxdict['keys'].pack_start(l, True, True, 0)
-            for sk, seconds in (('session', 0),
-                       ('today', 60*60*24),
-                       ('last7', 60*60*24*7),
-                       ('total', -1)):
-                num_guess = statistics.get_num_guess_for_key(seconds, k)
+            for (sk, seconds), (num_guess, num_correct) in zip(windows,
+                    counts.get(k, [(0, 0)] * len(windows))):
 
                 if num_guess == 0:
                     self.boxdict[sk+'percent'].pack_start(Gtk.Label("-"), True, True, 0)
 
                 else:
                     self.boxdict[sk+'percent'].pack_start(
-                        Gtk.Label("%.0f%%" % (statistics.get_num_correct_for_key(seconds, k) / num_guess * 100)), False, False, 0)
+                        Gtk.Label("%.0f%%" % (num_correct / num_guess * 100)), False, False, 0)
                 self.boxdict[sk+'count'].pack_start(Gtk.Label(unicode(num_guess)), True, True, 0)
         self.show_all()
 
@@ -0,0 +1,126 @@
+# GNU Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Timing and scoring of rhythms tapped by the user.
+
+The taps are timed by the timestamps of the key and button press events,
+so the time it takes for the main loop to run our handlers, or redraw
+the window, does not count.
+"""
+
+from __future__ import absolute_import
+
+import time
+
+class EventClock(object):
+    """
+    Convert the millisecond timestamps of GDK events to seconds.
+
+    The event timestamps are 32 bit integers that wrap around every 49.7
+    days. The offset from time.time() is estimated as the smallest
+    difference seen between when an event was handled and its timestamp,
+    that is from the event that was handled fastest.
+    """
+    WRAP = 2 ** 32
+    def __init__(self):
+        self.m_last = None
+        self.m_wrapped = 0
+        self.m_offset = None
+    def observe(self, event_time, now=None):
+        """
+        Return the event time in seconds on the event clock. now is the
+        time.time() the event is handled, and is used to update the
+        estimate of the offset.
+        """
+        if self.m_last is not None and event_time < self.m_last - self.WRAP / 2:
+            self.m_wrapped += self.WRAP
+        self.m_last = event_time
+        seconds = (event_time + self.m_wrapped) / 1000.0
+        if now is None:
+            now = time.time()
+        if self.m_offset is None or now - seconds < self.m_offset:
+            self.m_offset = now - seconds
+        return seconds
+    def to_time(self, seconds):
+        """
+        Return seconds on the event clock as time.time() seconds.
+        """
+        return seconds + self.m_offset
+
+
+class TapSession(object):
+    """
+    The taps of one attempt to tap a rhythm.
+
+    timedeltas is a list with the number of seconds there should be
+    between each tap, with the length of the last tone as the last
+    element, like rhythmtapping.Teacher.get_timedelta_list return.
+    """
+    def __init__(self, timedeltas, clock=None):
+        """
+        clock is the EventClock the timestamps passed to tap are from.
+        If it is None, they are time.time() seconds.
+        """
+        self.m_timedeltas = timedeltas
+        self.m_clock = clock
+        # The time of each tap from the first tap.
+        self.m_onsets = [0.0]
+        for d in timedeltas[:-1]:
+            self.m_onsets.append(self.m_onsets[-1] + d)
+        self.m_taps = []
+    def tap(self, timestamp):
+        self.m_taps.append(timestamp)
+    def is_complete(self):
+        """
+        Return True if the user has tapped as many times as the
+        rhythm requires.
+        """
+        return len(self.m_taps) >= len(self.m_timedeltas)
+    def get_score(self, free_tempo):
+        """
+        Return a list of floats telling us how close the users answer was.
+        Each float is the timedelta of the question divided by the
+        timedelta of the answer.
+
+        If free_tempo is True, the time between the first and the second
+        tap will set the tempo, and all the timedeltas will be compared
+        proportionally to this.
+        """
+        retval = []
+        answer = [b - a for a, b in zip(self.m_taps, self.m_taps[1:])]
+        if free_tempo:
+            question = [q / self.m_timedeltas[0] for q in self.m_timedeltas]
+            answer = [a / answer[0] for a in answer]
+            for idx in range(len(answer)):
+                retval.append(question[idx] / answer[idx])
+        else:
+            for idx, a in enumerate(answer):
+                retval.append(a / self.m_timedeltas[idx])
+        return retval
+    def get_onset_errors(self, start, latency=0.0):
+        """
+        Return a list of how many seconds each tap was after the tone
+        it should be tapped with. start is the time.time() the first tone
+        of the rhythm was sent to the synth, and latency the number of
+        seconds it takes from that until it can be heard.
+        """
+        if self.m_clock:
+            taps = [self.m_clock.to_time(t) for t in self.m_taps]
+        else:
+            taps = self.m_taps
+        return [t - (start + latency + onset)
+                for t, onset in zip(taps, self.m_onsets)]
@@ -27,6 +27,17 @@ var = 3
         self.assertEquals(l.get_line(2), "#comment3")
         self.assertEquals(l.get_line(3), "")
         self.assertEquals(l.get_line(4), "var = 3")
+        self.assertEquals(l.get_line(5), "")
+        self.assertEquals(l.get_line(6), "")
+    def test_get_lineno(self):
+        l = Lexer("a = 1\n\nb = 2\n", None)
+        self.assertEquals(l.m_line_starts, [0, 6, 7, 13])
+        self.assertEquals([l.get_lineno(i) for i in (0, 5, 6, 7, 12, 13)],
+                          [0, 0, 1, 2, 2, 3])
+        self.assertEquals(l.new_get_err_context(9, 11),
+                          u"(line 2): \n"
+                          u"(line 3): b = 2\n"
+                          u"            ^^")
     def test_scan(self):
         p = Dataparser()
         p._lexer = Lexer("\"string\" name 1.2 2 (", p)
@@ -43,6 +54,19 @@ var = 3
                               e.m_nonwrapped_text)
         else:
             self.fail("DataparserException not raised")
+    def test_tokens(self):
+        l = Lexer('a = "x" # "comment" 3\n'
+                  'b = """m\nl""" -1.5 f(2) #last', None)
+        self.assertEquals(l.m_types[:-4],
+            [NAME, '=', STRING, NAME, '=', STRING, FLOAT, NAME, '(',
+             INTEGER, ')'])
+        self.assertEquals(l.m_strings[:-4],
+            [u"a", u"=", u"x", u"b", u"=", u"m\nl", u"-1.5", u"f", u"(",
+             u"2", u")"])
+        self.assertEquals(l.m_tokens[2], (STRING, u"x", 4, 0))
+        self.assertEquals(l.m_tokens[5], (STRING, u"m\nl", 26, 1))
+        self.assertEquals(l.m_tokens[6], (FLOAT, u"-1.5", 36, 2))
+        self.assertEquals(l.m_tokens[-1], (EOF, None, 51, 2))
     def test_unable_to_tokenize(self):
         p = Dataparser()
         try:
@@ -5,6 +5,8 @@
 
 from __future__ import absolute_import
 from gi.repository import Gtk
+import shutil
+import tempfile
 import unittest
 import time
 
@@ -13,8 +15,10 @@ import solfege.lessonfile
 solfege.lessonfile._test_mode = True
 from solfege.lessonfile import *
 from solfege import dataparser
+from solfege import lfmod
 from solfege import mpd
 from solfege.mpd import mpdutils
+from solfege.mpd.rat import Rat
 from solfege import cfg
 from solfege import parsetree as pt
 
@@ -1155,6 +1159,207 @@ class TestLabelObject(unittest.TestCase):
             ):
             self.assertEquals(chordname_markup_tokenizer(s), v)
 
+class TestInfoCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = os.path.abspath(tempfile.mkdtemp(prefix="solfege-"))
+        self.cache_filename = os.path.join(self.tmpdir, u"infocache.pickle")
+        self.lessonfile = os.path.join(self.tmpdir, u"lf")
+        self.write_lessonfile(u"First")
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+    def write_lessonfile(self, title):
+        f = open(self.lessonfile, 'w')
+        f.write('header { module = idbyname title = "%s" }\n' % title)
+        f.close()
+    def test_save_and_load(self):
+        cache = InfoCache(self.cache_filename)
+        self.assertEquals(cache.get(self.lessonfile, 'title'), u"First")
+        cache.save()
+        cache = InfoCache(self.cache_filename)
+        self.assertEquals(cache._data[self.lessonfile]['title'], u"First")
+        self.assertEquals(cache.get(self.lessonfile, 'module'), u"idbyname")
+        self.failIf(cache.m_changed)
+    def test_reparse_changed_file(self):
+        cache = InfoCache(self.cache_filename)
+        cache.get(self.lessonfile, 'title')
+        cache.save()
+        self.write_lessonfile(u"Second title")
+        cache = InfoCache(self.cache_filename)
+        self.assertEquals(cache.get(self.lessonfile, 'title'), u"Second title")
+        self.assert_(cache.m_changed)
+    def test_not_lessonfile(self):
+        fn = os.path.join(self.tmpdir, u"notes.txt")
+        f = open(fn, 'w')
+        f.write("no header here\n")
+        f.close()
+        cache = InfoCache(self.cache_filename)
+        self.assertRaises(InfoCache.FileNotLessonfile, cache.get, fn, 'title')
+        cache.save()
+        cache = InfoCache(self.cache_filename)
+        self.assertRaises(InfoCache.FileNotLessonfile, cache.get, fn, 'title')
+        self.failIf(cache.m_changed)
+    def test_outdated_cache_discarded(self):
+        cache = InfoCache(self.cache_filename)
+        cache.get(self.lessonfile, 'title')
+        cache.save()
+        saved_format = InfoCache.CACHE_FORMAT
+        InfoCache.CACHE_FORMAT = -1
+        try:
+            cache = InfoCache(self.cache_filename)
+        finally:
+            InfoCache.CACHE_FORMAT = saved_format
+        self.assertEquals(cache._data, {})
+    def test_parallel_parse(self):
+        serial = InfoCache()
+        serial_files = sorted(serial.iter_parse_all_files())
+        parallel = InfoCache()
+        self.assertEquals(
+            sorted(parallel.iter_parse_all_files_parallel(2)), serial_files)
+        for filename in serial_files:
+            for field in ('title', 'module', 'test', 'mtime', 'size'):
+                self.assertEquals(parallel._data[filename][field],
+                                  serial._data[filename][field])
+        # Nothing has changed, so nothing should be parsed
+        parallel.m_changed = False
+        list(parallel.iter_parse_all_files_parallel(2))
+        self.failIf(parallel.m_changed)
+    def test_header_not_in_parsetreecache(self):
+        saved_cache = solfege.lessonfile.parsetreecache
+        trees = os.path.join(self.tmpdir, u"trees")
+        solfege.lessonfile.parsetreecache = ParseTreeCache([trees])
+        try:
+            cache = InfoCache(self.cache_filename)
+            self.assertEquals(cache.get(self.lessonfile, 'title'), u"First")
+        finally:
+            solfege.lessonfile.parsetreecache = saved_cache
+        self.failIf(os.path.exists(trees) and os.listdir(trees))
+
+class TestParseTreeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = os.path.abspath(tempfile.mkdtemp(prefix="solfege-"))
+        self.cache = ParseTreeCache([os.path.join(self.tmpdir, u"trees")])
+        self.location = os.path.join(self.tmpdir, u"lesson-files")
+        os.mkdir(self.location)
+        self.incfile = os.path.join(self.location, u"inc")
+        self.write(self.incfile, 's = "included"\n')
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+    def write(self, filename, s):
+        f = open(filename, 'w')
+        f.write(s)
+        f.close()
+    def get_mod(self, s):
+        tree = self.cache.get_tree(s, self.location, u"lf")
+        return tree, lfmod.parse_tree_interpreter(tree, lessonfile_builtins.copy())
+    def test_load_saved_tree(self):
+        s = 'include("inc")\nquestion { music = music("c d e") name = _("Name") }\n'
+        tree1, mod1 = self.get_mod(s)
+        self.assertEquals(len(os.listdir(self.cache.m_dirs[0])), 1)
+        tree2, mod2 = self.get_mod(s)
+        self.assert_(tree1 is not tree2)
+        self.assertEquals(tree2.m_filename, u"lf")
+        self.assertEquals(mod2.m_globals['s'], u"included")
+        self.assertEquals(mod2.m_blocklists['question'][0]['name'], u"Name")
+        self.assertEquals(mod2.m_blocklists['question'][0]['music'].m_musicdata,
+                          mod1.m_blocklists['question'][0]['music'].m_musicdata)
+    def test_changed_include(self):
+        s = 'include("inc")\n'
+        key = self.cache.get_key(s, self.location)
+        self.cache.get_tree(s, self.location, u"lf")
+        self.assert_(self.cache.load(key) is not None)
+        self.write(self.incfile, 's = "changed"\n')
+        st = os.stat(self.incfile)
+        os.utime(self.incfile, (st.st_atime, st.st_mtime + 10))
+        self.assert_(self.cache.load(key) is None)
+        tree, mod = self.get_mod(s)
+        self.assertEquals(mod.m_globals['s'], u"changed")
+    def test_touched_include(self):
+        # Installing the files change the mtime, but not the content.
+        s = 'include("inc")\n'
+        key = self.cache.get_key(s, self.location)
+        self.cache.get_tree(s, self.location, u"lf")
+        st = os.stat(self.incfile)
+        os.utime(self.incfile, (st.st_atime, st.st_mtime + 10))
+        self.assert_(self.cache.load(key) is not None)
+    def test_prune(self):
+        for x in range(5):
+            self.cache.get_tree('a = %i\n' % x, self.location, u"lf")
+        dirname = self.cache.m_dirs[0]
+        for x in range(5):
+            os.utime(os.path.join(dirname, self.cache.get_key('a = %i\n' % x,
+                self.location)), (1000 + x, 1000 + x))
+        # Loading a tree mark it as recently used.
+        self.assert_(self.cache.load(self.cache.get_key('a = 0\n', self.location)))
+        self.write(os.path.join(dirname, "x.123.tmp"), "")
+        os.utime(os.path.join(dirname, "x.123.tmp"), (1000, 1000))
+        self.cache.prune(2)
+        self.assertEquals(sorted(os.listdir(dirname)), sorted([
+            self.cache.get_key('a = %i\n' % x, self.location) for x in (0, 4)]))
+    def test_precompile(self):
+        os.mkdir(os.path.join(self.location, u"include"))
+        self.write(os.path.join(self.location, u"include", u"x"),
+                   'header { module = idbyname }\n')
+        self.write(os.path.join(self.location, u"lesson"),
+                   'header { module = idbyname title = "Lesson" }\n'
+                   'include("inc")\n')
+        self.assertEquals(self.cache.precompile(self.location), 1)
+        self.assertEquals(len(os.listdir(self.cache.m_dirs[0])), 1)
+    def test_error_context(self):
+        s = 'a = 1\nb = c\n'
+        self.cache.get_tree(s, self.location, u"lf")
+        tree = self.cache.get_tree(s, self.location, u"lf")
+        try:
+            lfmod.parse_tree_interpreter(tree, lessonfile_builtins.copy())
+        except pt.LookupException, e:
+            self.assertEquals(e.m_nonwrapped_text,
+                '(line 1): a = 1\n(line 2): b = c\n              ^')
+        else:
+            self.fail("LookupException not raised")
+
+class TestBarFiller(unittest.TestCase):
+    def test_ways(self):
+        f = BarFiller([Rat(1, 4), Rat(2, 4)], Rat(3, 4))
+        self.assertEquals(f.m_lengths, [1, 2])
+        # 1+1+1, 1+2 and 2+1
+        self.assertEquals(f.m_ways, [1, 1, 2, 3])
+        f = BarFiller([Rat(1, 8), Rat(3, 8)], Rat(2, 4))
+        self.assertEquals(f.m_lengths, [1, 3])
+        self.assertEquals(f.m_ways[-1], 3)
+    def test_not_fillable(self):
+        self.assertFalse(BarFiller([Rat(2, 4)], Rat(3, 4)).is_fillable())
+        self.assertTrue(BarFiller([Rat(2, 4), Rat(1, 4)], Rat(3, 4)).is_fillable())
+    def test_random_fill(self):
+        f = BarFiller([Rat(1, 4), Rat(2, 4), Rat(1, 1)], Rat(3, 4))
+        seen = set()
+        for x in range(200):
+            bar = f.random_fill()
+            self.assertEquals(sum([f.m_lengths[i] for i in bar]), 3)
+            seen.add(tuple(bar))
+        self.assertEquals(seen, set([(0, 0, 0), (0, 1), (1, 0)]))
+
+class TestRhythmDictation2Lessonfile(TmpFileBase):
+    parserclass = RhythmDictation2Lessonfile
+    def test_generate_random_question(self):
+        self.do_file('header { module = rhythmdictation2 }\n'
+                     'question { bars = 3/4, 2/4 elements = "8 8", "4" }')
+        self.p.generate_random_question()
+        voice = self.p.m_question_score.voice11
+        bars = self.p.m_question_score.m_bars
+        self.assertEquals(len(bars), 2)
+        for bar in bars:
+            total = Rat(0, 1)
+            for timepos in voice.get_timeposes_of(bar):
+                total += voice.m_tdict[timepos]['elem'][0].m_duration.get_rat_value()
+            self.assertEquals(total, bar.m_timesig.as_rat())
+    def test_not_fillable(self):
+        self.assertRaises(LessonfileParseException, self.do_file,
+            'header { module = rhythmdictation2 }\n'
+            'question { bars = 3/4 elements = "2", "4 4" }')
+    def test_bad_element(self):
+        self.assertRaises(LessonfileParseException, self.do_file,
+            'header { module = rhythmdictation2 }\n'
+            'question { bars = 3/4 elements = "4", "4 y" }')
+
 class TestOurLessonFiles(unittest.TestCase):
     def test_test_requirement(self):
         """
@@ -1196,4 +1401,8 @@ suite.addTest(unittest.makeSuite(TestLessonfileQuestion))
 suite.addTest(unittest.makeSuite(TestLessonfileMisc))
 suite.addTest(unittest.makeSuite(TestErrorHandling))
 suite.addTest(unittest.makeSuite(TestLabelObject))
+suite.addTest(unittest.makeSuite(TestInfoCache))
+suite.addTest(unittest.makeSuite(TestParseTreeCache))
+suite.addTest(unittest.makeSuite(TestBarFiller))
+suite.addTest(unittest.makeSuite(TestRhythmDictation2Lessonfile))
 suite.addTest(unittest.makeSuite(TestOurLessonFiles))
@@ -6,6 +6,8 @@
 from __future__ import absolute_import
 
 import os
+import shutil
+import tempfile
 import unittest
 
 from solfege import dataparser
@@ -82,5 +84,52 @@ class TestLfMod(TmpFileBase):
         mod = parse_tree_interpreter(self.p.tree)
         self.assertEquals(mod.m_globals['var'], 55)
 
+
+class TestLibraryCache(unittest.TestCase):
+    def setUp(self):
+        self.m_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.m_dir, "lesson-files"))
+        os.mkdir(os.path.join(self.m_dir, "lib"))
+        self.m_lib = os.path.join(self.m_dir, "lib", "elements")
+        self.write(self.m_lib, 'element I { label = "I" }\n')
+        self.m_lessonfile = os.path.join(self.m_dir, "lesson-files", "lf")
+        self.write(self.m_lessonfile, "rimport elements\n")
+    def tearDown(self):
+        shutil.rmtree(self.m_dir)
+    def write(self, filename, s):
+        f = open(filename, 'w')
+        f.write(s)
+        f.close()
+    def get_mod(self):
+        p = Dataparser()
+        p.parse_file(self.m_lessonfile)
+        return p.tree, parse_tree_interpreter(p.tree)
+    def test_shared_tree(self):
+        tree1, mod1 = self.get_mod()
+        tree2, mod2 = self.get_mod()
+        self.assert_(tree1[0].right is tree2[0].right)
+        self.assertEquals(mod2.m_globals['elements'].m_globals['I']['label'], "I")
+    def test_copy_on_use(self):
+        tree1, mod1 = self.get_mod()
+        lib1 = mod1.m_globals['elements']
+        lib1.m_globals['I']['label'] = "changed"
+        lib1.m_globals['new'] = 1
+        tree2, mod2 = self.get_mod()
+        lib2 = mod2.m_globals['elements']
+        self.assertEquals(lib2.m_globals['I']['label'], "I")
+        self.assertFalse('new' in lib2.m_globals)
+        # The named block and the block in the blocklist is still the
+        # same object in the copy.
+        self.assert_(lib2.m_globals['I'] is lib2.m_blocklists['element'][0])
+    def test_changed_file(self):
+        tree1, mod1 = self.get_mod()
+        self.write(self.m_lib, 'element I { label = "I7" }\n')
+        st = os.stat(self.m_lib)
+        os.utime(self.m_lib, (st.st_atime, st.st_mtime + 10))
+        tree2, mod2 = self.get_mod()
+        self.assert_(tree1[0].right is not tree2[0].right)
+        self.assertEquals(mod2.m_globals['elements'].m_globals['I']['label'], "I7")
+
 suite = unittest.makeSuite(TestLfMod)
+suite.addTest(unittest.makeSuite(TestLibraryCache))
 
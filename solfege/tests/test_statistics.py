@@ -4,7 +4,14 @@
 # License is GPL, see file COPYING
 
 from __future__ import absolute_import
+import csv
+import os
+import shutil
+import sqlite3
+import tempfile
 import unittest
+
+import solfege
 from solfege import statistics
 from solfege import application
 from solfege import lessonfile
@@ -34,6 +41,83 @@ class TestDB(unittest.TestCase):
         for seconds in (-1, 0, 10000):
             self.assertEquals(t.m_statistics.get_num_correct_for_key(seconds, 'minor'), 1)
             self.assertEquals(t.m_statistics.get_num_guess_for_key(seconds, 'minor'), 3)
+    def test_snapshot(self):
+        opt_parser = optionparser.SolfegeOptionParser()
+        options, args = opt_parser.parse_args()
+        a = application.SolfegeApp(options)
+        t = idbyname.Teacher('idbyname')
+        t.set_lessonfile(u'solfege:lesson-files/chord-min-major')
+        st = t.m_statistics
+        st.m_timestamp = 1000
+        st.add_wrong('minor', 'major')
+        st.add_correct('major')
+        st.m_timestamp = 2000
+        st.add_wrong('minor', 'major')
+        st.add_wrong('minor', 'minor')
+        st.add_correct('major')
+        windows = [0, 500, 1500, -1]
+        totals, counts = st.get_snapshot(windows)
+        self.assertEquals(sorted(counts.keys()), st.get_keys(True))
+        for i, seconds in enumerate(windows):
+            self.assertEquals(totals[i],
+                (st.get_num_guess(seconds), st.get_num_correct(seconds)))
+            for key in counts:
+                self.assertEquals(counts[key][i],
+                    (st.get_num_guess_for_key(seconds, key),
+                     st.get_num_correct_for_key(seconds, key)))
+        self.assertEquals(totals, [(3, 2), (3, 2), (5, 3), (5, 3)])
+        solfege.db.delete_statistics(u'solfege:lesson-files/chord-min-major')
+    def test_buffered_answers(self):
+        db = statistics.DB()
+        db.add_answer(1, 100, 0, u'minor', u'major')
+        db.add_answer(1, 100, 0, u'minor', u'major')
+        db.add_answer(1, 100, 0, u'minor', u'minor')
+        self.assertEquals(
+            db.conn.execute("select count(*) from sessions").fetchone()[0], 0)
+        db.flush()
+        self.assertEquals(db.conn.execute("select count from sessions "
+            "where answerkey='minor' and guessed='major'").fetchone()[0], 2)
+        db.add_answer(1, 100, 0, u'minor', u'major')
+        db.flush()
+        self.assertEquals(db.conn.execute("select count from sessions "
+            "where answerkey='minor' and guessed='major'").fetchone()[0], 3)
+        self.assertEquals(db.conn.execute("select count from sessions "
+            "where answerkey='minor' and guessed='minor'").fetchone()[0], 1)
+        self.assertEquals(db.conn.execute(
+            "select fileid, timestamp, sessiontype from sessioninfo").fetchall(),
+            [(1, 100, 0)])
+    def test_keysummary(self):
+        db = statistics.DB()
+        for timestamp, answerkey, guessed in ((100, u'1', u'1'),
+                (100, u'1', u'2'), (200, u'1', u'1'), (200, u'3', u'3'),
+                (200, u'3', u'4'), (1, u'5', u'5'), (1, u'1', u'1')):
+            db.add_answer(1, timestamp, 0, answerkey, guessed)
+        db.flush()
+        def summary():
+            return sorted(db.conn.execute("select answerkey, num_guess, "
+                "num_correct from keysummary where fileid=1").fetchall())
+        expect = [(u'1', 4, 3), (u'2', 0, 0), (u'3', 2, 1), (u'4', 0, 0),
+                  (u'5', 1, 1)]
+        self.assertEquals(summary(), expect)
+        # The upgrade creates the table from the sessions table.
+        db.conn.execute("drop table keysummary")
+        db.upgrade_to_version_4()
+        self.assertEquals(summary(), expect)
+        db.delete_session(1, 1)
+        self.assertEquals(summary(), [(u'1', 3, 2), (u'2', 0, 0),
+            (u'3', 2, 1), (u'4', 0, 0)])
+    def test_recent(self):
+        db = statistics.DB()
+        for fileid in 1, 2, 3:
+            db.conn.execute("insert into lessonfiles (fileid, filename, hash) "
+                "values (?, ?, '')", (fileid, u"/tmp/file%i" % fileid))
+        for fileid, timestamp, sessiontype in ((1, 100, 0), (2, 200, 0),
+                (1, 300, 0), (3, 400, 1), (3, 50, 0)):
+            db.add_answer(fileid, timestamp, sessiontype, u'a', u'a')
+        self.assertEquals(db.recent(2), [u"/tmp/file1", u"/tmp/file2"])
+        self.assertEquals(db.recent(5),
+            [u"/tmp/file1", u"/tmp/file2", u"/tmp/file3"])
+        self.assertEquals(db.recent_tests(5), [u"/tmp/file3"])
     def test_store_variables(self):
         db = statistics.DB()
         db.set_variable('database_version', 2)
@@ -60,5 +144,96 @@ class TestDB(unittest.TestCase):
         self.assertRaises(db.VariableUndefinedError,
             db.del_variable, 'does_not_exist')
 
+class TestAggregateProfiles(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for profile, answers in (
+                (None, ((1, u'a', u'a'), (1, u'b', u'a'))),
+                (u'anne', ((1, u'a', u'a'), (1, u'a', u'b'), (2, u'x', u'x'))),
+                (u'bob', ())):
+            db = statistics.DB()
+            for fileid in 1, 2:
+                db.conn.execute("insert into lessonfiles (fileid, filename, hash) "
+                    "values (?, ?, '')", (fileid, u"/tmp/file%i" % fileid))
+            for fileid, answerkey, guessed in answers:
+                db.add_answer(fileid, 100, 0, answerkey, guessed)
+            db.flush()
+            conn = sqlite3.connect(self.get_filename(profile))
+            conn.executescript("\n".join(db.conn.iterdump()))
+            conn.close()
+            db.close()
+        # A database from Solfege 3.16, before the keysummary table
+        # was added and before the elembuilder statistics were deleted.
+        conn = sqlite3.connect(self.get_filename(u'old'))
+        conn.executescript("""
+            create table lessonfiles (fileid integer primary key
+                autoincrement, hash text not null, test_result float
+                default None, test_passed int default None,
+                filename text unique not null);
+            create table sessions (fileid int, timestamp int,
+                answerkey text, guessed text, count int,
+                unique (fileid, timestamp, answerkey, guessed));
+            create table sessioninfo (fileid int, timestamp int,
+                sessiontype int, unique (fileid, timestamp));
+            create table variables (variable_name text primary key
+                not null, type int not null, value text not null);
+            insert into variables values ('database_version', 0, '2');
+            insert into lessonfiles (fileid, hash, filename)
+                values (1, '', '/tmp/file1');
+            insert into sessions values (1, 100, 'a', 'a', 2);
+            insert into sessions values (1, 100, 'a', 'b', 1);
+            insert into sessioninfo values (1, 100, 0);
+            """)
+        conn.close()
+        f = open(self.get_filename('broken'), 'w')
+        f.write("not a database" * 100)
+        f.close()
+    def get_filename(self, profile):
+        if not profile:
+            return os.path.join(self.tmpdir, 'statistics.sqlite')
+        os.makedirs(os.path.join(self.tmpdir, 'profiles', profile))
+        return os.path.join(self.tmpdir, 'profiles', profile,
+                            'statistics.sqlite')
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+    def test_find_profile_databases(self):
+        self.assertEquals([p for p, fn in
+            statistics.find_profile_databases(self.tmpdir)],
+            [u'', u'anne', u'bob', u'broken', u'old'])
+    def test_sqlite(self):
+        old = open(os.path.join(self.tmpdir, 'profiles', 'old',
+                                'statistics.sqlite'), 'rb').read()
+        outfile = os.path.join(self.tmpdir, "summary.sqlite")
+        count, errors = statistics.aggregate_profiles(outfile, self.tmpdir, 2)
+        self.assertEquals(count, 4)
+        self.assertEquals(len(errors), 1)
+        # The profile databases are only read, not upgraded.
+        self.assertEquals(open(os.path.join(self.tmpdir, 'profiles', 'old',
+                                            'statistics.sqlite'), 'rb').read(), old)
+        conn = sqlite3.connect(outfile)
+        self.assertEquals(conn.execute("select filename, answerkey, "
+            "num_profiles, num_guess, num_correct from keysummary").fetchall(),
+            [(u'/tmp/file1', u'a', 3, 6, 4), (u'/tmp/file1', u'b', 1, 1, 0),
+             (u'/tmp/file2', u'x', 1, 1, 1)])
+        self.assertEquals(conn.execute("select num_guess, num_correct "
+            "from profile_keysummary where profile='old'").fetchall(),
+            [(3, 2)])
+        self.assertEquals(conn.execute("select filename, num_profiles, "
+            "num_guess, num_correct, accuracy "
+            "from lessonfile_summary").fetchall(),
+            [(u'/tmp/file1', 3, 7, 4, 4.0 / 7), (u'/tmp/file2', 1, 1, 1, 1.0)])
+        self.assertEquals(conn.execute("select profile from profiles "
+            "where error is not null").fetchall(), [(u'broken',)])
+        conn.close()
+    def test_csv(self):
+        outfile = os.path.join(self.tmpdir, "summary.csv")
+        statistics.aggregate_profiles(outfile, self.tmpdir, 2)
+        rows = list(csv.reader(open(outfile, 'rb')))
+        self.assertEquals(rows[0], ['filename', 'answerkey', 'num_profiles',
+            'num_guess', 'num_correct', 'accuracy'])
+        self.assertEquals(rows[1][:5], ['/tmp/file1', 'a', '3', '6', '4'])
+        self.assertEquals(len(rows), 4)
+
 
 suite = unittest.makeSuite(TestDB)
+suite.addTest(unittest.makeSuite(TestAggregateProfiles))
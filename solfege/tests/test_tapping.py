@@ -0,0 +1,59 @@
+# Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+# License is GPL, see file COPYING
+
+from __future__ import absolute_import
+import unittest
+
+from solfege.tapping import EventClock, TapSession
+
+class TestEventClock(unittest.TestCase):
+    def test_observe(self):
+        c = EventClock()
+        self.assertEquals(c.observe(1000, now=100.5), 1.0)
+        self.assertEquals(c.to_time(1.0), 100.5)
+        # This event was handled faster, so it sets the offset.
+        self.assertEquals(c.observe(2000, now=101.2), 2.0)
+        self.assertAlmostEquals(c.to_time(2.0), 101.2)
+        # And this slower, so the offset is not changed.
+        c.observe(3000, now=102.9)
+        self.assertAlmostEquals(c.to_time(3.0), 102.2)
+    def test_wrap(self):
+        c = EventClock()
+        c.observe(2 ** 32 - 500, now=0.0)
+        self.assertEquals(c.observe(500, now=1.0), 2 ** 32 / 1000.0 + 0.5)
+        self.assertEquals(c.observe(1500, now=2.0), 2 ** 32 / 1000.0 + 1.5)
+
+class TestTapSession(unittest.TestCase):
+    def setUp(self):
+        self.s = TapSession([0.5, 0.5, 1.0, 0.5])
+        for t in 10.0, 10.5, 11.0, 12.0:
+            self.s.tap(t)
+    def test_is_complete(self):
+        s = TapSession([0.5, 0.5, 1.0])
+        self.assertFalse(s.is_complete())
+        s.tap(1.0)
+        s.tap(1.5)
+        self.assertFalse(s.is_complete())
+        s.tap(2.0)
+        self.assertTrue(s.is_complete())
+    def test_get_score(self):
+        self.assertEquals(self.s.get_score(False), [1.0, 1.0, 1.0])
+        s = TapSession([0.5, 0.5, 1.0, 0.5])
+        for t in 10.0, 11.0, 12.0, 14.0:
+            s.tap(t)
+        self.assertEquals(s.get_score(False), [2.0, 2.0, 2.0])
+        self.assertEquals(s.get_score(True), [1.0, 1.0, 1.0])
+    def test_get_onset_errors(self):
+        self.assertEquals(self.s.get_onset_errors(10.0), [0.0] * 4)
+        self.assertEquals(self.s.get_onset_errors(9.9, 0.1), [0.0] * 4)
+        self.assertEquals(self.s.get_onset_errors(10.5), [-0.5] * 4)
+    def test_clock(self):
+        c = EventClock()
+        s = TapSession([0.5, 0.5], c)
+        s.tap(c.observe(5000, now=100.0))
+        s.tap(c.observe(5500, now=100.6))
+        self.assertEquals(s.get_onset_errors(100.0), [0.0, 0.0])
+
+suite = unittest.makeSuite(TestEventClock)
+suite.addTest(unittest.makeSuite(TestTapSession))
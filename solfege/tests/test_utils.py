@@ -5,6 +5,7 @@
 from __future__ import absolute_import
 import unittest
 from solfege.utils import string_get_line_at
+from solfege import mpd
 from solfege import utils
 
 
@@ -56,8 +57,53 @@ class TestMisc(unittest.TestCase):
             n1 = v[0].get_notename()
             self.assertTrue(n in ("f'", "gis'", "ais'", "cis'", "dis'"), v[0])
             self.assertEquals(v[1], 4)
+    def test_freq_to_notename_cent(self):
+        self.assertEquals(utils.freq_to_notename_cent(440.0), ('a', 0.0))
+        self.assertEquals(utils.freq_to_notename_cent(880.0), ('a', 0.0))
+        self.assertEquals(utils.freq_to_notename_cent(110.0), ('a', 0.0))
+        n, c = utils.freq_to_notename_cent(261.6256)
+        self.assertEquals(n, 'c')
+        self.assertAlmostEquals(c, 0.0, 2)
+        n, c = utils.freq_to_notename_cent(440.0 * 2 ** (-0.3 / 12))
+        self.assertEquals(n, 'a')
+        self.assertAlmostEquals(c, -30.0, 4)
+
+class TestIntervalQuestionSpace(unittest.TestCase):
+    def test_count(self):
+        # c' to e': tonics c' cis' d' for a major second up, then
+        # back down a minor second or a major second.
+        space = utils.IntervalQuestionSpace("c'", "e'", [[2], [-1, -2]])
+        self.assertEquals(len(space), 6)
+        self.assertEquals(space.first_impossible_interval(), None)
+        seen = set()
+        for x in range(200):
+            tonic, question = space.random_question()
+            p = tonic.semitone_pitch()
+            self.assertTrue(60 <= p <= 62)
+            self.assertEquals(question[0], 2)
+            self.assertTrue(question[1] in (-1, -2))
+            seen.add((p, tuple(question)))
+        self.assertEquals(len(seen), 6)
+    def test_key(self):
+        space = utils.IntervalQuestionSpace("c'", "c''", [[1]],
+            (mpd.MusicalPitch.new_from_notename("c"), "major"))
+        # e'-f' and b'-c''
+        self.assertEquals(len(space), 2)
+        for x in range(20):
+            tonic, question = space.random_question()
+            self.assertTrue(tonic.get_octave_notename() in ("e'", "b'"))
+    def test_impossible(self):
+        space = utils.IntervalQuestionSpace("c'", "e'", [[2], [3]])
+        self.assertEquals(len(space), 0)
+        self.assertEquals(space.first_impossible_interval(), 1)
+        self.assertRaises(utils.NoPossibleIntervals, space.random_question)
+        space = utils.IntervalQuestionSpace("c'", "e'", [[5], [-1]])
+        self.assertEquals(space.first_impossible_interval(), 0)
+        space = utils.IntervalQuestionSpace("c'", "e'", [[1], []])
+        self.assertEquals(space.first_impossible_interval(), 1)
 
 
 suite = unittest.makeSuite(TestStringGetLineAt)
 suite.addTest(unittest.makeSuite(TestMisc))
+suite.addTest(unittest.makeSuite(TestIntervalQuestionSpace))
 
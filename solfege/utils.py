@@ -16,6 +16,7 @@
 
 from __future__ import absolute_import
 
+import bisect
 import math
 import random
 import re
@@ -52,31 +53,6 @@ class NoPossibleIntervals(Exception):
     pass
 
 
-def random_interval(tonika, lowest, highest, irange):
-    """
-    tonika   MusicalPitch
-    lowest   int with the MIDI integer value of the lowest tone
-    highest  int with the MIDI interger value of the higest tone
-    irange   list of integer values representing the intervals to choose from
-
-    Return an int representing the interval.
-    Return None if it is not possible to create an interval.
-    """
-    tonika = tonika.semitone_pitch()
-    lowest = mpd.notename_to_int(lowest)
-    highest = mpd.notename_to_int(highest)
-    assert lowest <= highest
-    assert isinstance(irange, list)
-    v = []
-    for i in irange:
-        if lowest <= tonika + i <= highest:
-            v.append(i)
-
-    if not v:
-        return None
-    return random.choice(v)
-
-
 def random_tonika_and_interval(lowest, highest, irange):
     """
     Return a tuple (tonika, interval) of types (MusicalPitch, int).
@@ -112,32 +88,6 @@ def random_tonika_and_interval(lowest, highest, irange):
     return tonika, interval
 
 
-def random_interval_in_key(first, lowest, highest, irange, tonic, keytype):
-    """
-    Return an int representing the interval.
-    Return None if it is not possible to create an interval.
-    Arguments:
-        first   The MusicalPitch of the first tone
-        lowest
-        highest integer representing the MIDI pitch of the tone
-        tonic   MusicalPitch, the key the tones should be taken from
-        keytype "major", "natural-minor" or "harmonic-minor"
-    """
-    assert isinstance(lowest, basestring)
-    assert isinstance(highest, basestring)
-    lowest = mpd.notename_to_int(lowest)
-    highest = mpd.notename_to_int(highest)
-    assert isinstance(first, mpd.MusicalPitch)
-    tones = pitches_in_key(tonic, keytype, lowest, highest)
-    intervals = []
-    for i in irange:
-        if (first + i).semitone_pitch() in tones:
-            intervals.append(i)
-
-    if intervals:
-        return random.choice(intervals)
-
-
 def random_tonic_and_interval_in_key(lowest, highest, irange, tonic, keytype):
     """
     Find a random interval that belongs to a key specified by the
@@ -215,6 +165,92 @@ def pitches_in_key(tonic, keytype, lowest, highest):
     return tones
 
 
+class IntervalQuestionSpace(object):
+    """
+    All the questions (tonic, [interval, ...]) where interval number x
+    is taken from interval_lists[x] and every tone is within lowest and
+    highest. If key is a tuple (tonic, keytype), every tone must also
+    belong to that key.
+
+    For each step of the question we count how many ways the rest of
+    the question can be made from every pitch. This lets
+    random_question pick a question uniformly among all the possible
+    questions without retrying, and tells in advance if the
+    configuration has no solution.
+    """
+    def __init__(self, lowest, highest, interval_lists, key=None):
+        if isinstance(lowest, basestring):
+            lowest = mpd.notename_to_int(lowest)
+        if isinstance(highest, basestring):
+            highest = mpd.notename_to_int(highest)
+        assert lowest <= highest
+        if key:
+            tones = pitches_in_key(key[0], key[1], lowest, highest)
+        else:
+            tones = set(range(lowest, highest + 1))
+        self.m_tones = tones
+        self.m_interval_lists = [list(v) for v in interval_lists]
+        # m_counts[x][p] is the number of ways to add interval x and the
+        # intervals after it when the last tone is p.
+        self.m_counts = [None] * len(self.m_interval_lists) + [dict.fromkeys(tones, 1)]
+        for x in range(len(self.m_interval_lists) - 1, -1, -1):
+            nxt = self.m_counts[x + 1]
+            counts = {}
+            for p in tones:
+                c = sum([nxt.get(p + i, 0) for i in self.m_interval_lists[x]])
+                if c:
+                    counts[p] = c
+            self.m_counts[x] = counts
+        self.m_tonics = sorted(self.m_counts[0])
+        self.m_cumulative = []
+        total = 0
+        for p in self.m_tonics:
+            total += self.m_counts[0][p]
+            self.m_cumulative.append(total)
+    def __len__(self):
+        """
+        Return the number of possible questions.
+        """
+        if self.m_cumulative:
+            return self.m_cumulative[-1]
+        return 0
+    def first_impossible_interval(self):
+        """
+        Return the index of the first interval that cannot be added to
+        any question. Return None if there are possible questions.
+        """
+        if len(self):
+            return None
+        reachable = self.m_tones
+        for x, interval_list in enumerate(self.m_interval_lists):
+            reachable = set([p + i for p in reachable for i in interval_list
+                             if p + i in self.m_tones])
+            if not reachable:
+                return x
+        return None
+    def random_question(self):
+        """
+        Return a tuple (MusicalPitch, list of ints).
+        Raise NoPossibleIntervals if there are no possible questions.
+        """
+        if not len(self):
+            raise NoPossibleIntervals(_("No random interval can be selected within the allowed range of tones."))
+        r = random.randrange(len(self))
+        p = self.m_tonics[bisect.bisect_right(self.m_cumulative, r)]
+        tonic = p
+        question = []
+        for x, interval_list in enumerate(self.m_interval_lists):
+            nxt = self.m_counts[x + 1]
+            r = random.randrange(self.m_counts[x][p])
+            for i in interval_list:
+                r -= nxt.get(p + i, 0)
+                if r < 0:
+                    break
+            question.append(i)
+            p += i
+        return mpd.MusicalPitch.new_from_int(tonic), question
+
+
 def un_escape_url_string(s):
     r = re.compile("(%([0-9A-F][0-9A-F]))")
     m = r.search(s)
@@ -251,7 +287,8 @@ def freq_to_notename_cent(freq):
 
     if cent > 50:
         return n[(i+1) % 12], cent-100
-    return n[int(v)], (v-int(v)) * 100
+    # i is 12 if freq is exactly an octave above e
+    return n[i % 12], cent
 
 def compare_version_strings(A, B):
     """
@@ -377,8 +414,7 @@ def play_music(music, tempo, patch, volume, start=None, end=None):
 
     else:
         bpm, nl = tempo
-    score = mpd.parser.parse_to_score_object(music)
-    tracklist = mpd.score_to_tracks(score, start, end)
+    tracklist = mpd.music_to_tracklist(music, start, end)
     tracklist[0].prepend_bpm(bpm, nl)
     [track.prepend_patch(patch) for track in tracklist]
     [track.prepend_volume(volume) for track in tracklist]
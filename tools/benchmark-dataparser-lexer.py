@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# GNU Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+# Licence is GPL, see file COPYING
+
+# Compare the speed of the single pass dataparser.Lexer with the char by
+# char tokenizer it replaced, by tokenizing all the lesson files in the
+# directories given on the command line, or
+# exercises/standard/lesson-files if no directories are given.
+#
+# Run from the top source dir: ./tools/benchmark-dataparser-lexer.py
+
+from __future__ import absolute_import
+import sys
+sys.path.insert(0, ".")
+
+import os
+import re
+import time
+
+from solfege import i18n
+i18n.setup(".")
+from solfege import dataparser
+
+OLD_re = re.compile("""(?:
+                        (\s+)|  #space
+                        (\#.*?$)| #comment
+                        (-?\d+\.\d+) | #float
+                        (-?\d+)| #integer
+                        (\"\"\"(.*?)\"\"\")| #multiline string
+                        ("(.*?)")| #string
+                        (\w[\[\]\w-]*) #name
+                )""",
+                      re.VERBOSE|re.MULTILINE|re.DOTALL|re.UNICODE)
+old_lastindex = {4: (dataparser.INTEGER, 4), 3: (dataparser.FLOAT, 3),
+                 5: (dataparser.STRING, 6), 7: (dataparser.STRING, 8),
+                 9: (dataparser.NAME, 9)}
+
+def old_tokenize(src):
+    """
+    The char by char tokenizer used by dataparser.Lexer until the
+    TOKEN_re tokenizer replaced it.
+    """
+    pos = 0
+    lineno = 0
+    tokens = []
+    while 1:
+        try:
+            if src[pos] in u"\u202f\xa0 \n\t{}=%+,/().":
+                if src[pos] in u'\u202f\xa0 \t':
+                    pos += 1
+                    continue
+                if src[pos] == '\n':
+                    pos += 1
+                    lineno += 1
+                    continue
+                tokens.append(('%s' % src[pos], src[pos], pos, lineno))
+                pos += 1
+                continue
+        except IndexError:
+            break
+        m = OLD_re.match(src, pos)
+        if m.lastindex != 2:
+            t, g = old_lastindex[m.lastindex]
+            tokens.append((t, m.group(g), pos, lineno))
+        pos = m.end()
+    return tokens
+
+def main():
+    dirs = sys.argv[1:] or [os.path.join("exercises", "standard", "lesson-files")]
+    sources = []
+    for d in dirs:
+        for fn in sorted(os.listdir(d)):
+            fn = os.path.join(d, fn)
+            if os.path.isfile(fn) and not fn.endswith("Makefile"):
+                sources.append((fn, open(fn, 'rU').read()))
+    print "%i files, %i bytes" % (len(sources), sum([len(s) for fn, s in sources]))
+    # Check that the tokenizers agree before measuring them.
+    lexers = []
+    for fn, s in sources:
+        try:
+            lexer = dataparser.Lexer(s, None)
+        except dataparser.DataparserException:
+            continue
+        lexers.append((fn, s, lexer))
+        new = zip(lexer.m_types, lexer.m_strings, lexer.m_idxs)[:-4]
+        old = [t[:3] for t in old_tokenize(lexer.m_src)]
+        if new != old:
+            print "Tokens differ:", fn
+    old_time = new_time = sys.maxint
+    # Use the best of 10 runs, to reduce the noise from other processes.
+    for x in range(10):
+        t0 = time.time()
+        for fn, s, lexer in lexers:
+            old_tokenize(lexer.m_src)
+        old_time = min(old_time, time.time() - t0)
+        t0 = time.time()
+        for fn, s, lexer in lexers:
+            dataparser.Lexer(s, None)
+        new_time = min(new_time, time.time() - t0)
+    print "char by char tokenizer: %.4f s" % old_time
+    print "dataparser.Lexer:       %.4f s (includes decoding)" % new_time
+    print "speedup:                %.1fx" % (old_time / new_time)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# GNU Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+# Licence is GPL, see file COPYING
+
+# Time how long it takes to engrave a rhythm staff again after each
+# note is entered, like the RhythmWidget does, both by creating a new
+# ScoreContext and by calling ScoreContext.update for the changed bars.
+#
+# Run from the top source dir: ./tools/benchmark-engraving.py [bars]
+
+from __future__ import absolute_import
+import sys
+sys.path.insert(0, ".")
+
+import time
+
+from solfege import i18n
+i18n.setup(".")
+from solfege.mpd import Duration, MusicalPitch
+from solfege.mpd import elems
+from solfege.mpd import engravers
+
+def create_score(bars):
+    score = elems.Score()
+    score.add_staff(staff_class=elems.RhythmStaff)
+    for x in range(bars):
+        score.add_bar(elems.TimeSignature(4, 4))
+    score.voice11.fill_with_skips()
+    return score
+
+def enter_notes(bars, incremental):
+    """
+    Fill the score with eighth notes, the way a user typing in a
+    rhythm dictation answer would. Return the time used per note.
+    """
+    score = create_score(bars)
+    sc = engravers.ScoreContext(score)
+    count = 0
+    cursor = 0
+    start = time.time()
+    while cursor < len(score.voice11.m_tdict):
+        timepos = score.voice11.m_tdict.sorted_keys()[cursor]
+        score.voice11.try_set_elem(elems.Note(
+            MusicalPitch.new_from_notename("c"), Duration(8, 0)),
+            timepos, False)
+        if incremental:
+            bar_idx = sc.get_bar_idx(timepos)
+            sc.update(max(bar_idx - 1, 0), bar_idx + 1)
+        else:
+            sc = engravers.ScoreContext(score)
+        cursor += 1
+        count += 1
+    return (time.time() - start) / count
+
+def main():
+    if len(sys.argv) > 1:
+        bars = [int(sys.argv[1])]
+    else:
+        bars = [4, 16, 64]
+    for b in bars:
+        print "%3i bars: new ScoreContext %.2fms  update %.2fms per note" % (
+            b, enter_notes(b, False) * 1000, enter_notes(b, True) * 1000)
+
+if __name__ == '__main__':
+    main()
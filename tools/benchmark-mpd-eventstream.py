@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# GNU Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+# Licence is GPL, see file COPYING
+
+# Time the program change placement done by MidiEventStream.__iter__
+# on polyphonic music with many instruments and frequent patch changes,
+# and check that it places the program changes like the list.insert
+# based code it replaced.
+#
+# Run from the top source dir: ./tools/benchmark-mpd-eventstream.py [notes]
+
+from __future__ import absolute_import
+import sys
+sys.path.insert(0, ".")
+
+import random
+import time
+
+from solfege import i18n
+i18n.setup(".")
+from solfege.mpd import track
+from solfege.mpd.rat import Rat
+
+def old_iter(events):
+    """
+    The program-change placement used by MidiEventStream.__iter__ until
+    it was rewritten to not insert into the event list.
+    """
+    ret = []
+    for e in events:
+        if e[0] == 'program-change' and ret:
+            i = len(ret)
+            while (isinstance(ret[i-1][1], Rat) or ret[i-1][1] != e[1]) and i > 1:
+                i -= 1
+            if i < len(ret):
+                while ret[i][0] == 'program-change' and i < len(ret) - 1 and ret[i][1] < e[1]:
+                    i += 1
+            ret.insert(i, e)
+        else:
+            ret.append(e)
+    return ret
+
+def create_tracks(notes):
+    """
+    Four voices playing sixteenth notes, and twelve voices playing one
+    note every whole note with a new instrument each time. The MIDI
+    channels of the slow voices are reused long after they were last
+    used, so the program changes are moved far back in the stream.
+    """
+    random.seed(1)
+    tracks = []
+    for x in range(4):
+        t = track.Track()
+        t.set_patch(x)
+        for y in range(notes):
+            t.note(16, random.randint(40, 80))
+        tracks.append(t)
+    for x in range(12):
+        t = track.Track()
+        for y in range(notes / 16):
+            t.set_patch(random.randint(10, 127))
+            t.note(1, random.randint(40, 80))
+        tracks.append(t)
+    return tracks
+
+def main():
+    if len(sys.argv) > 1:
+        notes = int(sys.argv[1])
+    else:
+        notes = 2000
+    stream = track.MidiEventStream(*create_tracks(notes))
+    start = time.time()
+    events = list(stream._MidiEventStream__mkevents())
+    mk_time = time.time() - start
+    start = time.time()
+    old = old_iter(events)
+    old_time = time.time() - start
+    start = time.time()
+    new = list(stream._place_program_changes(events))
+    new_time = time.time() - start
+    assert old == new
+    assert list(stream) == new
+    print "%i events, %i program changes" % (len(new),
+        len([e for e in new if e[0] == stream.SET_PATCH]))
+    print "__mkevents: %.3fs" % mk_time
+    print "list.insert placement: %.3fs  _place_program_changes: %.3fs" % (
+        old_time, new_time)
+
+if __name__ == '__main__':
+    main()
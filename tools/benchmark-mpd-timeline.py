@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# GNU Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+# Licence is GPL, see file COPYING
+
+# Compare the speed of the integer tick timeline mpd.track and
+# mpd.performer use if track.use_integer_ticks is True with the default
+# Rat arithmetic, by generating the MIDI events for a long dictation
+# like score and a long rhythm score with tuplets.
+#
+# Run from the top source dir: ./tools/benchmark-mpd-timeline.py [bars]
+
+from __future__ import absolute_import
+import sys
+sys.path.insert(0, ".")
+
+import time
+
+from solfege import i18n
+i18n.setup(".")
+from solfege import mpd
+from solfege.mpd import track
+
+DICTATION_BAR = r"c'8 d' e'4 \times 2/3 { f'8 g' a' } b'8. c''16 "
+DICTATION_BASS = r"c4. e8 \times 2/3 { g4 e c } "
+RHYTHM_BAR = r"c8 c16 c \times 2/3 { c8 c c } \times 4/5 { c16 c c c c } c4 "
+
+def scores(bars):
+    return [
+        ("dictation", r"\staff{ %s } \staff{ %s }" % (
+            DICTATION_BAR * bars, DICTATION_BASS * bars)),
+        ("rhythm", r"\rhythmstaff{ %s }" % (RHYTHM_BAR * bars)),
+    ]
+
+def run(score, use_integer_ticks, repeat=3):
+    """
+    Return the best time used to create the tracks of the score, the
+    MIDI events of the tracks and the tracks merged into one track.
+    """
+    track.use_integer_ticks = use_integer_ticks
+    best = None
+    for x in range(repeat):
+        start = time.time()
+        tracks = mpd.score_to_tracks(score)
+        events = list(track.MidiEventStream(*tracks))
+        for t in tracks[1:]:
+            tracks[0].merge_with(t)
+        merged = tracks[0].str_repr()
+        used = time.time() - start
+        if best is None or used < best:
+            best = used
+    return best, (events, merged)
+
+def main():
+    if len(sys.argv) > 1:
+        bars = int(sys.argv[1])
+    else:
+        bars = 200
+    for name, music in scores(bars):
+        score = mpd.parse_to_score_object(music)
+        rat_time, rat_result = run(score, False)
+        tick_time, tick_result = run(score, True)
+        assert rat_result == tick_result
+        print "%-10s %4i bars: Rat %.3fs  ticks %.3fs  (%.1fx)" % (
+            name, bars, rat_time, tick_time, rat_time / tick_time)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# GNU Solfege - free ear training software
+# Copyright (C) 2011 Tom Cato Amundsen
+# Licence is GPL, see file COPYING
+
+# Measure the throughput of soundcard.pitchdetect on 16 bit WAV files,
+# as seconds of audio analysed per second, for both the YIN and the
+# harmonic product spectrum method.
+#
+# Run from the top source dir: ./tools/benchmark-pitchdetect.py [file.wav...]
+#
+# Without arguments, a few sung-like tones with vibrato and noise are
+# written to a temporary directory and used as fixtures.
+
+from __future__ import absolute_import
+import sys
+sys.path.insert(0, ".")
+
+import os
+import shutil
+import tempfile
+import time
+import wave
+
+import numpy
+
+from solfege import i18n
+i18n.setup(".")
+from solfege.soundcard import pitchdetect
+
+FIXTURES = (110.0, 196.0, 261.63, 440.0, 659.26)
+
+def write_fixture(filename, freq, seconds=5.0, sample_rate=22050):
+    rnd = numpy.random.RandomState(int(freq))
+    t = numpy.arange(int(seconds * sample_rate)) / float(sample_rate)
+    # 5.5 Hz vibrato of +-20 cent
+    phase = 2 * numpy.pi * numpy.cumsum(
+        freq * 2 ** (0.2 / 12 * numpy.sin(2 * numpy.pi * 5.5 * t))) / sample_rate
+    x = numpy.zeros(len(t))
+    for h, a in ((1, .5), (2, .25), (3, .15), (4, .05)):
+        x += a * numpy.sin(h * phase)
+    x += rnd.normal(0, 0.02, len(t))
+    f = wave.open(filename, 'wb')
+    f.setnchannels(1)
+    f.setsampwidth(2)
+    f.setframerate(sample_rate)
+    f.writeframes((numpy.clip(x, -1, 1) * 32767).astype('<i2').tostring())
+    f.close()
+
+def run(filename, method):
+    sample_rate = pitchdetect.wav_sample_rate(filename)
+    d = pitchdetect.PitchDetector(sample_rate=sample_rate, method=method)
+    blocks = list(pitchdetect.wav_blocks(filename, 4096))
+    seconds = sum(len(b) for b in blocks) / float(sample_rate)
+    start = time.time()
+    freqs = [f for t, f in d.track(blocks) if f is not None]
+    used = time.time() - start
+    return seconds, used, freqs
+
+def main():
+    tmpdir = None
+    filenames = sys.argv[1:]
+    if not filenames:
+        tmpdir = tempfile.mkdtemp()
+        for freq in FIXTURES:
+            filenames.append(os.path.join(tmpdir, "%.2f.wav" % freq))
+            write_fixture(filenames[-1], freq)
+    try:
+        for method in ('yin', 'hps'):
+            total_seconds = total_used = 0
+            for filename in filenames:
+                seconds, used, freqs = run(filename, method)
+                total_seconds += seconds
+                total_used += used
+                if freqs:
+                    notename, cent = pitchdetect.freq_to_notename_cent(
+                        numpy.median(freqs))
+                    result = "%7.2f Hz %-3s %+3i cent" % (
+                        numpy.median(freqs), notename, cent)
+                else:
+                    result = "no pitch"
+                print "%-4s %-20s %s" % (method, os.path.basename(filename), result)
+            print "%-4s %.1fs audio in %.3fs, %ix realtime" % (method,
+                total_seconds, total_used, total_seconds / total_used)
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()